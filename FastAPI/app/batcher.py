@@ -0,0 +1,121 @@
+"""
+Micro-batching de requests concurrentes de /predict.
+
+Cada request (que corre en el threadpool de FastAPI) deja su registro en una
+cola y espera un Future. Un hilo de fondo junta los registros que llegan
+dentro de una ventana corta (MICROBATCH_MAX_WAIT_US) o hasta completar
+MICROBATCH_MAX_SIZE, los puntúa con una sola llamada vectorizada al modelo y
+reparte cada resultado a su request.
+
+Solo se usa para modelos sin scorer compilado (camino pandas): el scorer compilado
+puntúa un registro en ~1µs, menos que la espera de la ventana, así que /predict lo
+llama directo aunque MICROBATCH_ENABLED esté activo.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from prometheus_client import Histogram
+
+MICROBATCH_ENABLED     = os.getenv("MICROBATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+MICROBATCH_MAX_SIZE    = int(os.getenv("MICROBATCH_MAX_SIZE", "64"))
+MICROBATCH_MAX_WAIT_US = int(os.getenv("MICROBATCH_MAX_WAIT_US", "2000"))
+MICROBATCH_TIMEOUT     = float(os.getenv("MICROBATCH_TIMEOUT", "30"))
+
+BATCH_SIZE = Histogram(
+    "microbatch_size",
+    "Registros puntuados por cada llamada vectorizada del micro-batcher",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+QUEUE_DELAY = Histogram(
+    "microbatch_queue_delay_seconds",
+    "Tiempo que un request espera en cola antes de que se puntúe su lote (segundos)",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+
+class MicroBatcher:
+    """Agrupa registros individuales y los puntúa con `score_fn(handle, records)`."""
+
+    def __init__(self, score_fn, max_batch_size=MICROBATCH_MAX_SIZE,
+                 max_wait_us=MICROBATCH_MAX_WAIT_US, timeout=MICROBATCH_TIMEOUT):
+        self.score_fn = score_fn
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max_wait_us / 1e6
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, handle, record: dict):
+        """
+        Bloquea hasta que el lote del registro se puntúa; devuelve (prediction, error).
+        Lanza TimeoutError si no se puntúa en `timeout` segundos (el registro se descarta
+        si aún estaba en cola) y re-lanza cualquier excepción de score_fn.
+        """
+        future = Future()
+        self._queue.put((handle, record, future, time.perf_counter()))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"el micro-batcher no puntuó el registro en {self.timeout}s") from None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="predict-microbatcher", daemon=True)
+        self._thread.start()
+        print(f"[FastAPI] Micro-batching activo (max_size={self.max_batch_size}, "
+              f"max_wait={self.max_wait * 1e6:.0f}us)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        started = time.perf_counter()
+        for _, _, _, enqueued in batch:
+            QUEUE_DELAY.observe(started - enqueued)
+        # Los requests que ya se rindieron (timeout) no se puntúan
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+
+        # Si el modelo cambió a mitad de ventana, cada grupo se puntúa con su propio handle
+        groups = {}
+        for item in batch:
+            groups.setdefault(id(item[0]), []).append(item)
+
+        for items in groups.values():
+            handle = items[0][0]
+            BATCH_SIZE.observe(len(items))
+            try:
+                results = self.score_fn(handle, [rec for _, rec, _, _ in items])
+                for (_, _, future, _), result in zip(items, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
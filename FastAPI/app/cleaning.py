@@ -0,0 +1,121 @@
+"""
+Reglas de limpieza compartidas entre entrenamiento (DAG data_pipeline) y serving (FastAPI).
+
+Este archivo existe idéntico en dags/ y en FastAPI/app/; si se modifica, copiarlo en ambos.
+
+Reglas:
+  - street, city, state, status: str(valor).strip().lower(); faltante (None/NaN) → "none",
+    que es como quedan los faltantes en clean_data.
+  - zip_code: solo dígitos; faltante → "".
+
+clean_record limpia un dict (un request); clean_frame es la versión vectorizada para
+DataFrames (Arrow compute si pyarrow está disponible, pandas .str si no).
+"""
+import re
+import math
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+TEXT_COLUMNS = ("street", "city", "state", "status")
+ZIP_COLUMN = "zip_code"
+MISSING_TEXT = "none"
+MISSING_ZIP = ""
+
+# Solo ASCII para que Python (re) y Arrow (RE2) se comporten igual
+NON_DIGITS = r"[^0-9]+"
+_NON_DIGITS_RE = re.compile(NON_DIGITS)
+# Caracteres ASCII que str.strip() de Python considera espacio
+_ASCII_WHITESPACE = " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def clean_text(value):
+    return MISSING_TEXT if _is_missing(value) else str(value).strip().lower()
+
+
+def clean_zip(value):
+    return MISSING_ZIP if _is_missing(value) else _NON_DIGITS_RE.sub("", str(value))
+
+
+def clean_record(record: dict) -> dict:
+    """Limpia un registro (dict); las columnas ausentes no se agregan."""
+    cleaned = dict(record)
+    for c in TEXT_COLUMNS:
+        if c in cleaned:
+            cleaned[c] = clean_text(cleaned[c])
+    if ZIP_COLUMN in cleaned:
+        cleaned[ZIP_COLUMN] = clean_zip(cleaned[ZIP_COLUMN])
+    return cleaned
+
+
+def _as_arrow_strings(series: pd.Series):
+    """Arrow StringArray de la serie, o None si no es toda texto (se usa el camino pandas)."""
+    if pa is None:
+        return None
+    try:
+        arr = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        return None
+    if pa.types.is_null(arr.type):
+        return arr.cast(pa.string())
+    if not (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+        # Números u otros tipos: str() de Python y el cast de Arrow formatean distinto
+        return None
+    return arr
+
+
+def _apply_arrow(series, arr, arrow_fn, python_fn, missing):
+    """
+    Aplica arrow_fn a las filas ASCII y python_fn al resto (Unicode: lower/strip de
+    Python y de Arrow no coinciden en todos los casos), rellenando faltantes.
+    """
+    out = pd.Series(pc.fill_null(arrow_fn(arr), missing).to_numpy(zero_copy_only=False),
+                    index=series.index, dtype=object)
+    non_ascii = pc.invert(pc.fill_null(pc.string_is_ascii(arr), True)).to_numpy(zero_copy_only=False)
+    if non_ascii.any():
+        out[non_ascii] = series[non_ascii].map(python_fn)
+    return out
+
+
+def _clean_text_series(series: pd.Series) -> pd.Series:
+    arr = _as_arrow_strings(series)
+    if arr is not None:
+        return _apply_arrow(
+            series, arr, lambda a: pc.ascii_lower(pc.ascii_trim(a, _ASCII_WHITESPACE)), clean_text, MISSING_TEXT
+        )
+    mask = series.notna()
+    out = pd.Series(MISSING_TEXT, index=series.index, dtype=object)
+    out[mask] = series[mask].astype(str).str.strip().str.lower()
+    return out
+
+
+def _clean_zip_series(series: pd.Series) -> pd.Series:
+    arr = _as_arrow_strings(series)
+    if arr is not None:
+        return _apply_arrow(
+            series, arr, lambda a: pc.replace_substring_regex(a, NON_DIGITS, ""), clean_zip, MISSING_ZIP
+        )
+    mask = series.notna()
+    out = pd.Series(MISSING_ZIP, index=series.index, dtype=object)
+    out[mask] = series[mask].astype(str).str.replace(NON_DIGITS, "", regex=True)
+    return out
+
+
+def clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Versión vectorizada de clean_record; devuelve una copia."""
+    cleaned = df.copy()
+    for c in TEXT_COLUMNS:
+        if c in cleaned.columns:
+            cleaned[c] = _clean_text_series(cleaned[c])
+    if ZIP_COLUMN in cleaned.columns:
+        cleaned[ZIP_COLUMN] = _clean_zip_series(cleaned[ZIP_COLUMN])
+    return cleaned
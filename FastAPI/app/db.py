@@ -0,0 +1,118 @@
+"""
+Engines de base de datos compartidos por toda la API.
+
+Cada base (raw / clean) tiene un único engine SQLAlchemy con pool de conexiones,
+creado una sola vez al arrancar y reutilizado por todos los endpoints. Así cada
+request toma una conexión ya abierta en lugar de pagar el handshake TCP + auth.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+from prometheus_client import Gauge, Histogram
+
+# Configuración del pool (variables de entorno opcionales)
+DB_POOL_SIZE     = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW  = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT  = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE  = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Métricas del pool
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Tiempo de espera para obtener una conexión del pool (segundos)",
+    ["db"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+POOL_IN_USE = Gauge("db_pool_connections_in_use", "Conexiones del pool actualmente prestadas", ["db"])
+POOL_SATURATION = Gauge(
+    "db_pool_saturation_ratio",
+    "Conexiones prestadas / capacidad máxima del pool (pool_size + max_overflow)",
+    ["db"],
+)
+
+_engines = {}
+
+
+def init_engine(name: str, uri: str):
+    """Crea (una sola vez) el engine con pool para la base `name`."""
+    if name in _engines:
+        return _engines[name]
+    if not uri:
+        raise RuntimeError(f"No hay URI configurada para la base '{name}'")
+
+    engine = create_engine(
+        uri,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    capacity = max(DB_POOL_SIZE + DB_MAX_OVERFLOW, 1)
+    POOL_IN_USE.labels(db=name).set_function(lambda: engine.pool.checkedout())
+    POOL_SATURATION.labels(db=name).set_function(lambda: engine.pool.checkedout() / capacity)
+
+    _engines[name] = engine
+    print(f"[FastAPI] Pool de conexiones '{name}' creado "
+          f"(size={DB_POOL_SIZE}, overflow={DB_MAX_OVERFLOW}, pre_ping={DB_POOL_PRE_PING}, recycle={DB_POOL_RECYCLE}s)")
+    return engine
+
+
+def get_engine(name: str):
+    engine = _engines.get(name)
+    if engine is None:
+        raise RuntimeError(f"El pool de la base '{name}' no está inicializado")
+    return engine
+
+
+def _checkout(name: str):
+    """Toma una conexión del pool midiendo el tiempo de espera."""
+    engine = get_engine(name)
+    start = time.perf_counter()
+    conn = engine.connect()
+    POOL_CHECKOUT_WAIT.labels(db=name).observe(time.perf_counter() - start)
+    return conn
+
+
+@contextmanager
+def connect(name: str):
+    """Conexión de solo lectura; se devuelve al pool al salir."""
+    conn = _checkout(name)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def begin(name: str):
+    """Conexión con transacción (commit al salir, rollback si hay error)."""
+    conn = _checkout(name)
+    try:
+        with conn.begin():
+            yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def raw_connection(name: str):
+    """Conexión DBAPI (psycopg2) del pool, para cargas masivas con execute_values."""
+    engine = get_engine(name)
+    start = time.perf_counter()
+    conn = engine.raw_connection()
+    POOL_CHECKOUT_WAIT.labels(db=name).observe(time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def dispose_engines():
+    """Cierra todas las conexiones del pool (apagado de la app)."""
+    for name, engine in list(_engines.items()):
+        engine.dispose()
+        del _engines[name]
@@ -0,0 +1,251 @@
+"""
+Escritura asíncrona y por lotes de raw_data.inference_logs.
+
+Los endpoints solo encolan el registro en memoria (cola acotada); un hilo de
+fondo lo vuelca a Postgres con un INSERT multi-fila cuando se junta un lote
+de LOG_BATCH_SIZE registros o pasan LOG_FLUSH_INTERVAL segundos. Así el
+request de predicción ya no paga el round-trip a la base de datos.
+
+Política cuando la cola está llena (LOG_OVERFLOW_POLICY):
+  - "block":       espera hasta LOG_BLOCK_TIMEOUT segundos por espacio y si no, descarta.
+  - "drop_oldest": descarta el registro más antiguo de la cola para hacer espacio.
+  - "spill":       escribe el registro en un archivo JSONL en disco (LOG_SPILL_PATH)
+                   que el hilo de fondo re-inserta cuando la cola se desocupa. Las
+                   líneas ilegibles (p. ej. truncadas por un apagado) se apartan a
+                   LOG_SPILL_PATH.bad en lugar de re-insertarse.
+"""
+import os
+import json
+import time
+import queue
+import threading
+
+from psycopg2.extras import execute_values
+from prometheus_client import Counter, Gauge, Histogram
+
+from . import db
+
+LOG_QUEUE_MAX       = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_BATCH_SIZE      = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL  = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "drop_oldest")
+LOG_BLOCK_TIMEOUT   = float(os.getenv("LOG_BLOCK_TIMEOUT", "0.05"))
+LOG_SPILL_PATH      = os.getenv("LOG_SPILL_PATH", "/tmp/inference_logs_spill.jsonl")
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+LOG_COLUMNS = ["requested_at", "model_name", "model_version", "run_id", "input_data", "prediction"]
+
+# Métricas del sink
+LOG_QUEUE_DEPTH = Gauge("inference_log_queue_depth", "Registros de inferencia pendientes en la cola")
+LOG_FLUSH_LATENCY = Histogram(
+    "inference_log_flush_seconds",
+    "Latencia de cada volcado por lotes a raw_data.inference_logs (segundos)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOG_FLUSHED = Counter("inference_log_flushed_total", "Registros de inferencia escritos en la base")
+LOG_DROPPED = Counter("inference_log_dropped_total", "Registros de inferencia descartados", ["reason"])
+LOG_SPILLED = Counter("inference_log_spilled_total", "Registros de inferencia enviados al archivo de spill")
+
+
+def write_inference_logs(records):
+    """INSERT multi-fila de un lote de registros usando el pool 'raw'."""
+    insert_sql = f"""
+        INSERT INTO raw_data.inference_logs ({','.join(LOG_COLUMNS)})
+        VALUES %s
+    """
+    values = [tuple(r[c] for c in LOG_COLUMNS) for r in records]
+    with db.raw_connection("raw") as raw_conn:
+        cur = raw_conn.cursor()
+        try:
+            execute_values(cur, insert_sql, values, page_size=len(values))
+            raw_conn.commit()
+        except Exception:
+            raw_conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+
+def _parse_spill_line(line):
+    """Registro de una línea del spill, o None si está truncada o no tiene las columnas."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or any(c not in record for c in LOG_COLUMNS):
+        return None
+    return record
+
+
+class InferenceLogSink:
+    """Cola acotada + hilo de fondo que vuelca los logs de inferencia por lotes."""
+
+    def __init__(self, writer=write_inference_logs, max_queue=LOG_QUEUE_MAX,
+                 batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL,
+                 overflow_policy=LOG_OVERFLOW_POLICY, spill_path=LOG_SPILL_PATH,
+                 block_timeout=LOG_BLOCK_TIMEOUT):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"LOG_OVERFLOW_POLICY inválida: {overflow_policy} (opciones: {OVERFLOW_POLICIES})")
+        self.writer = writer
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        LOG_QUEUE_DEPTH.set_function(self._queue.qsize)
+
+    # ─── Lado del request ────────────────────────────────────────────────────
+    def put(self, record: dict):
+        """Encola un registro sin tocar la base de datos."""
+        if self.overflow_policy == "block":
+            try:
+                self._queue.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                LOG_DROPPED.labels(reason="queue_full").inc()
+            return
+
+        try:
+            self._queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow_policy == "spill":
+            self._spill([record])
+            return
+
+        # drop_oldest: sacamos el más antiguo y reintentamos una vez
+        try:
+            self._queue.get_nowait()
+            LOG_DROPPED.labels(reason="drop_oldest").inc()
+        except queue.Empty:
+            pass
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.labels(reason="queue_full").inc()
+
+    # ─── Ciclo de vida ───────────────────────────────────────────────────────
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="inference-log-sink", daemon=True)
+        self._thread.start()
+        print(f"[FastAPI] Sink de inference_logs iniciado (batch={self.batch_size}, "
+              f"interval={self.flush_interval}s, overflow={self.overflow_policy})")
+
+    def stop(self, timeout: float = 30.0):
+        """Detiene el hilo después de vaciar la cola (drenado limpio al apagar)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"[FastAPI] Advertencia: el sink no terminó de drenar; quedan {self._queue.qsize()} registros")
+        self._thread = None
+
+    # ─── Hilo de fondo ───────────────────────────────────────────────────────
+    def _run(self):
+        while True:
+            try:
+                batch = self._collect_batch()
+                if batch:
+                    self._flush(batch)
+                elif self._stop.is_set():
+                    break
+                if not self._stop.is_set() and self._queue.empty():
+                    self._replay_spill()
+            except Exception as e:
+                # Un error inesperado no puede matar el hilo: se registra y se sigue con el próximo lote
+                print(f"[FastAPI] ERROR en el sink de inference_logs: {type(e).__name__}: {e}")
+                self._stop.wait(self.flush_interval)
+
+    def _collect_batch(self):
+        """Junta registros hasta completar el lote o vencer el intervalo."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if self._stop.is_set():
+                # Apagando: tomamos lo que haya sin esperar
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        try:
+            self.writer(batch)
+            LOG_FLUSHED.inc(len(batch))
+        except Exception as e:
+            print(f"[FastAPI] ERROR al volcar {len(batch)} logs de inferencia: {e}")
+            if self.overflow_policy == "spill":
+                self._spill(batch)
+            else:
+                LOG_DROPPED.labels(reason="flush_error").inc(len(batch))
+        finally:
+            LOG_FLUSH_LATENCY.observe(time.perf_counter() - start)
+
+    def _spill(self, records):
+        try:
+            with self._spill_lock, open(self.spill_path, "a") as f:
+                for r in records:
+                    f.write(json.dumps(r, default=str) + "\n")
+            LOG_SPILLED.inc(len(records))
+        except Exception as e:
+            print(f"[FastAPI] ERROR escribiendo spill de inference_logs: {e}")
+            LOG_DROPPED.labels(reason="spill_error").inc(len(records))
+
+    def _replay_spill(self):
+        """Re-inserta lo acumulado en disco, por lotes, cuando la cola está libre."""
+        if self.overflow_policy != "spill":
+            return
+        replay_path = f"{self.spill_path}.replay"
+        with self._spill_lock:
+            # Un .replay previo (p.ej. el proceso murió a mitad) se procesa primero
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+
+        batch = []
+        bad = 0
+        with open(replay_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = _parse_spill_line(line)
+                if record is None:
+                    self._quarantine(line)
+                    bad += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+        if batch:
+            self._flush(batch)
+        os.remove(replay_path)
+        if bad:
+            LOG_DROPPED.labels(reason="spill_corrupt").inc(bad)
+            print(f"[FastAPI] Advertencia: {bad} líneas ilegibles del spill apartadas en {self.spill_path}.bad")
+
+    def _quarantine(self, line):
+        with open(f"{self.spill_path}.bad", "a") as f:
+            f.write(line + "\n")
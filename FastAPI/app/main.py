@@ -1,16 +1,21 @@
 import os
+import io
 import json
 import pandas as pd
+import pyarrow as pa
 import mlflow
 import uvicorn
 import requests
-from fastapi import FastAPI, HTTPException, Depends, Body
-from fastapi.responses import Response
-from sqlalchemy import create_engine, text
+from fastapi import FastAPI, HTTPException, Depends, Body, Request, Query
+from fastapi.responses import Response, StreamingResponse, JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text
 from mlflow.tracking import MlflowClient
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, NamedTuple, Optional
 import time
+import threading
+from datetime import datetime
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -19,7 +24,17 @@ from prometheus_client import (
     Summary, Gauge
 )
 
-from .models import PredictRequest, PredictResponse, ModelUpdatePayload, HistoryEntry, ShapResponse
+from .models import (
+    PredictRequest, PredictResponse, ModelUpdatePayload, HistoryEntry, ShapResponse,
+    ShapBatchRequest, ShapBatchResponse
+)
+from . import db
+from .log_sink import InferenceLogSink
+from .scoring import compile_pipeline, LinearShapExplainer
+from .batcher import MicroBatcher, MICROBATCH_ENABLED
+from .shap_cache import ShapArtifactCache
+from .model_cache import ModelArtifactCache
+from .cleaning import clean_record, clean_frame
 
 
 app = FastAPI(
@@ -31,6 +46,8 @@ app = FastAPI(
 PREDICTION_COUNTER = Counter("predict_requests_total", "Número de predicciones realizadas")
 PREDICTION_LATENCY = Summary("predict_latency_seconds", "Latencia del endpoint /predict (segundos)")
 UPTIME = Gauge("api_uptime", "API activa (1 si está corriendo)")
+BATCH_RECORDS = Counter("predict_batch_records_total", "Registros procesados por /predict/batch", ["outcome"])
+PREDICT_PATH = Counter("predict_scoring_path_total", "Predicciones de /predict por camino de scoring", ["path"])
 
 # Activamos la métrica de uptime en tiempo de carga
 UPTIME.set(1)
@@ -49,51 +66,145 @@ MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI")
 CLEAN_DB_URI = os.getenv("CLEAN_DB_CONN")        
 RAW_DB_URI   = os.getenv("RAW_DB_CONN")        
 MODEL_NAME   = "my_model"
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "1000"))  # registros por llamada al Pipeline en /predict/batch
+FAST_SCORING_ENABLED = os.getenv("FAST_SCORING_ENABLED", "true").lower() in ("1", "true", "yes")
 
 mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
 client = MlflowClient()
 
-# Globals para cachear modelo en memoria
-model_in_memory = None
-active_run_id    = None
-active_version   = None
-active_features = None  # lista de columnas esperadas por el modelo activo
-
-def load_production_model():
-    global model_in_memory, active_run_id, active_version, active_features
-    prod = client.get_latest_versions(MODEL_NAME, stages=["Production"])
-    if not prod:
-        raise RuntimeError("No se encontró modelo en Production")
-    info = prod[0]
-    run_id = info.run_id
-    version = int(info.version)
-    if model_in_memory is not None and run_id == active_run_id:
-        return
-
-    model_uri = f"runs:/{run_id}/model"
-    model_in_memory = mlflow.sklearn.load_model(model_uri)
-    active_run_id  = run_id
-    active_version = version
-
-    # Descargar features esperadas
+# Escritura de inference_logs fuera del request
+log_sink = InferenceLogSink()
+
+# Caché local de artifacts SHAP (disco + memoria)
+shap_cache = ShapArtifactCache()
+model_cache = ModelArtifactCache()
+SHAP_MAX_ROWS = int(os.getenv("SHAP_MAX_ROWS", "50000"))  # tope de filas por respuesta en sample/page
+
+# Micro-batching opcional de /predict (se crea al arrancar si MICROBATCH_ENABLED)
+micro_batcher: Optional[MicroBatcher] = None
+
+# Refresco del modelo en segundo plano (segundos entre consultas al registro; 0 lo desactiva)
+MODEL_REFRESH_TTL = float(os.getenv("MODEL_REFRESH_TTL", "300"))
+MODEL_LOAD_RETRY_SECONDS = float(os.getenv("MODEL_LOAD_RETRY_SECONDS", "15"))  # reintento mientras no hay modelo
+
+MODEL_STALENESS = Gauge(
+    "model_registry_staleness_seconds",
+    "Segundos desde la última verificación exitosa del modelo en Production contra MLflow"
+)
+MODEL_REFRESH_FAILURES = Counter("model_refresh_failures_total", "Fallos al consultar o cargar el modelo de Production")
+MODEL_ACTIVE_VERSION = Gauge("model_active_version", "Versión del modelo servida desde memoria")
+
+
+class ModelHandle(NamedTuple):
+    """Modelo activo y sus metadatos. Se reemplaza completo, nunca se modifica en sitio."""
+    model: Any
+    run_id: str
+    version: int
+    features: Optional[List[str]]  # columnas esperadas por el modelo (final_features.json)
+    scorer: Any = None             # CompiledLinearScorer o None (se usa el camino pandas)
+    explainer: Any = None          # LinearShapExplainer o None (modelo no lineal)
+
+
+# Modelo cacheado en memoria; los endpoints de inferencia solo leen esta referencia
+active_model: Optional[ModelHandle] = None
+_model_lock = threading.Lock()
+_last_registry_check: Optional[float] = None   # se fija solo tras una verificación exitosa
+_refresher_stop = threading.Event()
+
+# Sin ninguna verificación exitosa todavía la staleness es infinita (alerta desde el arranque)
+MODEL_STALENESS.set_function(
+    lambda: float("inf") if _last_registry_check is None else time.time() - _last_registry_check
+)
+
+
+def _load_final_features(model_dir: str):
     try:
-        features_path = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path="features/final_features.json")
+        features_path = os.path.join(model_dir, "features", "final_features.json")
         with open(features_path, "r") as f:
-            active_features = json.load(f)
-        print(f"[FastAPI] final_features.json cargadas: {active_features}")
+            features = json.load(f)
+        print(f"[FastAPI] final_features.json cargadas: {features}")
+        return features
     except Exception as e:
         print(f"[FastAPI] No se pudo cargar final_features.json para el modelo, error: {e}")
-        active_features = None
-
-def clean_input_features(raw_features: dict) -> dict:
-    cleaned = raw_features.copy()
-    for c in ["street", "city", "state", "status"]:
-        if c in cleaned and cleaned[c] is not None:
-            cleaned[c] = str(cleaned[c]).strip().lower()
-    if "zip_code" in cleaned and cleaned["zip_code"] is not None:
-        import re
-        cleaned["zip_code"] = re.sub(r"\D+", "", str(cleaned["zip_code"]))
-    return cleaned
+        return None
+
+
+def _load_shap_background(model_dir: str):
+    try:
+        path = os.path.join(model_dir, "shap", "background.json")
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[FastAPI] No se pudo cargar shap/background.json para el modelo, error: {e}")
+        return None
+
+
+def _build_explainer(model, model_dir: str):
+    try:
+        return LinearShapExplainer.from_pipeline(model, _load_shap_background(model_dir))
+    except Exception as e:
+        print(f"[FastAPI] Advertencia: SHAP no disponible para el modelo: {e}")
+        return None
+
+
+def refresh_production_model() -> ModelHandle:
+    """
+    Consulta el registro de MLflow y, si cambió el run en Production, carga el nuevo modelo
+    desde la caché local (model_cache; solo descarga de MinIO si el run no fue precargado).
+    Solo la llaman el hook /hooks/model_update y el refresco en segundo plano; si falla,
+    se sigue sirviendo el último modelo cargado.
+    """
+    global active_model, _last_registry_check
+    with _model_lock:
+        prod = client.get_latest_versions(MODEL_NAME, stages=["Production"])
+        if not prod:
+            raise RuntimeError("No se encontró modelo en Production")
+        info = prod[0]
+        run_id = info.run_id
+        version = int(info.version)
+
+        current = active_model
+        if current is None or current.run_id != run_id:
+            model_dir = model_cache.get(run_id)
+            model = mlflow.sklearn.load_model(os.path.join(model_dir, "model"))
+            features = _load_final_features(model_dir)
+            scorer = compile_pipeline(model, features) if FAST_SCORING_ENABLED else None
+            explainer = _build_explainer(model, model_dir)
+            # Swap atómico: los requests en curso terminan con el handle que ya leyeron
+            active_model = ModelHandle(model=model, run_id=run_id, version=version, features=features,
+                                       scorer=scorer, explainer=explainer)
+            MODEL_ACTIVE_VERSION.set(version)
+            print(f"[FastAPI] Modelo cargado en memoria: run_id={run_id}, version={version} ({model_dir})")
+            model_cache.prune(protect=(run_id,))
+
+        _last_registry_check = time.time()
+        return active_model
+
+
+def get_active_model() -> ModelHandle:
+    """Handle del modelo en memoria, sin I/O de red."""
+    handle = active_model
+    if handle is None:
+        print("[FastAPI] ERROR: Modelo no disponible en memoria")
+        raise HTTPException(status_code=500, detail="Modelo no disponible: no hay modelo de Production cargado")
+    return handle
+
+
+def _model_refresher():
+    # La primera carga también corre aquí: el proceso responde /health mientras el modelo
+    # se descarga y /ready indica cuándo puede recibir tráfico
+    while True:
+        try:
+            refresh_production_model()
+        except Exception as e:
+            MODEL_REFRESH_FAILURES.inc()
+            handle = active_model
+            serving = f"run_id={handle.run_id}" if handle else "ninguno"
+            print(f"[FastAPI] Advertencia: no se pudo refrescar el modelo (sirviendo {serving}): {e}")
+        # Sin modelo se reintenta pronto aunque el refresco periódico esté desactivado
+        wait = MODEL_REFRESH_TTL if active_model is not None else MODEL_LOAD_RETRY_SECONDS
+        if wait <= 0 or _refresher_stop.wait(wait):
+            return
 
 def clean_float(val):
     import math
@@ -106,13 +217,45 @@ def clean_float(val):
     return val
 
 
-# Al arrancar la app, cargamos el modelo
+def log_inference(handle: ModelHandle, features: dict, prediction: float):
+    """Encola el input crudo y la predicción para raw_data.inference_logs (se escribe en segundo plano)."""
+    log_sink.put({
+        "requested_at":  datetime.utcnow(),
+        "model_name":    MODEL_NAME,
+        "model_version": handle.version,
+        "run_id":        handle.run_id,
+        "input_data":    json.dumps(features),  # Guarda el input crudo
+        "prediction":    json.dumps({"prediction": prediction}),
+    })
+
+
+# Al arrancar la app, creamos los pools de conexiones y cargamos el modelo
 @app.on_event("startup")
 def startup_event():
-    try:
-        load_production_model()
-    except Exception as e:
-        print(f"[FastAPI] Advertencia: no se pudo cargar Production al iniciar: {e}")
+    for name, uri in (("raw", RAW_DB_URI), ("clean", CLEAN_DB_URI)):
+        try:
+            db.init_engine(name, uri)
+        except Exception as e:
+            print(f"[FastAPI] Advertencia: no se pudo crear el pool '{name}': {e}")
+    log_sink.start()
+    global micro_batcher
+    if MICROBATCH_ENABLED:
+        micro_batcher = MicroBatcher(score_batch)
+        micro_batcher.start()
+        if FAST_SCORING_ENABLED:
+            print("[FastAPI] Micro-batching solo aplica a modelos sin scorer compilado (camino pandas)")
+    # Carga inicial + refresco periódico en segundo plano (ver /ready)
+    _refresher_stop.clear()
+    threading.Thread(target=_model_refresher, name="model-refresher", daemon=True).start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    _refresher_stop.set()
+    if micro_batcher is not None:
+        micro_batcher.stop()
+    # Primero drenamos los logs pendientes, luego cerramos los pools
+    log_sink.stop()
+    db.dispose_engines()
 
 @app.post("/hooks/model_update", summary="Hook para recargar el modelo en producción")
 def hook_model_update(payload: ModelUpdatePayload):
@@ -127,78 +270,241 @@ def hook_model_update(payload: ModelUpdatePayload):
         raise HTTPException(status_code=400, detail="Nombre de modelo inesperado")
 
     try:
-        # Forzar recarga del modelo siempre (aunque sea la misma versión)
-        load_production_model()
-        print(f"[FastAPI] Modelo recargado en memoria: run_id={active_run_id}, version={active_version}")
-        return { "status": "reloaded", "run_id": active_run_id, "version": active_version }
+        # Consulta el registro y recarga si cambió el run en Production
+        handle = refresh_production_model()
+        print(f"[FastAPI] Modelo recargado en memoria: run_id={handle.run_id}, version={handle.version}")
+        return { "status": "reloaded", "run_id": handle.run_id, "version": handle.version }
     except Exception as e:
+        MODEL_REFRESH_FAILURES.inc()
         print(f"[FastAPI] ERROR al recargar modelo: {e}")
         raise HTTPException(status_code=500, detail=f"Error cargando modelo: {e}")
 
 
+@app.post("/hooks/model_prefetch", status_code=202, summary="Hook para precargar un modelo candidato")
+def hook_model_prefetch(payload: ModelUpdatePayload):
+    """
+    Endpoint que llama el DAG de modelado al registrar una versión nueva: descarga sus
+    artifacts a la caché local en segundo plano, sin cambiar el modelo que se sirve.
+    Payload: {"model_name": "...", "model_version": X, "run_id": "..."}
+    """
+    if payload.model_name != MODEL_NAME:
+        raise HTTPException(status_code=400, detail="Nombre de modelo inesperado")
+    handle = active_model
+    try:
+        started = model_cache.prefetch(payload.run_id, protect=(handle.run_id,) if handle else ())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"[FastAPI] /hooks/model_prefetch: run_id={payload.run_id}, version={payload.model_version}")
+    return {"status": "prefetching" if started else "in_progress", "run_id": payload.run_id}
+
+
 @app.post("/predict", response_model=PredictResponse, summary="Hacer inferencia con el modelo en Production")
 def predict(request: PredictRequest):
     PREDICTION_COUNTER.inc()
     start_time = time.time()
-    try:
-        load_production_model()
-    except Exception as e:
-        print(f"[FastAPI] ERROR: Modelo no disponible en memoria: {e}")
-        raise HTTPException(status_code=500, detail=f"Modelo no disponible: {e}")
+    handle = get_active_model()
 
     # Aplica el preprocesamiento mínimo igual al pipeline de limpieza
-    input_clean = clean_input_features(request.features)
-    input_df = pd.DataFrame([input_clean])
+    input_clean = clean_record(request.features)
+    prediction = predict_one(handle, input_clean)
+
+    response = PredictResponse(
+        prediction=prediction,
+        run_id=handle.run_id,
+        model_version=handle.version
+    )
+
+    # Guarda el input original
+    log_inference(handle, request.features, prediction)
+    latency = time.time() - start_time
+    PREDICTION_LATENCY.observe(latency)
+    return response
+
+def predict_one(handle: ModelHandle, input_clean: dict) -> float:
+    """
+    Predice un registro limpio: scoring compilado si está disponible; si no, el
+    micro-batcher (si está activo) o Pipeline.predict sobre un DataFrame de una fila.
+    El micro-batcher no se usa con el scorer compilado: es más rápido puntuar directo
+    que esperar la ventana del lote.
+    """
+    if handle.scorer is not None:
+        try:
+            prediction = handle.scorer.predict_one(input_clean)
+            PREDICT_PATH.labels(path="compiled").inc()
+            return prediction
+        except Exception:
+            pass  # el camino pandas reporta el error con el mensaje de sklearn
+    elif micro_batcher is not None:
+        try:
+            prediction, error = micro_batcher.submit(handle, input_clean)
+        except TimeoutError as e:
+            print(f"[FastAPI] ERROR en predict (micro-batch): {e}")
+            raise HTTPException(status_code=503, detail=f"Servicio saturado: {e}. Reintenta en unos segundos.")
+        except Exception as e:
+            print(f"[FastAPI] ERROR en predict (micro-batch): {e}")
+            raise HTTPException(status_code=500, detail=f"Error en predict (micro-batch): {e}")
+        if error is not None:
+            print(f"[FastAPI] ERROR en predict: {error}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"{error}. Revisa que los features coincidan con los usados en el modelo."
+            )
+        PREDICT_PATH.labels(path="microbatch").inc()
+        return prediction
 
-    if active_features:
-        input_df = input_df.reindex(columns=active_features, fill_value=None)
+    input_df = pd.DataFrame([input_clean])
+    if handle.features:
+        input_df = input_df.reindex(columns=handle.features, fill_value=None)
 
     try:
-        pred = model_in_memory.predict(input_df)
+        pred = handle.model.predict(input_df)
     except Exception as e:
         print(f"[FastAPI] ERROR en predict: {e}")
         raise HTTPException(
             status_code=400,
             detail=f"Error en predict: {e}. Revisa que los features coincidan con los usados en el modelo."
         )
+    PREDICT_PATH.labels(path="pandas").inc()
+    return float(pred[0])
 
-    response = PredictResponse(
-        prediction=float(pred[0]),
-        run_id=active_run_id,
-        model_version=active_version
-    )
 
-    # Guarda el input original
+def score_batch(handle: ModelHandle, records: list) -> list:
+    """
+    Predice un chunk de registros con una sola llamada al Pipeline.
+    Devuelve una lista de (prediction, error) alineada con `records`.
+    """
+    results = [(None, None)] * len(records)
+    valid_pos = []
+    for i, rec in enumerate(records):
+        if isinstance(rec, dict):
+            valid_pos.append(i)
+        else:
+            results[i] = (None, "El registro debe ser un objeto JSON con los features")
+    if not valid_pos:
+        return results
+
+    input_df = clean_frame(pd.DataFrame([records[i] for i in valid_pos]))
+    if handle.features:
+        input_df = input_df.reindex(columns=handle.features, fill_value=None)
+
     try:
-        engine = create_engine(RAW_DB_URI)
-        with engine.begin() as conn:
-            conn.execute(text(f"""
-                INSERT INTO raw_data.inference_logs (
-                    model_name, model_version, run_id, input_data, prediction
-                ) VALUES (
-                    :mname, :mver, :run, :input, :pred
-                )
-            """), {
-                "mname": MODEL_NAME,
-                "mver":  active_version,
-                "run":   active_run_id,
-                "input": json.dumps(request.features),  # Guarda el input crudo
-                "pred":  json.dumps({"prediction": float(pred[0])})
-            })
-    except Exception as e:
-        print(f"[FastAPI] ERROR al guardar el log de inferencia: {e}")
-    latency = time.time() - start_time
-    PREDICTION_LATENCY.observe(latency)
-    return response
+        preds = handle.model.predict(input_df)
+        for pos, p in zip(valid_pos, preds):
+            results[pos] = (float(p), None)
+    except Exception:
+        # Algún registro rompe el chunk: se aísla prediciendo fila por fila
+        for j, pos in enumerate(valid_pos):
+            try:
+                results[pos] = (float(handle.model.predict(input_df.iloc[[j]])[0]), None)
+            except Exception as e:
+                results[pos] = (None, f"Error en predict: {e}")
+    return results
+
+
+class _BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que no escucha desconexiones mientras responde, para que el
+    generador pueda seguir leyendo el body NDJSON del request a medida que escribe.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def _iter_ndjson_records(request: Request):
+    """Parsea un body NDJSON línea a línea sin cargarlo completo en memoria."""
+    buffer = b""
+    async for part in request.stream():
+        buffer += part
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def _unwrap_record(rec):
+    # Acepta {"features": {...}} (como /predict) o directamente el dict de features
+    if isinstance(rec, dict) and isinstance(rec.get("features"), dict):
+        return rec["features"]
+    return rec
+
+
+@app.post("/predict/batch", summary="Inferencia por lotes (JSON array o NDJSON), con respuesta NDJSON en streaming")
+async def predict_batch(request: Request):
+    """
+    - Body: JSON array de registros (o {"records": [...]}) o NDJSON (Content-Type: application/x-ndjson),
+      donde cada registro es {"features": {...}} o directamente el dict de features.
+    - Respuesta: NDJSON, una línea por registro: {"index": i, "prediction": x} o {"index": i, "error": "..."}.
+    - El modelo usado se informa en los headers X-Model-Run-Id y X-Model-Version.
+    """
+    handle = get_active_model()
+    content_type = request.headers.get("content-type", "")
+    streaming_body = "ndjson" in content_type or "jsonl" in content_type
+
+    if not streaming_body:
+        try:
+            payload = await request.json()
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Body JSON inválido: {e}")
+        if isinstance(payload, dict):
+            payload = payload.get("records")
+        if not isinstance(payload, list):
+            raise HTTPException(status_code=400, detail="Se esperaba un JSON array de registros o {\"records\": [...]}")
+
+    async def iter_records():
+        # (registro, error de parseo) en el orden de entrada
+        if streaming_body:
+            async for line in _iter_ndjson_records(request):
+                try:
+                    yield _unwrap_record(json.loads(line)), None
+                except Exception as e:
+                    yield None, f"Línea NDJSON inválida: {e}"
+        else:
+            for rec in payload:
+                yield _unwrap_record(rec), None
+
+    async def score_chunk(start_index, chunk):
+        records = [rec for rec, _ in chunk]
+        results = await run_in_threadpool(score_batch, handle, records)
+        lines = []
+        for offset, ((rec, parse_error), (pred, error)) in enumerate(zip(chunk, results)):
+            error = parse_error or error
+            if error is None:
+                BATCH_RECORDS.labels(outcome="ok").inc()
+                log_inference(handle, rec, pred)
+                lines.append(json.dumps({"index": start_index + offset, "prediction": pred}))
+            else:
+                BATCH_RECORDS.labels(outcome="error").inc()
+                lines.append(json.dumps({"index": start_index + offset, "error": error}))
+        return ("\n".join(lines) + "\n").encode()
+
+    async def generate():
+        chunk, start_index = [], 0
+        async for item in iter_records():
+            chunk.append(item)
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                yield await score_chunk(start_index, chunk)
+                start_index += len(chunk)
+                chunk = []
+        if chunk:
+            yield await score_chunk(start_index, chunk)
+
+    return _BodyStreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"X-Model-Run-Id": handle.run_id, "X-Model-Version": str(handle.version)},
+    )
 
 @app.get("/history", response_model=List[HistoryEntry], summary="Obtener historial de modelos entrenados")
-async def get_history():
+def get_history():
     """
     - Consulta toda la tabla clean_data.model_history y devuelve la lista 
       de registros (experiment_id, run_id, run_name, metrics, promoted, shap_uri, trained_at).
     """
-    engine = create_engine(CLEAN_DB_URI)
-    with engine.connect() as conn:
+    with db.connect("clean") as conn:
         result = conn.execute(text(
             "SELECT experiment_id, model_name, run_id, run_name, model_version, new_mse, new_rmse, new_mae, new_r2, prod_mse, prod_rmse, prod_mae, prod_r2, promoted, shap_uri, trained_at FROM clean_data.model_history ORDER BY trained_at DESC;"
         ))
@@ -227,70 +533,174 @@ async def get_history():
     return history_list
 
 
-@app.get("/shap/{run_id}", response_model=ShapResponse, summary="Descargar SHAP values para un run_id")
-def get_shap(run_id: str):
+def _frame_response(df: pd.DataFrame, fmt: str, etag: str, **json_fields):
+    """Serializa un DataFrame de SHAP como JSON (dict of lists), parquet o Arrow IPC."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if fmt == "parquet":
+        buf = io.BytesIO()
+        df.to_parquet(buf, index=False)
+        return Response(buf.getvalue(), media_type="application/vnd.apache.parquet", headers=headers)
+    if fmt == "arrow":
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type="application/vnd.apache.arrow.stream", headers=headers)
+    shap_dict = { col: df[col].tolist() for col in df.columns }
+    body = ShapResponse(shap_values=shap_dict, **json_fields)
+    return JSONResponse(content=body.dict(exclude_none=True), headers=headers)
+
+
+@app.get("/shap/{run_id}", summary="Descargar SHAP values para un run_id")
+def get_shap(
+    run_id: str,
+    request: Request,
+    mode: str = Query("full", regex="^(full|summary|sample|page)$"),
+    fmt: str = Query("json", alias="format", regex="^(json|parquet|arrow)$"),
+    n: int = Query(1000, ge=1, le=SHAP_MAX_ROWS, description="Filas a muestrear (mode=sample)"),
+    seed: int = Query(42, description="Semilla del muestreo (mode=sample)"),
+    offset: int = Query(0, ge=0, description="Primera fila de la página (mode=page)"),
+    limit: int = Query(1000, ge=1, le=SHAP_MAX_ROWS, description="Filas por página (mode=page)"),
+):
     """
     - Input: run_id correspondiente a un registro en MLflow.
-    - El artifact 'shap_values/shap_values.parquet' debe existir en MLflow (S3/MinIO).
-    - Descarga vía mlflow.artifacts.download_artifacts y lee el parquet.
-    - Devuelve un JSON con {run_id, shap_values: {feature1:[…], feature2:[…],…}}.
+    - El artifact 'shap_values/shap_sparse.npz' (o 'shap_values/shap_values.parquet' en runs
+      anteriores) debe existir en MLflow (S3/MinIO); se descarga una sola vez y queda en la
+      caché local (disco + memoria).
+    - mode=full: todas las filas (comportamiento original), mode=summary: media |SHAP|,
+      media y cuantiles por feature (precalculado por el DAG cuando el run lo publicó),
+      mode=sample: muestra aleatoria de `n` filas, mode=page: filas [offset, offset+limit).
+    - format=json (dict of lists), parquet o arrow (Arrow IPC stream). Responde ETag y 304
+      si el cliente envía If-None-Match con el mismo valor.
     """
-    # Construir path lógico para el artifact
+    if mode == "summary":
+        # Usa el resumen precalculado por el DAG si existe: no descarga el artifact completo
+        if fmt != "json":
+            raise HTTPException(status_code=400, detail="mode=summary solo está disponible en format=json")
+        try:
+            summary = shap_cache.get_summary(run_id)
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=f"No se encontró SHAP para {run_id}: {e}")
+        etag = f'"{shap_cache.summary_etag(run_id)}-summary"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return JSONResponse(content={"run_id": run_id, **summary}, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
     try:
-        # Descarga localmente (retorna path al directorio temporal donde se ubicó shap_values.parquet)
-        local_path = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path="shap_values/shap_values.parquet")
-        # Leer parquet
-        shap_df = pd.read_parquet(local_path)
+        file_hash = shap_cache.etag(run_id)
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"No se encontró SHAP para {run_id}: {e}")
 
-    # Convertir DataFrame a dict of lists
-    shap_dict = { col: shap_df[col].tolist() for col in shap_df.columns }
-    return ShapResponse(run_id=run_id, shap_values=shap_dict)
+    params = {"full": "", "sample": f"{n}-{seed}", "page": f"{offset}-{limit}"}[mode]
+    etag = f'"{file_hash}-{mode}-{fmt}-{params}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if mode == "full" and fmt == "parquet":
+        # Una sola llamada: otro request podría expulsar o re-descargar el archivo entre dos
+        path = shap_cache.get_path(run_id)
+        if path.endswith(".parquet"):
+            # Passthrough del archivo en caché, sin re-serializar (runs con artifact parquet)
+            return FileResponse(path, media_type="application/vnd.apache.parquet",
+                                headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+    shap_df = shap_cache.get_frame(run_id)
+    total_rows = len(shap_df)
+    if mode == "sample":
+        if total_rows > n:
+            shap_df = shap_df.sample(n=n, random_state=seed)
+        return _frame_response(shap_df, fmt, etag, run_id=run_id, mode=mode, total_rows=total_rows)
+    if mode == "page":
+        shap_df = shap_df.iloc[offset:offset + limit]
+        return _frame_response(shap_df, fmt, etag, run_id=run_id, mode=mode, total_rows=total_rows, offset=offset)
+    return _frame_response(shap_df, fmt, etag, run_id=run_id)
+
+def _require_explainer(handle: ModelHandle):
+    if handle.explainer is None:
+        raise HTTPException(status_code=500, detail="SHAP no disponible para el modelo activo (regresor no lineal)")
+    return handle.explainer
+
 
 @app.post("/predict_shap", summary="Inferencia y SHAP para una muestra")
 def predict_shap(request: PredictRequest = Body(...)):
-    try:
-        load_production_model()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Modelo no disponible: {e}")
+    handle = get_active_model()
+    explainer = _require_explainer(handle)
 
     # Preprocesa la entrada como en predict
-    input_clean = clean_input_features(request.features)
-    input_df = pd.DataFrame([input_clean])
-    if active_features:
-        input_df = input_df.reindex(columns=active_features, fill_value=None)
+    input_clean = clean_record(request.features)
+    prediction = predict_one(handle, input_clean)
 
-    # Predicción
+    # SHAP lineal precalculado: (x - E[x]) * coef sobre la fila transformada
     try:
-        pred = model_in_memory.predict(input_df)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error en predict: {e}")
-
-    # SHAP para la observación individual
-    try:
-        # Cargar preprocesador y modelo interno
-        preproc = model_in_memory.named_steps["preproc"]
-        reg = model_in_memory.named_steps["reg"]
-        input_trans = preproc.transform(input_df)
-        explainer = shap.LinearExplainer(reg, input_trans, feature_perturbation="interventional")
-        shap_values = explainer.shap_values(input_trans)
-        cols = preproc.get_feature_names_out()
-        # shap_values es shape (1, n_features)
-        shap_dict = {col: float(val) for col, val in zip(cols, shap_values[0])}
+        input_df = pd.DataFrame([input_clean])
+        if handle.features:
+            input_df = input_df.reindex(columns=handle.features, fill_value=None)
+        shap_row = explainer.explain(input_df)[0]
+        shap_dict = {col: float(val) for col, val in zip(explainer.feature_names, shap_row)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculando SHAP: {e}")
 
+    log_inference(handle, request.features, prediction)
+
     return {
-        "prediction": float(pred[0]),
+        "prediction": prediction,
         "shap_values": shap_dict,
-        "run_id": active_run_id,
-        "model_version": active_version
+        "expected_value": explainer.expected_value,
+        "run_id": handle.run_id,
+        "model_version": handle.version
     }
 
+@app.post("/predict_shap/batch", response_model=ShapBatchResponse, summary="Inferencia y SHAP para muchas muestras")
+def predict_shap_batch(request: ShapBatchRequest):
+    """
+    - Input: {"records": [ {features...}, ... ]}
+    - Devuelve, alineado con `feature_names`, una fila de SHAP por registro
+      (o `error` si el registro no se pudo puntuar).
+    """
+    handle = get_active_model()
+    explainer = _require_explainer(handle)
+
+    results = score_batch(handle, request.records)
+    ok = [i for i, (_, error) in enumerate(results) if error is None]
+    shap_rows = {}
+    if ok:
+        input_df = clean_frame(pd.DataFrame([request.records[i] for i in ok]))
+        if handle.features:
+            input_df = input_df.reindex(columns=handle.features, fill_value=None)
+        try:
+            shap_rows = dict(zip(ok, explainer.explain(input_df).tolist()))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error calculando SHAP: {e}")
+
+    items = []
+    for i, (pred, error) in enumerate(results):
+        if error is None:
+            log_inference(handle, request.records[i], pred)
+            items.append({"prediction": pred, "shap_values": shap_rows[i]})
+        else:
+            items.append({"error": error})
+
+    return ShapBatchResponse(
+        run_id=handle.run_id,
+        model_version=handle.version,
+        expected_value=explainer.expected_value,
+        feature_names=explainer.feature_names,
+        results=items,
+    )
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    """Liveness: el proceso responde, haya o no modelo cargado."""
+    return {"status": "ok", "model_loaded": active_model is not None}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness: 503 hasta que el modelo de Production está en memoria."""
+    handle = active_model
+    if handle is None:
+        return JSONResponse(status_code=503, content={"status": "loading", "model_loaded": False})
+    return {"status": "ready", "model_loaded": True, "run_id": handle.run_id, "version": handle.version}
 
 # Endpoint de métricas
 @app.get("/metrics")
@@ -0,0 +1,212 @@
+"""
+Caché local (direccionada por contenido) de los artifacts del modelo por run_id.
+
+- Cada entrada es un directorio MODEL_CACHE_DIR/<run_id>-<digest> con el modelo de MLflow
+  (model/), features/final_features.json, shap/background.json (si el run los tiene) y un
+  manifest.json con el sha256 de cada archivo. digest es el sha256 del manifest, así que
+  dos descargas del mismo run con contenido distinto nunca comparten directorio.
+- La descarga se hace en un directorio temporal del mismo volumen, se verifica contra los
+  tamaños que reporta MLflow y se publica con un rename atómico: otro proceso (u otro pod
+  con el mismo volumen) nunca ve una entrada a medias.
+- Antes de servir una entrada se recalculan los hashes contra el manifest (una vez por
+  proceso); si no coinciden la entrada se borra y se descarga de nuevo.
+- prefetch descarga en segundo plano el candidato que acaba de registrar el DAG de
+  modelado; cuando llega a Production la recarga es solo lectura de disco.
+- Se conservan las MODEL_CACHE_KEEP entradas usadas más recientemente (mtime), nunca la
+  del modelo activo.
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import time
+import tempfile
+import threading
+
+import mlflow
+from mlflow.tracking import MlflowClient
+from prometheus_client import Counter
+
+MODEL_CACHE_DIR  = os.getenv("MODEL_CACHE_DIR", "/tmp/model_cache")
+MODEL_CACHE_KEEP = int(os.getenv("MODEL_CACHE_KEEP", "3"))   # entradas conservadas en disco
+MODEL_ARTIFACT_PATH = "model"
+OPTIONAL_ARTIFACTS  = ("features/final_features.json", "shap/background.json")
+MANIFEST_NAME       = "manifest.json"
+STALE_TMP_SECONDS   = 3600    # descargas a medio camino más viejas que esto se consideran abandonadas
+
+_RUN_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+MODEL_CACHE_REQUESTS = Counter("model_cache_requests_total", "Accesos a la caché local de modelos", ["result"])
+
+
+class ModelIntegrityError(RuntimeError):
+    """Los archivos en disco no coinciden con su manifest o con lo que reporta MLflow."""
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _hash_files(root):
+    """{ruta relativa: sha256} de todos los archivos bajo root (sin el manifest)."""
+    hashes = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            if rel != MANIFEST_NAME:
+                hashes[rel] = _sha256(path)
+    return hashes
+
+
+def _digest(files):
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+
+class ModelArtifactCache:
+    """Artifacts del modelo en un volumen local, indexados por run_id + checksum."""
+
+    def __init__(self, cache_dir=MODEL_CACHE_DIR, keep=MODEL_CACHE_KEEP):
+        self.cache_dir = cache_dir
+        self.keep = keep
+        self._verified = set()      # entradas ya verificadas por este proceso
+        self._lock = threading.Lock()
+        self._run_locks = {}
+        self._prefetching = set()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _run_lock(self, run_id):
+        with self._lock:
+            return self._run_locks.setdefault(run_id, threading.Lock())
+
+    def _entries(self, run_id=None):
+        prefix = f"{run_id}-" if run_id else ""
+        return [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if name.startswith(prefix) and not name.startswith(".") and os.path.exists(os.path.join(self.cache_dir, name, MANIFEST_NAME))
+        ]
+
+    # ─── Descarga ────────────────────────────────────────────────────────────
+    def _remote_sizes(self, run_id, path):
+        """{ruta relativa: bytes} según el artifact store de MLflow."""
+        sizes = {}
+        for info in MlflowClient().list_artifacts(run_id, path):
+            if info.is_dir:
+                sizes.update(self._remote_sizes(run_id, info.path))
+            else:
+                sizes[info.path] = info.file_size
+        return sizes
+
+    def _download(self, run_id):
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            expected = self._remote_sizes(run_id, MODEL_ARTIFACT_PATH)
+            mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=MODEL_ARTIFACT_PATH, dst_path=tmp_dir)
+            for artifact_path in OPTIONAL_ARTIFACTS:
+                try:
+                    mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=artifact_path, dst_path=tmp_dir)
+                    size = self._remote_sizes(run_id, os.path.dirname(artifact_path)).get(artifact_path)
+                    expected[artifact_path] = size
+                except Exception as e:
+                    print(f"[FastAPI] {artifact_path} no disponible para run_id={run_id}: {e}")
+
+            files = _hash_files(tmp_dir)
+            for rel, size in expected.items():
+                path = os.path.join(tmp_dir, rel)
+                if rel not in files:
+                    raise ModelIntegrityError(f"{rel}: falta en la descarga")
+                if size is not None and os.path.getsize(path) != size:
+                    raise ModelIntegrityError(f"{rel}: {os.path.getsize(path)} bytes locales, {size} en MLflow")
+            if f"{MODEL_ARTIFACT_PATH}/MLmodel" not in files:
+                raise ModelIntegrityError(f"run_id={run_id} no tiene un modelo MLflow en '{MODEL_ARTIFACT_PATH}'")
+
+            digest = _digest(files)
+            with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+                json.dump({"run_id": run_id, "digest": digest, "files": files}, f)
+            entry = os.path.join(self.cache_dir, f"{run_id}-{digest[:12]}")
+            try:
+                os.rename(tmp_dir, entry)
+            except OSError:
+                if not os.path.exists(os.path.join(entry, MANIFEST_NAME)):
+                    raise
+                # Otro proceso publicó el mismo contenido primero
+            self._verified.add(entry)
+            return entry
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # ─── Verificación ────────────────────────────────────────────────────────
+    def _verify(self, entry):
+        if entry in self._verified:
+            return
+        with open(os.path.join(entry, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        files = _hash_files(entry)
+        if files != manifest["files"] or _digest(files) != manifest["digest"]:
+            raise ModelIntegrityError(f"{entry} no coincide con su manifest")
+        self._verified.add(entry)
+
+    def get(self, run_id: str) -> str:
+        """Directorio local verificado con los artifacts del run; descarga solo si no hay entrada válida."""
+        if not _RUN_ID_RE.match(run_id):
+            raise ValueError(f"run_id inválido: {run_id!r}")
+        with self._run_lock(run_id):
+            for entry in sorted(self._entries(run_id), key=os.path.getmtime, reverse=True):
+                try:
+                    self._verify(entry)
+                except Exception as e:
+                    MODEL_CACHE_REQUESTS.labels(result="corrupt").inc()
+                    print(f"[FastAPI] Advertencia: entrada de caché descartada ({e})")
+                    shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                MODEL_CACHE_REQUESTS.labels(result="hit").inc()
+                os.utime(entry)  # marca de uso para la poda
+                return entry
+
+            MODEL_CACHE_REQUESTS.labels(result="miss").inc()
+            return self._download(run_id)
+
+    def prefetch(self, run_id: str, protect=()):
+        """Descarga el run en un hilo aparte (una sola vez aunque llegue el hook repetido)."""
+        if not _RUN_ID_RE.match(run_id):
+            raise ValueError(f"run_id inválido: {run_id!r}")
+        with self._lock:
+            if run_id in self._prefetching:
+                return False
+            self._prefetching.add(run_id)
+
+        def run():
+            try:
+                entry = self.get(run_id)
+                self.prune(protect=(run_id, *protect))
+                print(f"[FastAPI] Modelo precargado en caché: {entry}")
+            except Exception as e:
+                print(f"[FastAPI] Advertencia: no se pudo precargar run_id={run_id}: {e}")
+            finally:
+                with self._lock:
+                    self._prefetching.discard(run_id)
+
+        threading.Thread(target=run, name=f"model-prefetch-{run_id}", daemon=True).start()
+        return True
+
+    def prune(self, protect=()):
+        """Borra las entradas menos usadas por encima de keep, sin tocar los runs en protect."""
+        entries = sorted(self._entries(), key=os.path.getmtime, reverse=True)
+        kept = 0
+        for entry in entries:
+            run_id = os.path.basename(entry).rsplit("-", 1)[0]
+            if run_id in protect or kept < self.keep:
+                kept += 1
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            self._verified.discard(entry)
+        # Restos de descargas interrumpidas (p. ej. el pod murió a mitad)
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".tmp-") and time.time() - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
@@ -34,4 +34,22 @@ class HistoryEntry(BaseModel):
 
 class ShapResponse(BaseModel):
     run_id: str
-    shap_values: Dict[str, List[Any]]  
\ No newline at end of file
+    shap_values: Dict[str, List[Any]]
+    mode: Optional[str] = None        # sample | page (ausente en la respuesta completa)
+    total_rows: Optional[int] = None  # filas totales del artifact (sample/page)
+    offset: Optional[int] = None      # primera fila devuelta (page)
+
+class ShapBatchRequest(BaseModel):
+    records: List[Dict[str, Any]]
+
+class ShapBatchItem(BaseModel):
+    prediction: Optional[float] = None
+    shap_values: Optional[List[float]] = None
+    error: Optional[str] = None
+
+class ShapBatchResponse(BaseModel):
+    run_id: str
+    model_version: int
+    expected_value: float
+    feature_names: List[str]
+    results: List[ShapBatchItem]
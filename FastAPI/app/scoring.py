@@ -0,0 +1,211 @@
+"""
+Scoring compilado para un solo registro, sin pandas.
+
+Al cargar el modelo se extraen del Pipeline (ColumnTransformer + GLM) las
+categorías del OneHotEncoder, la media/escala del StandardScaler y los
+coeficientes del regresor, y se pliegan en un único predictor lineal:
+
+    eta = intercept + sum(coef[categoria]) + sum(w_j * x_j)
+    prediction = link^-1(eta)
+
+Así /predict puntúa un dict con aritmética simple en lugar de construir un
+DataFrame. Si el Pipeline tiene una estructura no soportada, o el chequeo de
+paridad contra Pipeline.predict falla, no se compila y se usa el camino pandas.
+"""
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import GammaRegressor, LinearRegression, PoissonRegressor, Ridge, TweedieRegressor
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+PARITY_RTOL = 1e-9
+
+
+def _inverse_link(reg):
+    """link^-1 del regresor según su tipo y parámetros públicos; None si no está soportado."""
+    if isinstance(reg, (GammaRegressor, PoissonRegressor)):
+        return math.exp
+    if isinstance(reg, TweedieRegressor):
+        params = reg.get_params()
+        link = params["link"]
+        if link == "auto":
+            link = "log" if params["power"] > 0 else "identity"
+        return {"log": math.exp, "identity": float}.get(link)
+    if isinstance(reg, (LinearRegression, Ridge)):
+        return float
+    return None
+
+
+class CompiledLinearScorer:
+    """Predictor lineal plegado a partir de un Pipeline preproc + GLM ya entrenado."""
+
+    def __init__(self, intercept, cat_terms, num_terms, inverse_link):
+        self.intercept = intercept        # intercept + términos constantes del escalado
+        self.cat_terms = cat_terms        # [(columna, {categoria: coef})]
+        self.num_terms = num_terms        # [(columna, peso)] con la escala ya aplicada
+        self.inverse_link = inverse_link
+
+    @classmethod
+    def from_pipeline(cls, pipe):
+        """Compila el Pipeline o devuelve None si su estructura no está soportada."""
+        steps = getattr(pipe, "named_steps", {})
+        preproc, reg = steps.get("preproc"), steps.get("reg")
+        if not isinstance(preproc, ColumnTransformer) or not hasattr(reg, "coef_"):
+            return None
+
+        inverse_link = _inverse_link(reg)
+        if inverse_link is None:
+            return None
+
+        coef = np.asarray(reg.coef_, dtype=float)
+        if coef.ndim != 1:
+            return None   # regresión multi-salida
+        intercept = float(reg.intercept_)
+        cat_terms, num_terms = [], []
+
+        for name, trans, cols in preproc.transformers_:
+            if trans == "drop" or len(cols) == 0:
+                continue
+            if name == "remainder" or not all(isinstance(c, str) for c in cols):
+                return None
+            block = coef[preproc.output_indices_[name]]
+
+            if isinstance(trans, OneHotEncoder):
+                params = trans.get_params()
+                if trans.drop_idx_ is not None or trans.handle_unknown != "ignore" \
+                        or params.get("min_frequency") is not None or params.get("max_categories") is not None:
+                    return None
+                offset = 0
+                for col, cats in zip(cols, trans.categories_):
+                    cat_terms.append((col, {c: float(block[offset + k]) for k, c in enumerate(cats)}))
+                    offset += len(cats)
+            elif isinstance(trans, StandardScaler) or trans == "passthrough":
+                mean = getattr(trans, "mean_", None)
+                scale = getattr(trans, "scale_", None)
+                for j, col in enumerate(cols):
+                    w = float(block[j])
+                    if scale is not None:
+                        w /= float(scale[j])
+                    if mean is not None:
+                        intercept -= w * float(mean[j])
+                    num_terms.append((col, w))
+            else:
+                return None
+
+        return cls(intercept, cat_terms, num_terms, inverse_link)
+
+    def predict_one(self, record: dict) -> float:
+        """
+        Predice un registro ya limpio. Lanza ValueError si un valor numérico falta o
+        no es convertible, para que el llamador caiga al camino pandas (que reporta el error).
+        """
+        eta = self.intercept
+        for col, table in self.cat_terms:
+            value = record.get(col)
+            if value is None:
+                # Columna ausente: el OneHotEncoder del Pipeline la rechaza
+                raise ValueError(f"Falta '{col}'")
+            # Categoría desconocida = fila de ceros (handle_unknown="ignore")
+            eta += table.get(value, 0.0)
+        for col, w in self.num_terms:
+            x = float(record.get(col))
+            if not math.isfinite(x):
+                raise ValueError(f"Valor no finito en '{col}'")
+            eta += w * x
+        return self.inverse_link(eta)
+
+    def check_parity(self, pipe, features=None) -> bool:
+        """Compara contra Pipeline.predict en registros sintéticos que cubren todas las categorías."""
+        n = max([len(t) for _, t in self.cat_terms] + [1]) + 2
+        probes = []
+        for i in range(n):
+            rec = {}
+            for col, table in self.cat_terms:
+                cats = list(table)
+                # La última fila usa una categoría desconocida
+                rec[col] = cats[i % len(cats)] if i < n - 1 and cats else "__desconocida__"
+            for k, (col, _) in enumerate(self.num_terms):
+                rec[col] = float((i + 1) * (k + 2)) / 3.0
+            probes.append(rec)
+
+        df = pd.DataFrame(probes)
+        if features:
+            df = df.reindex(columns=features, fill_value=None)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # aviso de categoría desconocida del OneHotEncoder
+            expected = pipe.predict(df)
+        got = np.array([self.predict_one(r) for r in probes])
+        return bool(np.allclose(got, expected, rtol=PARITY_RTOL, atol=0.0))
+
+
+def compile_pipeline(pipe, features=None):
+    """Compila el Pipeline y valida paridad; devuelve None si no aplica."""
+    try:
+        scorer = CompiledLinearScorer.from_pipeline(pipe)
+        if scorer is None:
+            print("[FastAPI] Scoring compilado no disponible para este modelo; se usa el camino pandas")
+            return None
+        if not scorer.check_parity(pipe, features):
+            print("[FastAPI] Advertencia: el scoring compilado no coincide con Pipeline.predict; se usa el camino pandas")
+            return None
+        return scorer
+    except Exception as e:
+        print(f"[FastAPI] Advertencia: no se pudo compilar el modelo ({e}); se usa el camino pandas")
+        return None
+
+
+class LinearShapExplainer:
+    """
+    SHAP exacto para el GLM (en el espacio del link, como shap.LinearExplainer):
+
+        phi_ij = coef_j * (x_ij - E[x_j])
+
+    E[x] es la media de las features transformadas del set de entrenamiento, que el
+    DAG de modelado guarda junto al modelo (shap/background.json). Todo se calcula una
+    vez al cargar el modelo; por request solo queda un producto vectorizado.
+    """
+
+    def __init__(self, preproc, coef, intercept, background_mean, feature_names):
+        self.preproc = preproc
+        self.coef = coef
+        self.offset = coef * background_mean
+        self.expected_value = float(intercept + self.offset.sum())
+        self.feature_names = list(feature_names)
+
+    @classmethod
+    def from_pipeline(cls, pipe, background=None):
+        """Construye el explainer; devuelve None si el regresor no es lineal."""
+        steps = getattr(pipe, "named_steps", {})
+        preproc, reg = steps.get("preproc"), steps.get("reg")
+        if preproc is None or not hasattr(reg, "coef_"):
+            return None
+        coef = np.asarray(reg.coef_, dtype=float)
+        names = list(preproc.get_feature_names_out())
+
+        if background and list(background.get("feature_names", [])) == names:
+            mean = np.asarray(background["mean"], dtype=float)
+        else:
+            # Modelos sin background: el StandardScaler deja media 0 en train; para
+            # cada one-hot se asume frecuencia uniforme entre sus categorías.
+            print("[FastAPI] Advertencia: modelo sin shap/background.json válido; SHAP usa un background aproximado")
+            mean = np.zeros(len(names))
+            for name, trans, cols in preproc.transformers_:
+                if isinstance(trans, OneHotEncoder):
+                    idx = np.arange(len(names))[preproc.output_indices_[name]]
+                    offset = 0
+                    for cats in trans.categories_:
+                        mean[idx[offset:offset + len(cats)]] = 1.0 / len(cats)
+                        offset += len(cats)
+        return cls(preproc, coef, float(reg.intercept_), mean, names)
+
+    def shap_values(self, X_trans):
+        """Matriz (n_filas, n_features) de SHAP a partir de las features ya transformadas."""
+        if hasattr(X_trans, "multiply"):  # matriz sparse de scipy
+            return X_trans.multiply(self.coef).toarray() - self.offset
+        return np.asarray(X_trans, dtype=float) * self.coef - self.offset
+
+    def explain(self, df: pd.DataFrame):
+        return self.shap_values(self.preproc.transform(df))
@@ -0,0 +1,233 @@
+"""
+Caché local de los artifacts de SHAP por run_id.
+
+- Disco: el artifact descargado de MLflow/MinIO se guarda en SHAP_CACHE_DIR y se
+  expulsa por LRU (mtime) cuando el total supera SHAP_CACHE_MAX_BYTES. Todos los archivos
+  de un run (<run_id>.npz/.parquet, <run_id>.summary.json) cuentan y se borran juntos. Se prefiere
+  shap_values/shap_sparse.npz (float32 con bloques CSR, ver read_shap_sparse); los runs
+  anteriores solo tienen shap_values/shap_values.parquet.
+- Memoria: los DataFrames leídos se mantienen en un LRU acotado por
+  SHAP_MEMORY_MAX_BYTES, junto con los resúmenes ya calculados.
+- Resumen: si el DAG de modelado publicó shap_values/shap_summary.json se sirve ese
+  (sin descargar ni leer el artifact completo); si no, se calcula desde el parquet.
+
+Los artifacts de un run no cambian, así que el ETag de cada respuesta se deriva
+del hash del archivo más los parámetros de la consulta.
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import mlflow
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from prometheus_client import Counter
+
+SHAP_CACHE_DIR        = os.getenv("SHAP_CACHE_DIR", "/tmp/shap_cache")
+SHAP_CACHE_MAX_BYTES  = int(os.getenv("SHAP_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+SHAP_MEMORY_MAX_BYTES = int(os.getenv("SHAP_MEMORY_MAX_BYTES", str(256 * 1024 * 1024)))
+SHAP_ARTIFACT_PATH    = "shap_values/shap_values.parquet"
+SHAP_SPARSE_PATH      = "shap_values/shap_sparse.npz"
+SHAP_SUMMARY_PATH     = "shap_values/shap_summary.json"
+SUMMARY_QUANTILES     = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+_RUN_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+SHAP_CACHE_REQUESTS = Counter("shap_cache_requests_total", "Accesos a la caché de SHAP", ["layer", "result"])
+
+
+class ShapArtifactCache:
+    """LRU en disco + memoria de los artifacts de SHAP, indexado por run_id."""
+
+    def __init__(self, cache_dir=SHAP_CACHE_DIR, max_disk_bytes=SHAP_CACHE_MAX_BYTES,
+                 max_memory_bytes=SHAP_MEMORY_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._frames = OrderedDict()    # run_id -> (DataFrame, bytes)
+        self._summaries = {}            # run_id -> dict
+        self._etags = {}                # run_id -> hash del archivo
+        self._lock = threading.Lock()
+        self._run_locks = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ─── Disco ───────────────────────────────────────────────────────────────
+    def _file_path(self, run_id, ext=".parquet"):
+        if not _RUN_ID_RE.match(run_id):
+            raise ValueError(f"run_id inválido: {run_id!r}")
+        return os.path.join(self.cache_dir, f"{run_id}{ext}")
+
+    def _run_lock(self, run_id):
+        with self._lock:
+            return self._run_locks.setdefault(run_id, threading.Lock())
+
+    def _download(self, run_id, artifact_path, path):
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            downloaded = mlflow.artifacts.download_artifacts(
+                run_id=run_id, artifact_path=artifact_path, dst_path=tmp_dir
+            )
+            os.replace(downloaded, path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def get_path(self, run_id: str) -> str:
+        """
+        Ruta local del artifact (.npz sparse o, en runs anteriores, .parquet),
+        descargándolo de MLflow solo la primera vez.
+        """
+        sparse_path, parquet_path = self._file_path(run_id, ".npz"), self._file_path(run_id)
+        with self._run_lock(run_id):
+            for path in (sparse_path, parquet_path):
+                if os.path.exists(path):
+                    SHAP_CACHE_REQUESTS.labels(layer="disk", result="hit").inc()
+                    os.utime(path)  # marca de uso para el LRU
+                    return path
+
+            SHAP_CACHE_REQUESTS.labels(layer="disk", result="miss").inc()
+            try:
+                self._download(run_id, SHAP_SPARSE_PATH, sparse_path)
+                path = sparse_path
+            except Exception:
+                self._download(run_id, SHAP_ARTIFACT_PATH, parquet_path)
+                path = parquet_path
+        self._evict_disk(keep=run_id)
+        return path
+
+    def _precomputed_summary(self, run_id):
+        """shap_summary.json del run (en disco tras la primera descarga) o None si el run no lo tiene."""
+        path = self._file_path(run_id, ".summary.json")
+        downloaded = False
+        with self._run_lock(run_id):
+            if not os.path.exists(path):
+                try:
+                    self._download(run_id, SHAP_SUMMARY_PATH, path)
+                    downloaded = True
+                except Exception:
+                    return None  # runs anteriores al resumen precalculado
+            os.utime(path)  # marca de uso para el LRU
+            with open(path) as f:
+                summary = json.load(f)
+        if downloaded:
+            self._evict_disk(keep=run_id)   # fuera del lock del run: la expulsión toma los de otros runs
+        return summary
+
+    def _evict_disk(self, keep=None):
+        """LRU por run sobre todos sus archivos; nunca borra el run más reciente ni `keep`."""
+        runs = {}   # run_id -> [último uso, bytes, rutas]
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if not os.path.isfile(path):
+                    continue   # descargas en curso (directorios temporales)
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            usage = runs.setdefault(name.split(".", 1)[0], [0.0, 0, []])
+            usage[0] = max(usage[0], st.st_mtime)
+            usage[1] += st.st_size
+            usage[2].append(path)
+        ordered = sorted(runs.items(), key=lambda item: item[1][0])
+        total = sum(size for _, (_, size, _) in ordered)
+        # Siempre se conserva el más reciente aunque supere el límite por sí solo
+        for run_id, (_, size, paths) in ordered[:-1]:
+            if total <= self.max_disk_bytes:
+                break
+            if run_id == keep:
+                continue
+            with self._run_lock(run_id):
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            total -= size
+            self._etags.pop(run_id, None)
+            self._summaries.pop(run_id, None)
+
+    def etag(self, run_id: str) -> str:
+        """Hash del artifact en caché (se calcula una vez por archivo)."""
+        if run_id not in self._etags:
+            h = hashlib.md5()
+            with open(self.get_path(run_id), "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(block)
+            self._etags[run_id] = h.hexdigest()
+        return self._etags[run_id]
+
+    # ─── Memoria ─────────────────────────────────────────────────────────────
+    def get_frame(self, run_id: str) -> pd.DataFrame:
+        with self._lock:
+            if run_id in self._frames:
+                self._frames.move_to_end(run_id)
+                SHAP_CACHE_REQUESTS.labels(layer="memory", result="hit").inc()
+                return self._frames[run_id][0]
+        SHAP_CACHE_REQUESTS.labels(layer="memory", result="miss").inc()
+
+        df = read_shap_file(self.get_path(run_id))
+        size = int(df.memory_usage(index=False).sum())
+        with self._lock:
+            self._frames[run_id] = (df, size)
+            total = sum(s for _, s in self._frames.values())
+            while total > self.max_memory_bytes and len(self._frames) > 1:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                total -= evicted
+        return df
+
+    def get_summary(self, run_id: str) -> dict:
+        """Resumen por feature: media, media |SHAP| y cuantiles."""
+        if run_id not in self._summaries:
+            summary = self._precomputed_summary(run_id)
+            SHAP_CACHE_REQUESTS.labels(layer="summary", result="hit" if summary else "miss").inc()
+            self._summaries[run_id] = summary or summarize(self.get_frame(run_id))
+        return self._summaries[run_id]
+
+    def summary_etag(self, run_id: str) -> str:
+        """Hash del resumen (no depende del parquet completo)."""
+        summary = json.dumps(self.get_summary(run_id), sort_keys=True).encode()
+        return hashlib.md5(summary).hexdigest()
+
+
+def read_shap_sparse(path) -> pd.DataFrame:
+    """
+    Lee shap_sparse.npz (lo escribe compute_shap del DAG de modelado): columnas densas
+    tal cual y columnas sparse como CSR de phi + offset, en float32.
+    """
+    with np.load(path, allow_pickle=False) as z:
+        n_rows, n_cols = (int(v) for v in z["shape"])
+        values = np.empty((n_rows, n_cols), dtype=np.float32)
+        values[:, z["dense_cols"]] = z["dense"]
+        sparse_cols = z["sparse_cols"]
+        if len(sparse_cols):
+            block = sp.csr_matrix((z["data"], z["indices"], z["indptr"]), shape=(n_rows, len(sparse_cols)))
+            values[:, sparse_cols] = block.toarray() - z["offset"][sparse_cols]
+        names = [str(c) for c in z["feature_names"]]
+    return pd.DataFrame(values, columns=names)
+
+
+def read_shap_file(path) -> pd.DataFrame:
+    return read_shap_sparse(path) if path.endswith(".npz") else pd.read_parquet(path)
+
+
+def summarize(df: pd.DataFrame) -> dict:
+    if df.empty:
+        return {"n_rows": 0, "features": []}
+    values = df.to_numpy(dtype=float)
+    mean_abs = np.abs(values).mean(axis=0)
+    means = values.mean(axis=0)
+    quantiles = np.quantile(values, SUMMARY_QUANTILES, axis=0)
+    features = []
+    for j in np.argsort(-mean_abs):
+        features.append({
+            "feature": df.columns[j],
+            "mean_abs": float(mean_abs[j]),
+            "mean": float(means[j]),
+            "quantiles": {str(q): float(quantiles[k, j]) for k, q in enumerate(SUMMARY_QUANTILES)},
+        })
+    return {"n_rows": int(len(df)), "features": features}
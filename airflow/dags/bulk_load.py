@@ -0,0 +1,89 @@
+"""
+Carga masiva a Postgres con COPY ... FROM STDIN (formato CSV).
+
+Se importa desde cualquier DAG (la carpeta dags está en el sys.path de Airflow):
+
+    from bulk_load import copy_dataframe, copy_records
+
+Los datos se serializan a CSV por partes y psycopg2 los va leyendo a medida que
+los envía, así que nunca se arma la lista completa de tuplas en Python.
+Convenciones: None/NaN se cargan como NULL (marcador \\N); un string vacío queda como ''.
+Una columna entera con faltantes llega a pandas como float ("3.0"), que COPY no acepta en
+columnas INT: convertirla a Int64 antes de cargarla (las tablas del DAG usan NUMERIC).
+"""
+import io
+import csv
+
+COPY_CHUNK_ROWS = 50000
+
+
+class _TextStream(io.TextIOBase):
+    """Adaptador file-like sobre un iterador de pedazos de texto CSV (lo consume copy_expert)."""
+
+    def __init__(self, pieces):
+        self._pieces = iter(pieces)
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._pieces)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+NULL_MARKER = "\\N"
+
+
+def _copy(cur, table, columns, pieces):
+    sql = f"COPY {table} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{NULL_MARKER}')"
+    cur.copy_expert(sql, _TextStream(pieces))
+
+
+def copy_dataframe(cur, table, df, columns=None, chunk_rows=COPY_CHUNK_ROWS):
+    """Carga un DataFrame con COPY, serializando de a `chunk_rows` filas. Devuelve filas cargadas."""
+    columns = list(columns or df.columns)
+    frame = df[columns]
+
+    def pieces():
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows].to_csv(header=False, index=False, na_rep=NULL_MARKER)
+
+    _copy(cur, table, columns, pieces())
+    return len(frame)
+
+
+def copy_records(cur, table, columns, rows, chunk_rows=COPY_CHUNK_ROWS):
+    """Carga un iterable de filas (secuencias alineadas con `columns`) con COPY. Devuelve filas cargadas."""
+    count = 0
+
+    def pieces():
+        nonlocal count
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        pending = 0
+        for row in rows:
+            writer.writerow([NULL_MARKER if v is None or (isinstance(v, float) and v != v) else v for v in row])
+            pending += 1
+            if pending >= chunk_rows:
+                count += pending
+                pending = 0
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        count += pending
+        yield buf.getvalue()
+
+    _copy(cur, table, columns, pieces())
+    return count
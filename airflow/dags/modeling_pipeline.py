@@ -1,11 +1,27 @@
 import os
+import re
+import json
+import time
+import shutil
+import requests
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+import pyarrow.dataset as ds
+import pyarrow.compute as pc
+import scipy.sparse as sp
+from scipy.optimize import minimize
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.sensors.external_task import ExternalTaskSensor
-from airflow.exceptions import AirflowSkipException
+from airflow.exceptions import AirflowFailException, AirflowSkipException
+from airflow.models import DagRun
+from airflow.utils.state import DagRunState, State
 from sqlalchemy import create_engine, text
 import mlflow
 from mlflow.tracking import MlflowClient
@@ -15,19 +31,625 @@ from sklearn.linear_model import GammaRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
-import shap
+from sklearn.base import clone
+from cleaning import clean_frame
+from model_search import BASELINE, candidates, pick_winner, prepare_search, run_search
 
 # ─── Configuración ─────────────────────────────────────────────────────────────
 CLEAN_DB_URI    = os.getenv("CLEAN_DB_CONN")
 SCHEMA_CLEAN    = "clean_data"
 TABLE_CLEAN     = "clean_data_init"
 EXPERIMENT_NAME = "modeling_pipeline"
+DAG_ID          = "modeling_pipeline"
 SHARED_TMP      = "/opt/airflow/dags/tmp"
 MAX_SHAP        = 50000
+SHAP_BACKGROUND_ROWS = int(os.getenv("SHAP_BACKGROUND_ROWS", "1000"))
+SHAP_SAMPLE_ROWS     = int(os.getenv("SHAP_SAMPLE_ROWS", "1000"))
+SHAP_SAMPLE_STRATA   = 10
+SHAP_SPARSE_DENSITY  = 0.5    # columnas con menos no-ceros que esto se guardan en CSR
+SHAP_QUANTILES       = (0.05, 0.25, 0.5, 0.75, 0.95)   # los mismos del resumen de la API
+STAGING_FORMAT  = os.getenv("STAGING_FORMAT", "parquet")   # parquet | feather (memory-mapped)
+SNAPSHOT_DIR    = os.getenv("SNAPSHOT_DIR", f"{SHARED_TMP}/snapshot")
+STAGING_DIR     = os.getenv("STAGING_DIR", f"{SHARED_TMP}/staging")   # un subdirectorio por corrida
+STAGING_TTL_HOURS = float(os.getenv("STAGING_TTL_HOURS", "24"))     # staging más viejo se borra siempre
+SNAPSHOT_COMPACT_FRAGMENTS = int(os.getenv("SNAPSHOT_COMPACT_FRAGMENTS", "24"))
+TRAINING_MODE   = os.getenv("TRAINING_MODE", "memory")     # memory | streaming (por chunks, memoria acotada)
+TRAIN_CHUNK_ROWS = int(os.getenv("TRAIN_CHUNK_ROWS", "100000"))
+MAX_CARDINALITY = 8      # categóricas con más valores distintos se descartan
+GLM_ALPHA       = 1.0    # mismos hiperparámetros que GammaRegressor(max_iter=200)
+GLM_MAX_ITER    = 200
+GLM_TOL         = 1e-4
+MODEL_SEARCH    = os.getenv("MODEL_SEARCH", "off")           # off (solo el GammaRegressor base) | grid
+TRAIN_TIMEOUT_MINUTES = int(os.getenv("TRAIN_TIMEOUT_MINUTES", "60"))   # tope de train_and_log (con búsqueda)
+CHAMPION_CACHE_DIR  = os.getenv("CHAMPION_CACHE_DIR", f"{SHARED_TMP}/champion")
+CHAMPION_CACHE_KEEP = int(os.getenv("CHAMPION_CACHE_KEEP", "2"))   # versiones conservadas en disco
+FASTAPI_PREFETCH_HOOK = os.getenv("FASTAPI_PREFETCH_HOOK", "http://fastapi:8989/hooks/model_prefetch")
+
+FEATURES = [
+    "brokered_by", "status", "bed", "bath", "acre_lot",
+    "street", "city", "state", "zip_code", "house_size", "prev_sold_date"
+]
+TARGET = "price"
+
+# Esquema explícito del staging: los tipos sobreviven entre tareas (sin re-inferir como con CSV)
+STAGING_SCHEMA = pa.schema([
+    ("brokered_by",    pa.float64()),
+    ("status",         pa.string()),
+    ("price",          pa.float64()),
+    ("bed",            pa.float64()),
+    ("bath",           pa.float64()),
+    ("acre_lot",       pa.float64()),
+    ("street",         pa.string()),
+    ("city",           pa.string()),
+    ("state",          pa.string()),
+    ("zip_code",       pa.string()),
+    ("house_size",     pa.float64()),
+    ("prev_sold_date", pa.string()),
+    ("load_date",      pa.timestamp("us")),
+])
+SNAPSHOT_SCHEMA = STAGING_SCHEMA.append(pa.field("split", pa.string()))
+
+# Fragmento del snapshot: frag_<desde>_<hasta>.parquet con el rango de load_date (desde, hasta]
+_TS_FMT = "%Y%m%dT%H%M%S%f"
+_FRAGMENT_RE = re.compile(r"^frag_(0|\d{8}T\d{12})_(\d{8}T\d{12})\.parquet$")
+_RUN_MARKER = ".run_id"
+# Versiones anteriores dejaban el staging directamente en SHARED_TMP con el run_id como nombre
+_LEGACY_STAGING_RE = re.compile(r"^(scheduled|manual|backfill|dataset_triggered)__")
 
 os.makedirs(SHARED_TMP, exist_ok=True)
 mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI"))
 
+def _staging_dir_path(run_id):
+    return os.path.join(STAGING_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", run_id))
+
+
+def _staging_dir(run_id):
+    """Directorio de staging de la corrida: corridas concurrentes no se pisan."""
+    path = _staging_dir_path(run_id)
+    marker = os.path.join(path, _RUN_MARKER)
+    if not os.path.exists(marker):
+        os.makedirs(path, exist_ok=True)
+        # El nombre del directorio no siempre permite recuperar el run_id (caracteres reemplazados)
+        with open(marker, "w") as f:
+            f.write(run_id)
+    return path
+
+
+def _run_is_active(run_id):
+    """True si el DagRun sigue en cola o corriendo; None si no se pudo consultar la metadata."""
+    try:
+        runs = DagRun.find(dag_id=DAG_ID, run_id=run_id)
+    except Exception as e:
+        print(f"⚠️  No se pudo consultar el estado de {run_id}: {e}")
+        return None
+    return bool(runs) and runs[0].state in (DagRunState.QUEUED, DagRunState.RUNNING)
+
+
+def prune_staging(current_run_id, ttl_hours=STAGING_TTL_HOURS, is_active=_run_is_active):
+    """
+    Borra el staging que dejaron corridas fallidas, limpiadas o con el worker caído: el de
+    corridas que ya no están activas y cualquiera con más de ttl_hours sin modificarse.
+    Nunca toca el de current_run_id. Devuelve los directorios borrados.
+    """
+    paths = []
+    if os.path.isdir(STAGING_DIR):
+        paths += [os.path.join(STAGING_DIR, name) for name in os.listdir(STAGING_DIR)]
+    paths += [os.path.join(SHARED_TMP, name) for name in os.listdir(SHARED_TMP) if _LEGACY_STAGING_RE.match(name)]
+    current = _staging_dir_path(current_run_id)
+    removed = []
+    for path in paths:
+        if path == current or not os.path.isdir(path):
+            continue
+        expired = time.time() - os.path.getmtime(path) > ttl_hours * 3600
+        marker = os.path.join(path, _RUN_MARKER)
+        run_id = None
+        if os.path.exists(marker):
+            with open(marker) as f:
+                run_id = f.read().strip()
+        if expired or (run_id and is_active(run_id) is False):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    if removed:
+        print(f"🗑️  Staging de corridas anteriores eliminado: {removed}")
+    return removed
+
+
+def _staging_path(run_id, split):
+    ext = "feather" if STAGING_FORMAT == "feather" else "parquet"
+    return os.path.join(_staging_dir(run_id), f"{split}.{ext}")
+
+
+def _to_arrow(df, schema):
+    """DataFrame → pa.Table con el esquema dado (texto como string, fechas ISO)."""
+    frame = pd.DataFrame(index=df.index)
+    for field in schema:
+        col = df[field.name]
+        if pa.types.is_string(field.type):
+            frame[field.name] = col.where(col.isna(), col.astype(str))
+        elif pa.types.is_floating(field.type):
+            frame[field.name] = pd.to_numeric(col, errors="coerce")
+        else:
+            frame[field.name] = pd.to_datetime(col)
+    return pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+
+
+def _write_batches(path, schema, batches, file_format="parquet"):
+    """Escribe lote a lote (nunca arma la tabla completa). Devuelve filas escritas."""
+    rows = 0
+    if file_format == "feather":
+        writer = pa.ipc.new_file(path, schema)
+    else:
+        writer = pq.ParquetWriter(path, schema)
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    return rows
+
+
+def write_staging(data, run_id, split):
+    """
+    Escribe el split una sola vez: DataFrame (se convierte a STAGING_SCHEMA), pa.Table o
+    RecordBatchReader (se escribe por lotes). Devuelve filas escritas.
+    """
+    if isinstance(data, pd.DataFrame):
+        data = _to_arrow(data, STAGING_SCHEMA)
+    if isinstance(data, pa.Table):
+        data = data.to_reader()
+    return _write_batches(_staging_path(run_id, split), data.schema, data, STAGING_FORMAT)
+
+
+def read_staging(run_id, split, columns=None):
+    """Lee el split leyendo solo las columnas pedidas (proyección)."""
+    path = _staging_path(run_id, split)
+    if STAGING_FORMAT == "feather":
+        table = feather.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = pq.read_table(path, columns=columns)
+    return table.to_pandas()
+
+
+def _staging_dataset(run_id, split):
+    return ds.dataset(_staging_path(run_id, split), format="ipc" if STAGING_FORMAT == "feather" else "parquet")
+
+
+def iter_staging(run_id, split, columns=None, batch_rows=TRAIN_CHUNK_ROWS, filter=None):
+    """Como read_staging pero en DataFrames de a lo más batch_rows filas (opcionalmente filtradas)."""
+    scanner = _staging_dataset(run_id, split).scanner(columns=columns, filter=filter, batch_size=batch_rows)
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def sample_staging(run_id, split, columns, n, seed=42):
+    """Muestra aleatoria de n filas del split sin cargarlo completo."""
+    dataset = _staging_dataset(run_id, split)
+    total = dataset.count_rows()
+    if total <= n:
+        return dataset.to_table(columns=columns).to_pandas()
+    idx = np.sort(np.random.default_rng(seed).choice(total, size=n, replace=False))
+    return dataset.take(idx, columns=columns).to_pandas()
+
+
+def list_fragments():
+    """
+    [(ruta, desde, hasta)] del snapshot ordenados por rango. Si una compactación se
+    cortó antes de borrar sus fuentes, los fragmentos cubiertos por otro se eliminan.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    fragments = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        match = _FRAGMENT_RE.match(name)
+        if match:
+            lower = None if match.group(1) == "0" else datetime.strptime(match.group(1), _TS_FMT)
+            upper = datetime.strptime(match.group(2), _TS_FMT)
+            fragments.append((os.path.join(SNAPSHOT_DIR, name), lower, upper))
+
+    def covers(a, b):
+        return a is not b and (a[1] is None or (b[1] is not None and a[1] <= b[1])) and a[2] >= b[2]
+
+    kept = []
+    for frag in fragments:
+        if any(covers(other, frag) for other in fragments):
+            os.remove(frag[0])
+        else:
+            kept.append(frag)
+    return sorted(kept, key=lambda f: f[2])
+
+
+def _write_fragment(batches, lower, upper):
+    name = f"frag_{lower.strftime(_TS_FMT) if lower else '0'}_{upper.strftime(_TS_FMT)}.parquet"
+    path = os.path.join(SNAPSHOT_DIR, name)
+    rows = _write_batches(f"{path}.tmp", SNAPSHOT_SCHEMA, batches)
+    os.replace(f"{path}.tmp", path)  # el fragmento aparece completo o no aparece
+    return path, rows
+
+
+def compact_snapshot(fragments):
+    """Une todos los fragmentos en uno solo con el rango total y borra los originales."""
+    dataset = ds.dataset([f[0] for f in fragments], format="parquet", schema=SNAPSHOT_SCHEMA)
+    path, rows = _write_fragment(dataset.to_batches(), fragments[0][1], fragments[-1][2])
+    for frag in fragments:
+        if frag[0] != path:
+            os.remove(frag[0])
+    print(f"✅ Snapshot compactado: {len(fragments)} fragmentos → 1 ({rows} filas)")
+
+
+def profile_columns(df):
+    """Perfil por columna (dtype, nulos, cardinalidad), calculado una sola vez por dataset."""
+    return {
+        col: {
+            "dtype": str(df[col].dtype),
+            "nulls": int(df[col].isna().sum()),
+            "nunique": int(df[col].nunique()),
+        }
+        for col in df.columns
+    }
+
+
+@contextmanager
+def _timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+# ─── Entrenamiento por chunks (TRAINING_MODE=streaming) ───────────────────────
+def iter_xy(run_id, split, drop=(), batch_rows=TRAIN_CHUNK_ROWS, filter=None):
+    """(X, y) del split por chunks, sin las columnas de `drop`."""
+    columns = [c for c in FEATURES if c not in drop] + [TARGET]
+    for df in iter_staging(run_id, split, columns, batch_rows, filter):
+        y = df.pop(TARGET)
+        yield df, y
+
+
+def scan_train_stats(run_id, batch_rows=TRAIN_CHUNK_ROWS):
+    """
+    Primera pasada por chunks sobre train. Devuelve:
+      - profile como profile_columns (FEATURES + TARGET); nunique se cuenta solo hasta
+        MAX_CARDINALITY + 1, que es lo que necesita la separación de categóricas,
+      - categories: valores vistos de cada columna de texto (completos si son de baja cardinalidad),
+      - scaler: StandardScaler ajustado con partial_fit sobre las columnas numéricas de FEATURES.
+    """
+    profile, categories = {}, {}
+    scaler = StandardScaler()
+    for df in iter_staging(run_id, "train", FEATURES + [TARGET], batch_rows):
+        for col in df.columns:
+            p = profile.setdefault(col, {"dtype": str(df[col].dtype), "nulls": 0, "nunique": 0})
+            p["nulls"] += int(df[col].isna().sum())
+            seen = categories.setdefault(col, set())
+            if len(seen) <= MAX_CARDINALITY:
+                seen.update(df[col].dropna().unique())
+                p["nunique"] = min(len(seen), MAX_CARDINALITY + 1)
+        num_cols = [c for c in FEATURES if c in df.columns and df[c].dtype.kind == "f"]
+        if num_cols:
+            scaler.partial_fit(df[num_cols])
+    categories = {c: v for c, v in categories.items() if profile[c]["dtype"] in ("object", "category")}
+    return profile, categories, scaler
+
+
+def build_streaming_preproc(low_card, categories, num_cols, scaler):
+    """
+    El mismo ColumnTransformer del camino en memoria, armado sin ver todo train: se ajusta
+    sobre un frame sintético con las categorías descubiertas (OneHotEncoder las ordena igual
+    que con los datos completos) y el StandardScaler se reemplaza por el de partial_fit.
+    """
+    n = max([len(categories[c]) for c in low_card] + [1])
+    synthetic = pd.DataFrame({
+        **{c: [sorted(categories[c])[i % len(categories[c])] for i in range(n)] for c in low_card},
+        **{c: np.zeros(n) for c in num_cols},
+    })
+    preproc = ColumnTransformer([
+        ("cat", OneHotEncoder(handle_unknown="ignore", sparse=True), low_card),
+        ("num", StandardScaler(), num_cols),
+    ], remainder="drop").fit(synthetic)
+    for i, (name, _, cols) in enumerate(preproc.transformers_):
+        if name == "num" and num_cols:
+            preproc.transformers_[i] = (name, scaler, cols)
+    return preproc
+
+
+def fit_gamma_streaming(preproc, chunks, cache_dir, alpha=GLM_ALPHA, max_iter=GLM_MAX_ITER, tol=GLM_TOL):
+    """
+    GammaRegressor (link log) entrenado por chunks con la misma función objetivo y solver
+    que el fit de sklearn: media de la half-Gamma deviance + alpha/2·||coef||², L-BFGS-B.
+    La pérdida y el gradiente se acumulan chunk a chunk; cada chunk se transforma una
+    sola vez y queda en cache_dir (CSR en disco) para las iteraciones siguientes.
+    Devuelve (reg, suma por columna de la matriz transformada, filas).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    parts, n, sum_y, sum_x = [], 0, 0.0, 0.0
+    for i, (X, y) in enumerate(chunks):
+        Xt = sp.csr_matrix(preproc.transform(X), dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if (y <= 0).any():
+            raise ValueError("Some value(s) of y are out of the valid range of the loss 'HalfGammaLoss'.")
+        x_path, y_path = os.path.join(cache_dir, f"X_{i:05d}.npz"), os.path.join(cache_dir, f"y_{i:05d}.npy")
+        sp.save_npz(x_path, Xt, compressed=False)
+        np.save(y_path, y)
+        parts.append((x_path, y_path))
+        n += len(y)
+        sum_y += y.sum()
+        sum_x = sum_x + np.asarray(Xt.sum(axis=0)).ravel()
+    if n == 0:
+        raise ValueError("No hay filas de entrenamiento")
+    n_features = len(preproc.get_feature_names_out())
+
+    def objective(params):
+        coef, intercept = params[:-1], params[-1]
+        loss, grad = 0.0, np.zeros_like(params)
+        for x_path, y_path in parts:
+            Xt, y = sp.load_npz(x_path), np.load(y_path)
+            raw = Xt @ coef + intercept
+            y_exp = y * np.exp(-raw)
+            loss += np.sum(raw + y_exp)
+            g = 1.0 - y_exp
+            grad[:-1] += Xt.T @ g
+            grad[-1] += g.sum()
+        grad /= n
+        grad[:-1] += alpha * coef
+        return loss / n + 0.5 * alpha * (coef @ coef), grad
+
+    x0 = np.zeros(n_features + 1)
+    x0[-1] = np.log(sum_y / n)
+    opt = minimize(objective, x0, method="L-BFGS-B", jac=True, options={
+        "maxiter": max_iter, "maxls": 50, "gtol": tol, "ftol": 64 * np.finfo(float).eps,
+    })
+    if not opt.success:
+        print(f"⚠️  L-BFGS no convergió: {opt.message}")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # fit público sobre una fila vacía para que sklearn arme su estado interno (pérdida,
+    # link, n_features_in_) sin tocar atributos privados; después van los coeficientes del L-BFGS
+    reg = GammaRegressor(alpha=alpha, max_iter=max_iter, tol=tol).fit(sp.csr_matrix((1, n_features)), [1.0])
+    reg.coef_, reg.intercept_ = opt.x[:-1], float(opt.x[-1])
+    reg.n_iter_ = min(opt.nit, max_iter)
+    return reg, sum_x, n
+
+
+def accumulate_metrics(pipe, chunks, sums=None):
+    """
+    Suma chunk a chunk los estadísticos suficientes de mse/mae/r2: error cuadrático y
+    absoluto, y momentos de y centrados en `shift` (estabilidad numérica). Con `sums`
+    continúa una acumulación previa (evaluación incremental).
+    """
+    sums = dict(sums or {"n": 0, "se": 0.0, "ae": 0.0, "s_y": 0.0, "s_yy": 0.0, "shift": None})
+    for X, y in chunks:
+        y = np.asarray(y, dtype=np.float64)
+        err = y - pipe.predict(X)
+        if sums["shift"] is None:
+            sums["shift"] = float(y.mean())
+        d = y - sums["shift"]
+        sums["n"] += len(y)
+        sums["se"] += float(err @ err)
+        sums["ae"] += float(np.abs(err).sum())
+        sums["s_y"] += float(d.sum())
+        sums["s_yy"] += float(d @ d)
+    return sums
+
+
+def metrics_from_sums(sums):
+    """mse/rmse/mae/r2 (mismas fórmulas que sklearn.metrics) a partir de accumulate_metrics."""
+    n = sums["n"]
+    mse = sums["se"] / n
+    return {"mse": mse, "rmse": mse ** 0.5, "mae": sums["ae"] / n,
+            "r2": 1 - sums["se"] / (sums["s_yy"] - sums["s_y"] ** 2 / n)}
+
+
+def evaluate_streaming(pipe, chunks):
+    """mse/rmse/mae/r2 acumulados por chunks."""
+    return metrics_from_sums(accumulate_metrics(pipe, chunks))
+
+
+def prefetch_in_serving(version, run_id):
+    """
+    Avisa a FastAPI de la versión recién registrada para que la descargue a su caché
+    local; si luego se promueve, la recarga no espera a MinIO. Un fallo no detiene el DAG.
+    """
+    if not FASTAPI_PREFETCH_HOOK:
+        return
+    payload = {"model_name": "my_model", "model_version": int(version), "run_id": run_id}
+    try:
+        resp = requests.post(FASTAPI_PREFETCH_HOOK, json=payload, timeout=10)
+        resp.raise_for_status()
+        print(f"✅ FastAPI precargando el candidato: {payload}")
+    except Exception as e:
+        print(f"⚠️  No se pudo pedir la precarga a FastAPI ({FASTAPI_PREFETCH_HOOK}): {e}")
+
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_champion(version):
+    """
+    Pipeline de la versión en Production desde la caché local CHAMPION_CACHE_DIR/v<versión>.
+    Solo se descarga de MLflow (MinIO) la primera vez; si el source registrado cambió
+    (registro recreado) se vuelve a descargar. Devuelve (pipeline, directorio de la versión).
+    """
+    path = os.path.join(CHAMPION_CACHE_DIR, f"v{version.version}")
+    meta = _read_json(os.path.join(path, "meta.json"))
+    if meta is None or meta["source"] != version.source:
+        shutil.rmtree(path, ignore_errors=True)
+        tmp = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        local = mlflow.artifacts.download_artifacts(artifact_uri=version.source, dst_path=tmp)
+        os.rename(local, os.path.join(tmp, "model"))
+        _write_json(os.path.join(tmp, "meta.json"), {"source": version.source, "run_id": version.run_id})
+        os.replace(tmp, path)  # la versión aparece completa o no aparece
+        print(f"⬇️  Campeón v{version.version} descargado en {path}")
+        # Se conservan las CHAMPION_CACHE_KEEP versiones usadas más recientemente
+        cached = sorted(
+            (os.path.join(CHAMPION_CACHE_DIR, d) for d in os.listdir(CHAMPION_CACHE_DIR) if re.match(r"^v\d+$", d)),
+            key=os.path.getmtime, reverse=True,
+        )
+        for old in cached[CHAMPION_CACHE_KEEP:]:
+            if old != path:
+                shutil.rmtree(old, ignore_errors=True)
+    os.utime(path)
+    return mlflow_sklearn.load_model(os.path.join(path, "model")), path
+
+
+def champion_metrics(pipe, cache_path, run_id):
+    """
+    Métricas del campeón sobre todo el test de la corrida puntuando solo las filas nuevas:
+    metrics.json (en el directorio de la versión) guarda las sumas de accumulate_metrics y
+    el load_date hasta el que llegan. Si el test ya no contiene exactamente esas filas
+    (snapshot reconstruido, otra partición) se recalcula desde cero.
+    Devuelve (métricas o None si no hay test, filas puntuadas en esta corrida).
+    """
+    metrics_path = os.path.join(cache_path, "metrics.json")
+    dataset = _staging_dataset(run_id, "test")
+    cached = _read_json(metrics_path)
+    new_rows = None
+    if cached is not None:
+        through = pa.scalar(datetime.fromisoformat(cached["through"]), pa.timestamp("us"))
+        if dataset.count_rows(filter=ds.field("load_date") <= through) == cached["sums"]["n"]:
+            new_rows = ds.field("load_date") > through
+        else:
+            cached = None
+    upper = pc.max(dataset.to_table(columns=["load_date"]).column("load_date")).as_py()
+    if upper is None:
+        return None, 0
+    before = cached["sums"]["n"] if cached else 0
+    sums = accumulate_metrics(pipe, iter_xy(run_id, "test", filter=new_rows), cached and cached["sums"])
+    _write_json(metrics_path, {"through": upper.isoformat(), "sums": sums})
+    return metrics_from_sums(sums), sums["n"] - before
+
+
+def search_candidates(cands, X_train_trans, y_train, search_dir):
+    """
+    Entrena los candidatos en paralelo sobre X_train_trans (memory-mapped en search_dir),
+    registra cada uno como run anidado de MLflow y devuelve el nombre del mejor explicable (val_mae).
+    """
+    try:
+        prepare_search(X_train_trans, y_train, search_dir)
+        results = run_search(cands, search_dir)
+    finally:
+        shutil.rmtree(search_dir, ignore_errors=True)
+    for r in results:
+        with mlflow.start_run(run_name=r["name"], nested=True):
+            mlflow.log_params({"candidate": r["name"], **r["params"]})
+            if "error" in r:
+                mlflow.set_tag("error", r["error"][:500])
+                print(f"⚠️  Candidato {r['name']} falló: {r['error']}")
+                continue
+            mlflow.log_metrics({**r["metrics"], "fit_seconds": r["fit_seconds"]})
+    ranking = [(r["name"], round(r["metrics"]["val_mae"], 2)) for r in results if "metrics" in r]
+    print(f"Ranking de candidatos (val_mae): {ranking}")
+    return pick_winner(results, cands)
+
+
+def shap_background_mean(run_id, preproc, columns):
+    """
+    E[x] del background en el espacio transformado; para un modelo lineal el SHAP
+    intervencional solo depende de esa media. Se usa la de todo train que guardó
+    train_and_log (background.json, la misma que usa la API) o, si no está, la de una
+    muestra aleatoria de SHAP_BACKGROUND_ROWS filas de train.
+    """
+    background = _read_json(os.path.join(_staging_dir(run_id), "background.json"))
+    if background and background["feature_names"] == list(preproc.get_feature_names_out()):
+        return np.asarray(background["mean"], dtype=np.float64)
+    sample = sample_staging(run_id, "train", columns, SHAP_BACKGROUND_ROWS)
+    return np.asarray(preproc.transform(sample).mean(axis=0)).ravel()
+
+
+def linear_shap(X_trans, coef, background_mean):
+    """
+    phi_ij = coef_j * (x_ij - E[x_j]) en float32. Con salida sparse del preproc no se
+    densifica X: se parte de -coef*E[x] y se suman solo las entradas no nulas.
+    Devuelve (phi, offset = coef*E[x]).
+    """
+    offset = (coef * background_mean).astype(np.float32)
+    if not sp.issparse(X_trans):
+        out = np.asarray(X_trans, dtype=np.float32) * coef.astype(np.float32)
+        out -= offset
+        return out, offset
+    X_trans = sp.csr_matrix(X_trans)
+    out = np.empty(X_trans.shape, dtype=np.float32)
+    out[:] = -offset
+    rows = np.repeat(np.arange(X_trans.shape[0]), np.diff(X_trans.indptr))
+    out[rows, X_trans.indices] += (X_trans.data * coef[X_trans.indices]).astype(np.float32)
+    return out, offset
+
+
+def write_shap_sparse(path, values, offset, names):
+    """
+    Artifact shap_sparse.npz (float32, comprimido; lo lee FastAPI/app/shap_cache.py):
+      - columnas densas (p. ej. numéricas): `dense` tal cual, índices en `dense_cols`,
+      - columnas mayormente cero una vez sumado el offset (one-hot de un GLM: x=0 ⇒
+        phi = -offset): CSR `data/indices/indptr` de phi + offset, índices en `sparse_cols`.
+    La reconstrucción es phi[:, sparse_cols] = CSR.toarray() - offset[sparse_cols].
+    """
+    contrib = values + offset
+    sparse_mask = (contrib != 0).mean(axis=0) <= SHAP_SPARSE_DENSITY if len(values) else np.zeros(len(names), bool)
+    sparse_cols, dense_cols = np.flatnonzero(sparse_mask), np.flatnonzero(~sparse_mask)
+    block = sp.csr_matrix(contrib[:, sparse_cols])
+    np.savez_compressed(
+        path,
+        version=np.array(1),
+        shape=np.array(values.shape),
+        feature_names=np.array(names, dtype=str),
+        offset=offset.astype(np.float32),
+        dense_cols=dense_cols,
+        dense=np.ascontiguousarray(values[:, dense_cols]),
+        sparse_cols=sparse_cols,
+        data=block.data.astype(np.float32),
+        indices=block.indices.astype(np.uint8 if len(sparse_cols) <= 256 else np.int32),
+        indptr=block.indptr.astype(np.int64),
+    )
+    return path
+
+
+def shap_summary(values, names):
+    """Media |SHAP|, media y cuantiles por feature (mismo formato que /shap/{run_id}?mode=summary)."""
+    if not len(values):
+        return {"n_rows": 0, "features": []}
+    values = np.asarray(values, dtype=np.float64)
+    mean_abs = np.abs(values).mean(axis=0)
+    means = values.mean(axis=0)
+    quantiles = np.quantile(values, SHAP_QUANTILES, axis=0)
+    return {
+        "n_rows": int(len(values)),
+        "features": [
+            {
+                "feature": names[j],
+                "mean_abs": float(mean_abs[j]),
+                "mean": float(means[j]),
+                "quantiles": {str(q): float(quantiles[k, j]) for k, q in enumerate(SHAP_QUANTILES)},
+            }
+            for j in np.argsort(-mean_abs)
+        ],
+    }
+
+
+def stratified_rows(predictions, size, strata=SHAP_SAMPLE_STRATA, seed=42):
+    """Índices de una muestra estratificada por cuantiles de la predicción (misma cantidad por estrato)."""
+    if len(predictions) <= size:
+        return np.arange(len(predictions))
+    rng = np.random.default_rng(seed)
+    per_stratum = max(1, size // strata)
+    picked = [
+        rng.choice(stratum, size=min(per_stratum, len(stratum)), replace=False)
+        for stratum in np.array_split(np.argsort(predictions, kind="stable"), strata)
+    ]
+    return np.sort(np.concatenate(picked))
+
+
 default_args = {
     "owner": "airflow",
     "retries": 1,
@@ -36,7 +658,7 @@ default_args = {
 
 # ─── DAG ───────────────────────────────────────────────────────────────────────
 with DAG(
-    dag_id="modeling_pipeline",
+    dag_id=DAG_ID,
     default_args=default_args,
     start_date=datetime(2025, 5, 1),
     schedule_interval="@hourly",
@@ -87,22 +709,74 @@ with DAG(
     )
 
     # 2) Extracción de datos
-    def extract_data_fn():
-        engine   = create_engine(CLEAN_DB_URI)
-        raw_conn = engine.raw_connection()
-        try:
-            df = pd.read_sql_query(f"SELECT * FROM {SCHEMA_CLEAN}.{TABLE_CLEAN}", con=raw_conn)
-        finally:
-            raw_conn.close()
-
-        if df.empty:
-            raise AirflowSkipException("No hay datos en clean_data_init para extraer")
+    def extract_data_fn(ti):
+        """
+        Mantiene un snapshot local del training set (fragmentos Parquet en SNAPSHOT_DIR):
+        solo se piden a la base las filas con load_date en (último fragmento, clean_complete],
+        se agregan como un fragmento nuevo y, pasado SNAPSHOT_COMPACT_FRAGMENTS, se compactan.
+        Los splits train/test de la corrida se escriben desde el snapshot. Antes se borra el
+        staging que hayan dejado corridas anteriores (prune_staging).
+        """
+        prune_staging(ti.run_id)
+        fragments = list_fragments()
+        lower = fragments[-1][2] if fragments else None
 
-        df_train = df[df["split"]=="train"].drop(columns=["split"])
-        df_test  = df[df["split"]=="test"].drop(columns=["split"])
-        df_train.to_csv(f"{SHARED_TMP}/train.csv", index=False)
-        df_test .to_csv(f"{SHARED_TMP}/test.csv",  index=False)
-        print(f"✅ Extracted {len(df)} rows → {len(df_train)} train / {len(df_test)} test")
+        engine = create_engine(CLEAN_DB_URI)
+        with engine.connect() as conn:
+            # Hasta dónde clean_data está completo (watermark del data_pipeline)
+            upper = None
+            if conn.execute(text(f"SELECT to_regclass('{SCHEMA_CLEAN}.pipeline_watermarks')")).scalar():
+                upper = conn.execute(text(f"""
+                    SELECT processed_through FROM {SCHEMA_CLEAN}.pipeline_watermarks
+                     WHERE stage = 'clean_complete'
+                """)).scalar()
+            if upper is None:
+                upper = conn.execute(text(f"SELECT MAX(load_date) FROM {SCHEMA_CLEAN}.{TABLE_CLEAN}")).scalar()
+
+        fetched = 0
+        if upper is not None and (lower is None or upper > lower):
+            raw_conn = engine.raw_connection()
+            try:
+                # Cursor server-side: el fragmento se escribe de a TRAIN_CHUNK_ROWS filas
+                cur = raw_conn.cursor(name="extract_snapshot")
+                cur.execute(
+                    f"SELECT * FROM {SCHEMA_CLEAN}.{TABLE_CLEAN} WHERE load_date > %s AND load_date <= %s",
+                    [lower or datetime.min, upper],
+                )
+
+                def batches():
+                    while True:
+                        rows = cur.fetchmany(TRAIN_CHUNK_ROWS)
+                        if not rows:
+                            break
+                        df = pd.DataFrame.from_records(rows, columns=[d[0] for d in cur.description],
+                                                       coerce_float=True)
+                        # Idempotente sobre datos ya limpios; normaliza filas antiguas con texto NULL
+                        yield from _to_arrow(clean_frame(df), SNAPSHOT_SCHEMA).to_batches()
+
+                _, fetched = _write_fragment(batches(), lower, upper)
+                cur.close()
+            finally:
+                raw_conn.close()
+            fragments = list_fragments()
+
+        if len(fragments) > SNAPSHOT_COMPACT_FRAGMENTS:
+            compact_snapshot(fragments)
+            fragments = list_fragments()
+
+        snapshot = ds.dataset([f[0] for f in fragments], format="parquet", schema=SNAPSHOT_SCHEMA)
+        counts = {}
+        for split in ("train", "test"):
+            reader = snapshot.scanner(
+                columns=STAGING_SCHEMA.names, filter=ds.field("split") == split, batch_size=TRAIN_CHUNK_ROWS
+            ).to_reader()
+            counts[split] = write_staging(reader, ti.run_id, split)
+        total = counts["train"] + counts["test"]
+        if total == 0:
+            raise AirflowSkipException("No hay datos en clean_data_init para extraer")
+        print(f"✅ Extracted {total} rows → {counts['train']} train / {counts['test']} test "
+              f"({fetched} nuevas desde la base, {len(fragments)} fragmentos; "
+              f"{STAGING_FORMAT} en {_staging_dir(ti.run_id)})")
 
     extract_data = PythonOperator(
         task_id="extract_data",
@@ -111,108 +785,177 @@ with DAG(
 
     # 3) Entrenamiento y logging
     def train_and_log_fn(ti):
+        """
+        TRAINING_MODE=memory carga train completo y entrena el GammaRegressor base; con
+        MODEL_SEARCH=grid antes busca entre los GLMs de model_search y registra solo el mejor
+        como my_model. TRAINING_MODE=streaming
+        recorre train por chunks de TRAIN_CHUNK_ROWS (perfil, categorías y StandardScaler.partial_fit
+        en una pasada; GammaRegressor con L-BFGS acumulado por chunks), con memoria acotada y
+        sin búsqueda.
+        """
         mlflow.set_experiment(EXPERIMENT_NAME)
+        streaming = TRAINING_MODE == "streaming"
+        timings = {}
         with mlflow.start_run() as run:
-            df_train = pd.read_csv(f"{SHARED_TMP}/train.csv")
-            FEATURES = [
-                "brokered_by", "status", "bed", "bath", "acre_lot",
-                "street", "city", "state", "zip_code", "house_size", "prev_sold_date"
-            ]
-            for c in ["street", "city", "state", "status", "zip_code"]:
-                if c in df_train.columns:
-                    df_train[c] = df_train[c].astype(str)
-            print("Dtypes en X_train antes de entrenar:")
-            print(df_train.dtypes)
-            print("Ejemplo de valores de street:", df_train['street'].head(10))
-            y_train = df_train.pop("price")
-            # Filtrar solo las columnas válidas
-            X_train = df_train[[col for col in FEATURES if col in df_train.columns]].copy()
+            stage_dir = _staging_dir(ti.run_id)
+            # Guardar features usadas en MLflow
+            with open(f"{stage_dir}/features.json", "w") as f:
+                json.dump(FEATURES, f)
+            mlflow.log_artifact(f"{stage_dir}/features.json", artifact_path="features")
+
+            profile_path = f"{stage_dir}/column_profile.json"
+            if streaming:
+                # Perfil + categorías + scaler en una sola pasada por chunks
+                with _timed(timings, "profile"):
+                    profile, categories, scaler = scan_train_stats(ti.run_id)
+                    y_profile = profile.pop(TARGET)
+                    with open(profile_path, "w") as f:
+                        json.dump(profile, f, indent=2)
+                y_nulls = y_profile["nulls"]
+            else:
+                with _timed(timings, "load"):
+                    df_train = read_staging(ti.run_id, "train", columns=FEATURES + [TARGET])
+                    y_train = df_train.pop(TARGET)
+                    # Filtrar solo las columnas válidas
+                    X_train = df_train[[col for col in FEATURES if col in df_train.columns]].copy()
+                # Perfil de columnas: una pasada por columna, cacheado en el staging de la corrida
+                with _timed(timings, "profile"):
+                    if os.path.exists(profile_path):
+                        with open(profile_path) as f:
+                            profile = json.load(f)
+                    else:
+                        profile = profile_columns(X_train)
+                        with open(profile_path, "w") as f:
+                            json.dump(profile, f, indent=2)
+                y_nulls = int(y_train.isnull().sum())
             # Validación de columnas faltantes
-            missing = [c for c in FEATURES if c not in X_train.columns]
+            missing = [c for c in FEATURES if c not in profile]
             if missing:
                 print(f"⚠️  Warning: faltan columnas esperadas en los datos: {missing}")
-            # Guardar features usadas en MLflow
-            import json
-            with open(f"{SHARED_TMP}/features.json", "w") as f:
-                json.dump(FEATURES, f)
-            mlflow.log_artifact(f"{SHARED_TMP}/features.json", artifact_path="features")
+            mlflow.log_artifact(profile_path, artifact_path="profile")
+            print("Perfil de columnas en X_train:", profile)
             # Revisa NaN
-            assert not X_train.isnull().any().any(), "Hay NaN en X_train"
-            assert not y_train.isnull().any(), "Hay NaN en y_train"
+            assert not any(p["nulls"] for p in profile.values()), "Hay NaN en X_train"
+            assert not y_nulls, "Hay NaN en y_train"
             # Definición de columnas categóricas y numéricas
-            cats = X_train.select_dtypes(include=["object","category"]).columns.tolist()
-            low_card = [c for c in cats if df_train[c].nunique()<=8]
-            high_card= [c for c in cats if df_train[c].nunique()>8]
+            cats = [c for c, p in profile.items() if p["dtype"] in ("object", "category")]
+            low_card = [c for c in cats if profile[c]["nunique"] <= MAX_CARDINALITY]
+            high_card = [c for c in cats if profile[c]["nunique"] > MAX_CARDINALITY]
             if high_card:
                 print(f"Descartando cat cols alta cardinalidad: {high_card}")
             ti.xcom_push("high_card", high_card)
-            X_train = X_train.drop(columns=high_card)
-            num_cols = [c for c in X_train.columns if c not in low_card]
-            print(f"X_train shape: {X_train.shape}, num_cols: {num_cols}, low_card: {low_card}")
-            preproc = ColumnTransformer([
-                ("cat", OneHotEncoder(handle_unknown="ignore", sparse=True), low_card),
-                ("num", StandardScaler(), num_cols),
-            ], remainder="drop")
-            X_train_trans = preproc.fit_transform(X_train)
-            assert X_train_trans.shape[0] == X_train.shape[0]
-            pipe = Pipeline([
-                ("preproc", preproc),
-                ("reg", GammaRegressor(max_iter=200))
-            ])
-            pipe.fit(X_train, y_train)
-            final_features = list(X_train.columns)
-            with open(f"{SHARED_TMP}/final_features.json", "w") as f:
+            final_features = [c for c in FEATURES if c in profile and c not in high_card]
+            num_cols = [c for c in final_features if c not in low_card]
+            print(f"final_features: {final_features}, num_cols: {num_cols}, low_card: {low_card}")
+
+            if streaming:
+                with _timed(timings, "fit"):
+                    preproc = build_streaming_preproc(low_card, categories, num_cols, scaler)
+                    reg, sum_x, n_rows = fit_gamma_streaming(
+                        preproc, iter_xy(ti.run_id, "train", high_card), f"{stage_dir}/train_trans"
+                    )
+                    pipe = Pipeline([
+                        ("preproc", preproc),
+                        ("reg", reg)
+                    ])
+                mean_x = sum_x / n_rows
+                print(f"Streaming fit: {n_rows} filas, {reg.n_iter_} iteraciones L-BFGS")
+            else:
+                X_train = X_train.drop(columns=high_card)
+                # El preproc transforma una vez; la búsqueda y el fit final usan esa matriz
+                with _timed(timings, "preprocess"):
+                    preproc = ColumnTransformer([
+                        ("cat", OneHotEncoder(handle_unknown="ignore", sparse=True), low_card),
+                        ("num", StandardScaler(), num_cols),
+                    ], remainder="drop")
+                    X_train_trans = preproc.fit_transform(X_train)
+                cands = candidates()
+                best = BASELINE
+                if MODEL_SEARCH == "grid":
+                    with _timed(timings, "search"):
+                        best = search_candidates(cands, X_train_trans, y_train, f"{stage_dir}/search")
+                estimator = cands[best]
+                # Fit final del mejor candidato sobre todo train (fit + val)
+                with _timed(timings, "fit"):
+                    reg = clone(estimator).fit(X_train_trans, y_train)
+                    pipe = Pipeline([
+                        ("preproc", preproc),
+                        ("reg", reg)
+                    ])
+                mlflow.log_param("model_candidate", best)
+                mean_x = np.asarray(X_train_trans.mean(axis=0)).ravel()
+                n_rows = X_train_trans.shape[0]
+            with open(f"{stage_dir}/final_features.json", "w") as f:
                 json.dump(final_features, f)
-            mlflow.log_artifact(f"{SHARED_TMP}/final_features.json", artifact_path="features")
-            mlflow_sklearn.log_model(pipe, "model", registered_model_name="my_model")
-            df_test = pd.read_csv(f"{SHARED_TMP}/test.csv")
-            for c in ["street", "city", "state", "status", "zip_code"]:
-                if c in df_test.columns:
-                    df_test[c] = df_test[c].astype(str)
-            X_test = df_test[[col for col in FEATURES if col in df_test.columns]].copy()
-            y_test = df_test["price"]
-            X_test = X_test.drop(columns=high_card, errors="ignore")
-            preds = pipe.predict(X_test)
-            mse = mean_squared_error(y_test, preds)
-            rmse = mse ** 0.5
-            mae = mean_absolute_error(y_test, preds)
-            r2 = r2_score(y_test, preds)
+            mlflow.log_artifact(f"{stage_dir}/final_features.json", artifact_path="features")
+            # Background para SHAP: media de las features transformadas del set de entrenamiento
+            background = {
+                "feature_names": list(preproc.get_feature_names_out()),
+                "mean": mean_x.tolist(),
+                "n_rows": int(n_rows),
+            }
+            with open(f"{stage_dir}/background.json", "w") as f:
+                json.dump(background, f)
+            mlflow.log_artifact(f"{stage_dir}/background.json", artifact_path="shap")
+            with _timed(timings, "log_model"):
+                mlflow_sklearn.log_model(pipe, "model", registered_model_name="my_model")
+            with _timed(timings, "evaluate"):
+                if streaming:
+                    metrics = evaluate_streaming(pipe, iter_xy(ti.run_id, "test", high_card))
+                else:
+                    df_test = read_staging(ti.run_id, "test", columns=FEATURES + [TARGET])
+                    X_test = df_test[[col for col in FEATURES if col in df_test.columns]].copy()
+                    y_test = df_test[TARGET]
+                    X_test = X_test.drop(columns=high_card, errors="ignore")
+                    preds = pipe.predict(X_test)
+                    mse = mean_squared_error(y_test, preds)
+                    metrics = {
+                        "mse": mse,
+                        "rmse": mse ** 0.5,
+                        "mae": mean_absolute_error(y_test, preds),
+                        "r2": r2_score(y_test, preds),
+                    }
             run_name = run.data.tags.get("mlflow.runName", None)
             ti.xcom_push("run_name", run_name)
-            for k, v in {"mse": mse, "rmse": rmse, "mae": mae, "r2": r2}.items():
+            ti.xcom_push("run_id", run.info.run_id)
+            for k, v in metrics.items():
                 mlflow.log_metric(k, v)
+            mlflow.log_param("training_mode", TRAINING_MODE)
+            mlflow.log_metrics({f"time_{stage}_seconds": t for stage, t in timings.items()})
+            print("Tiempos por etapa (s):", {k: round(v, 3) for k, v in timings.items()})
 
     train_and_log = PythonOperator(
         task_id="train_and_log",
         python_callable=train_and_log_fn,
+        execution_timeout=timedelta(minutes=TRAIN_TIMEOUT_MINUTES),
     )
 
     # 4) Evaluación y promoción
     def evaluate_and_promote_fn(ti):
         client = MlflowClient()
         exp    = client.get_experiment_by_name(EXPERIMENT_NAME)
-        run    = client.search_runs([exp.experiment_id], order_by=["attributes.start_time desc"], max_results=1)[0]
+        # El run padre de train_and_log (los candidatos de la búsqueda son runs anidados)
+        run_id = ti.xcom_pull(task_ids="train_and_log", key="run_id")
+        run    = client.get_run(run_id) if run_id else client.search_runs(
+            [exp.experiment_id], order_by=["attributes.start_time desc"], max_results=1)[0]
 
         mv = int(client.search_model_versions(f"name='my_model' and run_id='{run.info.run_id}'")[0].version)
+        prefetch_in_serving(mv, run.info.run_id)
 
         metrics = {k: run.data.metrics[k] for k in ["mse","rmse","mae","r2"]}
-        df_train = pd.read_csv(f"{SHARED_TMP}/train.csv")
-        high_card = [c for c in df_train.select_dtypes(include=["object","category"]).columns if df_train[c].nunique()>8]
-
         prod = client.get_latest_versions("my_model", stages=["Production"])
+        prod_metrics = None
         if prod:
-            prod_pipe = mlflow.sklearn.load_model(prod[0].source)
-            df_test  = pd.read_csv(f"{SHARED_TMP}/test.csv")
-            df_test  = df_test.drop(columns=["price"]+high_card, errors="ignore")
-            y_test   = pd.read_csv(f"{SHARED_TMP}/test.csv")["price"]
-            p2       = prod_pipe.predict(df_test)
-            prod_metrics = {
-                "prod_mse":  mean_squared_error(y_test, p2),
-                "prod_rmse": None,  # lo calculas igual que arriba
-                "prod_mae":  mean_absolute_error(y_test, p2),
-                "prod_r2":   r2_score(y_test, p2)
-            }
-        else:
+            # Caché local por versión + métricas incrementales: solo se puntúan las filas
+            # de test que el campeón (sin cambios) todavía no había visto
+            start = time.perf_counter()
+            prod_pipe, cache_path = load_champion(prod[0])
+            champion, scored = champion_metrics(prod_pipe, cache_path, ti.run_id)
+            if champion is not None:
+                prod_metrics = {f"prod_{k}": v for k, v in champion.items()}
+            print(f"Campeón v{prod[0].version}: {scored} filas de test nuevas puntuadas "
+                  f"en {time.perf_counter() - start:.2f}s")
+        if prod_metrics is None:
             prod_metrics = {"prod_mse":None,"prod_rmse":None,"prod_mae":float("inf"),"prod_r2":float("-inf")}
 
         promoted = metrics["mae"] < prod_metrics["prod_mae"]
@@ -248,22 +991,38 @@ with DAG(
         preproc  = pipeline.named_steps["preproc"]
         reg      = pipeline.named_steps["reg"]
 
-        df_test = pd.read_csv(f"{SHARED_TMP}/test.csv")
-        X_test  = df_test.drop(columns=["price"] + high_card, errors="ignore")
-        if len(X_test) > MAX_SHAP:
-            X_test = X_test.sample(n=MAX_SHAP, random_state=42)
+        columns = [c for c in FEATURES if c not in high_card]
+        if TRAINING_MODE == "streaming":
+            X_test = sample_staging(ti.run_id, "test", columns, MAX_SHAP)
+        else:
+            X_test  = read_staging(ti.run_id, "test", columns=columns)
+            if len(X_test) > MAX_SHAP:
+                X_test = X_test.sample(n=MAX_SHAP, random_state=42)
         X_trans = preproc.transform(X_test)
+        cols = list(preproc.get_feature_names_out())
 
-        explainer = shap.LinearExplainer(reg, X_trans, feature_perturbation="interventional")
-        shap_vals = explainer.shap_values(X_trans)
-        cols = preproc.get_feature_names_out()
-        shap_df = pd.DataFrame(shap_vals, columns=cols)
+        if not hasattr(reg, "coef_"):
+            # train_and_log solo registra GLMs (model_search.pick_winner)
+            raise ValueError(f"compute_shap solo soporta modelos lineales, no {type(reg).__name__}")
+        # SHAP lineal exacto (interventional) contra la media del background
+        shap_vals, offset = linear_shap(
+            X_trans, np.asarray(reg.coef_), shap_background_mean(ti.run_id, preproc, columns)
+        )
 
-        path = f"{SHARED_TMP}/shap_values.parquet"
-        shap_df.to_parquet(path, index=False)
+        stage_dir = _staging_dir(ti.run_id)
+        # Artifact completo + agregados precalculados (la API sirve el resumen sin leer el completo)
+        write_shap_sparse(os.path.join(stage_dir, "shap_sparse.npz"), shap_vals, offset, cols)
+        with open(os.path.join(stage_dir, "shap_summary.json"), "w") as f:
+            json.dump(shap_summary(shap_vals, cols), f)
+        preds = reg.predict(X_trans)
+        rows = stratified_rows(preds, SHAP_SAMPLE_ROWS)
+        sample = pd.DataFrame(shap_vals[rows], columns=cols)
+        sample["prediction"] = preds[rows]
+        sample.to_parquet(os.path.join(stage_dir, "shap_sample.parquet"), index=False)
         with mlflow.start_run(run_id=run_id):
-            mlflow.log_artifact(path, artifact_path="shap_values")
-            shap_uri = mlflow.get_artifact_uri("shap_values/shap_values.parquet")
+            for name in ("shap_sparse.npz", "shap_summary.json", "shap_sample.parquet"):
+                mlflow.log_artifact(os.path.join(stage_dir, name), artifact_path="shap_values")
+            shap_uri = mlflow.get_artifact_uri("shap_values/shap_sparse.npz")
         ti.xcom_push(key="shap_uri", value=shap_uri)
         print("✅ SHAP generado y URI registrada:", shap_uri)
 
@@ -329,6 +1088,21 @@ with DAG(
         python_callable=record_history_fn,
     )
 
+    # 7) Borrar el staging de la corrida (train/test completos) aunque algo haya fallado
+    def cleanup_staging_fn(ti):
+        shutil.rmtree(_staging_dir_path(ti.run_id), ignore_errors=True)
+        print(f"🗑️  Staging de {ti.run_id} eliminado")
+        # Como tarea final con all_done decide el estado de la corrida: no debe ocultar fallas
+        failed = [t.task_id for t in ti.get_dagrun().get_task_instances(state=[State.FAILED, State.UPSTREAM_FAILED])]
+        if failed:
+            raise AirflowFailException(f"La corrida falló en {failed}")
+
+    cleanup_staging = PythonOperator(
+        task_id="cleanup_staging",
+        python_callable=cleanup_staging_fn,
+        trigger_rule="all_done",
+    )
+
     # ─── Flujo de dependencias ────────────────────────────────────────────────
     wait_for_clean \
         >> ensure_history_table \
@@ -336,4 +1110,5 @@ with DAG(
         >> train_and_log \
         >> evaluate_and_promote \
         >> compute_shap \
-        >> record_history
+        >> record_history \
+        >> cleanup_staging
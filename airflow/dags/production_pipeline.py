@@ -9,6 +9,7 @@ from airflow.sensors.external_task import ExternalTaskSensor
 from airflow.exceptions import AirflowSkipException
 from sqlalchemy import create_engine, text
 from mlflow.tracking import MlflowClient
+from partitioning import ensure_partitioned_table, apply_retention
 
 # ─── Configuración ─────────────────────────────────────────────────────────────
 CLEAN_DB_URI    = os.getenv("CLEAN_DB_CONN")
@@ -16,6 +17,7 @@ MLFLOW_MODEL    = "my_model"
 FASTAPI_HOOK    = "http://fastapi:8989/hooks/model_update"
 RAW_SCHEMA      = "raw_data"
 RAW_TABLE       = "inference_logs"
+INFERENCE_LOG_RETENTION_MONTHS = int(os.getenv("INFERENCE_LOG_RETENTION_MONTHS", "0"))  # 0 = sin retención
 
 default_args = {
     "owner": "airflow",
@@ -34,24 +36,29 @@ with DAG(
     tags=["production"],
 ) as dag:
 
-    # 1) Crear la tabla de rawdata si no existe
+    # 1) Crear (o migrar) la tabla de rawdata particionada por mes de requested_at
     def ensure_rawdata_table_fn():
         engine = create_engine(CLEAN_DB_URI)
         with engine.begin() as conn:
             # Crear esquema
             conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {RAW_SCHEMA};"))
-            # Crear tabla
-            conn.execute(text(f"""
-                CREATE TABLE IF NOT EXISTS {RAW_SCHEMA}.{RAW_TABLE} (
-                    id             SERIAL PRIMARY KEY,
+            # Crear tabla (la PK de una tabla particionada debe incluir la llave de partición)
+            ensure_partitioned_table(
+                conn, RAW_SCHEMA, RAW_TABLE,
+                """
+                    id             SERIAL,
                     requested_at   TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
                     model_name     TEXT    NOT NULL,
                     model_version  INTEGER NOT NULL,
                     run_id         TEXT    NOT NULL,
                     input_data     JSONB   NOT NULL,
-                    prediction     JSONB   NOT NULL
-                );
-            """))
+                    prediction     JSONB   NOT NULL,
+                    PRIMARY KEY (id, requested_at)
+                """,
+                "requested_at",
+                serial_columns=["id"],
+            )
+            apply_retention(conn, RAW_SCHEMA, RAW_TABLE, INFERENCE_LOG_RETENTION_MONTHS)
 
     ensure_rawdata_table = PythonOperator(
         task_id="ensure_rawdata_table",
@@ -0,0 +1,120 @@
+"""
+Benchmark de carga a Postgres: execute_values (page_size=1500, el camino anterior del
+DAG) contra copy_records y copy_dataframe de dags/bulk_load.py.
+
+    BENCH_PG_URI=postgresql+psycopg2://user@host/db python bench/bench_bulk_load.py [--sizes 10000,1000000,10000000]
+
+Carga filas sintéticas con el mismo esquema que raw_data en una tabla temporal (se
+recrea en cada medición) y reporta filas/s de cada método. copy_dataframe recibe
+DataFrames de 1M filas y su tiempo no incluye armarlos.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dags"))
+from bulk_load import copy_dataframe, copy_records  # noqa: E402
+
+TABLE = "bench_raw"
+COLUMNS = ["brokered_by", "status", "price", "bed", "bath", "acre_lot", "street",
+           "city", "state", "zip_code", "house_size", "prev_sold_date", "load_date"]
+DDL = f"""
+    DROP TABLE IF EXISTS {TABLE};
+    CREATE TEMP TABLE {TABLE} (
+        brokered_by NUMERIC, status VARCHAR(50), price NUMERIC, bed NUMERIC, bath NUMERIC,
+        acre_lot NUMERIC, street VARCHAR(200), city VARCHAR(100), state VARCHAR(100),
+        zip_code VARCHAR(20), house_size NUMERIC, prev_sold_date DATE, load_date TIMESTAMP NOT NULL
+    )
+"""
+
+
+def rows(n, seed=0, block=100000):
+    """Filas sintéticas con ~5% de faltantes en los numéricos y comas en street."""
+    rng = np.random.default_rng(seed)
+    load_date = datetime(2024, 5, 1)
+    dates = [date(2000, 1, 1) + timedelta(days=d) for d in range(8000)]
+    for offset in range(0, n, block):
+        m = min(block, n - offset)
+        missing = rng.random(m) < 0.05
+        bed = np.where(missing, np.nan, rng.integers(1, 7, m).astype(float)).tolist()
+        acre = np.where(missing, np.nan, rng.random(m).round(3)).tolist()
+        cols = [
+            rng.integers(1, 100000, m).astype(float).tolist(), rng.integers(50000, 2000000, m).astype(float).tolist(),
+            rng.integers(1, 5, m).astype(float).tolist(), rng.integers(400, 5000, m).astype(float).tolist(),
+            rng.integers(0, 8000, m).tolist(),
+        ]
+        for j, (broker, price, bath, size, sold) in enumerate(zip(*cols)):
+            i = offset + j
+            yield (
+                broker, "for_sale", price, None if missing[j] else bed[j], bath,
+                None if missing[j] else acre[j], f"{i} calle {i % 97}, apto {i % 13}",
+                "bogota", "cundinamarca", f"{110000 + i % 999}", size, dates[sold], load_date,
+            )
+
+
+def by_values(cur, n):
+    execute_values(cur, f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) VALUES %s", rows(n), page_size=1500)
+
+
+def by_records(cur, n):
+    copy_records(cur, TABLE, COLUMNS, rows(n))
+
+
+def by_frame(cur, n, block=1000000):
+    # Por bloques, como el DAG con cada chunk de raw: 10M filas en un solo DataFrame no entran en memoria
+    rows_iter, elapsed = rows(n), 0.0
+    for offset in range(0, n, block):
+        df = pd.DataFrame.from_records(rows_iter, columns=COLUMNS, nrows=min(block, n - offset))
+        start = time.perf_counter()
+        copy_dataframe(cur, TABLE, df)
+        elapsed += time.perf_counter() - start   # sin contar la construcción del DataFrame
+    return elapsed
+
+
+METHODS = {"values": by_values, "records": by_records, "frame": by_frame}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,1000000,10000000")
+    parser.add_argument("--methods", default=",".join(METHODS))
+    args = parser.parse_args()
+    uri = os.getenv("BENCH_PG_URI") or os.getenv("TEST_PG_URI")
+    if not uri:
+        sys.exit("Definir BENCH_PG_URI (o TEST_PG_URI)")
+    engine = create_engine(uri)
+
+    methods = args.methods.split(",")
+    print(f"{'filas':>10} {'generación/s':>16} " + " ".join(f"{m + ' filas/s':>16}" for m in methods))
+    for n in (int(s) for s in args.sizes.split(",")):
+        # Costo de solo generar las filas: acota lo que pueden medir values y records
+        start = time.perf_counter()
+        for _ in rows(n):
+            pass
+        results = [n / (time.perf_counter() - start)]
+        for name in methods:
+            conn = engine.raw_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute(DDL)
+                start = time.perf_counter()
+                elapsed = METHODS[name](cur, n)
+                conn.commit()
+                elapsed = elapsed or time.perf_counter() - start
+                cur.execute(f"SELECT count(*) FROM {TABLE}")
+                assert cur.fetchone()[0] == n
+            finally:
+                conn.close()
+            results.append(n / elapsed)
+        print(f"{n:>10} " + " ".join(f"{r:>16,.0f}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark de la limpieza de clean_data: clean_frame con Arrow, clean_frame con el
+camino pandas (sin pyarrow) y la limpieza inline que tenía el DAG antes de cleaning.py.
+
+    python bench/bench_cleaning.py [--rows 1000000] [--repeat 3]
+
+Las columnas de texto mezclan ASCII con espacios/mayúsculas, ~5% de faltantes y ~1%
+de Unicode, como llegan desde raw_data. Reporta filas/s (mediana de las repeticiones).
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dags"))
+import cleaning  # noqa: E402
+from cleaning import clean_frame  # noqa: E402
+
+TEXTS = ["  123 Main St  ", "MAIN ST", "Calle 5 # 10-20", "for_sale", " SOLD", "Bogota", "CUNDINAMARCA"]
+UNICODE = [" Bogotá ", "ÁLVARO", "Straße"]
+ZIPS = ["110111", " 00501 ", "ZIP 11-01", "n/a", "98101-1234"]
+
+
+def frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def column(values):
+        col = rng.choice(np.array(values, dtype=object), n)
+        col[rng.random(n) < 0.01] = rng.choice(np.array(UNICODE, dtype=object))
+        col[rng.random(n) < 0.05] = None
+        return col
+
+    return pd.DataFrame({c: column(TEXTS) for c in ("street", "city", "state", "status")} | {"zip_code": column(ZIPS)})
+
+
+def old_inline(df):
+    df = df.copy()
+    for c in ["street", "city", "state", "status"]:
+        df[c] = df[c].astype(str).str.strip().str.lower()
+    df["zip_code"] = df["zip_code"].astype(str).str.replace(r"\D+", "", regex=True)
+    return df
+
+
+def pandas_fallback(df):
+    pa = cleaning.pa
+    cleaning.pa = None
+    try:
+        return clean_frame(df)
+    finally:
+        cleaning.pa = pa
+
+
+def rows_per_second(fn, df, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(df)
+        runs.append(time.perf_counter() - start)
+    return len(df) / float(np.median(runs))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = frame(args.rows)
+    methods = {"clean_frame (arrow)": clean_frame, "clean_frame (pandas)": pandas_fallback, "inline anterior": old_inline}
+    if cleaning.pa is None:
+        print("⚠️  pyarrow no está instalado: la primera fila también usa el camino pandas")
+    for name, fn in methods.items():
+        print(f"{name:<22} {rows_per_second(fn, df, args.repeat):>12,.0f} filas/s")
+
+
+if __name__ == "__main__":
+    main()
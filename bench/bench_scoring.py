@@ -0,0 +1,57 @@
+"""
+Microbenchmark del scoring de un registro: camino pandas (DataFrame + reindex +
+Pipeline.predict) contra CompiledLinearScorer.predict_one.
+
+    python bench/bench_scoring.py [--records 2000] [--repeat 5]
+
+Usa el mismo Pipeline que el DAG de modelado (OneHotEncoder + StandardScaler + GLM)
+sobre datos sintéticos; reporta µs por registro (mediana de las repeticiones) y la
+máxima diferencia relativa entre ambos caminos.
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+
+import numpy as np
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), p)
+                for p in ("FastAPI", "tests")]
+from app.scoring import compile_pipeline  # noqa: E402
+from test_scoring import FEATURES, REGRESSORS, houses, pandas_path, pipeline  # noqa: E402
+
+
+def per_record_us(fn, records, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for r in records:
+            fn(r)
+        runs.append((time.perf_counter() - start) / len(records) * 1e6)
+    return float(np.median(runs))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")   # FutureWarning de sparse= y categorías desconocidas
+
+    X, y = houses(20000)
+    records = houses(args.records, seed=1)[0].to_dict("records")
+    print(f"{'modelo':<16} {'pandas µs':>10} {'compilado µs':>13} {'speedup':>8} {'max rel diff':>13}")
+    for name, make in REGRESSORS.items():
+        pipe = pipeline(make()).fit(X, y)
+        scorer = compile_pipeline(pipe, FEATURES)
+        slow = per_record_us(lambda r: pandas_path(pipe, r), records, args.repeat)
+        fast = per_record_us(scorer.predict_one, records, args.repeat)
+        expected = np.array([pandas_path(pipe, r) for r in records[:500]])
+        got = np.array([scorer.predict_one(r) for r in records[:500]])
+        diff = float(np.max(np.abs(got - expected) / np.abs(expected)))
+        print(f"{name:<16} {slow:>10.1f} {fast:>13.2f} {slow / fast:>7.0f}x {diff:>13.2e}")
+
+
+if __name__ == "__main__":
+    main()
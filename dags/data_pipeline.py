@@ -1,17 +1,30 @@
 import os
+import time
 from datetime import datetime, timedelta
+from itertools import islice
 import requests
+import numpy as np
 import pandas as pd
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.providers.postgres.operators.postgres import PostgresOperator
 from airflow.providers.postgres.hooks.postgres import PostgresHook
-from psycopg2.extras import execute_values
 from sqlalchemy import create_engine, text
 from airflow.exceptions import AirflowSkipException
-from sklearn.model_selection import train_test_split
+from bulk_load import copy_dataframe, copy_records
+from cleaning import clean_frame
+from partitioning import ensure_partitioned_table, apply_retention, relkind
 
-BATCH_SIZE = 1500
+try:
+    import ijson  # parser JSON incremental para la ingesta en streaming
+except ImportError:
+    ijson = None
+
+RAW_INGEST_MODE = os.getenv("RAW_INGEST_MODE", "stream")   # stream | batch
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "5000"))
+CLEAN_CHUNK_ROWS = int(os.getenv("CLEAN_CHUNK_ROWS", "50000"))
+SPLIT_TEST_RATIO = float(os.getenv("SPLIT_TEST_RATIO", "0.3"))
+SPLIT_BUCKETS = 10000
 RAW_DB_URI = os.getenv("RAW_DB_CONN")
 CLEAN_DB_URI = os.getenv("CLEAN_DB_CONN")  
 API_URL = os.getenv("DB_GET_DATA")
@@ -20,6 +33,255 @@ SCHEMA_RAW     = "raw_data"
 SCHEMA_CLEAN   = "clean_data"
 TABLE_NAME = "raw_data_init"
 TABLE_NAME_CLEAN = "clean_data_init"
+TABLE_WATERMARKS = "pipeline_watermarks"
+STAGE_CLEAN = "transform_and_load_clean"
+STAGE_CLEAN_COMPLETE = "clean_complete"
+RAW_COLUMNS = [
+    "brokered_by", "status", "price", "bed", "bath", "acre_lot", "street",
+    "city", "state", "zip_code", "house_size", "prev_sold_date", "load_date",
+]
+NUMERIC_COLUMNS = ["brokered_by", "price", "bed", "bath", "acre_lot", "house_size"]
+# Hash del contenido (sin load_date): la misma fila re-ingerida es un duplicado.
+# Se calcula en Postgres sobre los valores ya tipados. NUMERIC conserva la escala con que
+# llegó el texto ('3' vs '3.0', según pandas/ijson), así que se normaliza con trim_scale.
+ROW_HASH_SQL = "md5(" + " || '|' || ".join(
+    f"coalesce({f'trim_scale({c})' if c in NUMERIC_COLUMNS else c}::text, '\\N')"
+    for c in RAW_COLUMNS if c != "load_date"
+) + ")"
+ROW_HASH_VERSION = 2   # se guarda como comentario de raw_data_keys; al cambiar se re-hashea raw
+RAW_STAGE = "raw_stage"
+TABLE_KEYS = "raw_data_keys"
+RAW_RETENTION_MONTHS = int(os.getenv("RAW_RETENTION_MONTHS", "0"))      # 0 = sin retención
+CLEAN_RETENTION_MONTHS = int(os.getenv("CLEAN_RETENTION_MONTHS", "0"))
+
+_DATA_COLUMNS_DDL = """
+    brokered_by     NUMERIC,
+    status          VARCHAR(50),
+    price           NUMERIC,
+    bed             NUMERIC,
+    bath            NUMERIC,
+    acre_lot        NUMERIC,
+    street          VARCHAR(200),
+    city            VARCHAR(100),
+    state           VARCHAR(100),
+    zip_code        VARCHAR(20),
+    house_size      NUMERIC,
+    prev_sold_date  DATE,
+    load_date       TIMESTAMP NOT NULL"""
+RAW_TABLE_DDL = _DATA_COLUMNS_DDL + """,
+    raw_id          BIGSERIAL,
+    row_hash        CHAR(32)"""
+CLEAN_TABLE_DDL = _DATA_COLUMNS_DDL + """,
+    split           VARCHAR(10) NOT NULL"""
+
+class _CountingReader:
+    """Envuelve el stream HTTP para contar los bytes leídos."""
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _get_watermark(conn, stage):
+    """
+    (processed_through, last_raw_id) de la etapa, o (None, None) si nunca corrió.
+    last_raw_id es None cuando processed_through quedó procesado completo; si no,
+    la etapa se cortó a mitad de ese load_date y se retoma desde raw_id > last_raw_id.
+    """
+    row = conn.execute(
+        text(f"""
+            SELECT processed_through, last_raw_id
+              FROM {SCHEMA_CLEAN}.{TABLE_WATERMARKS}
+             WHERE stage = :stage
+        """),
+        {"stage": stage},
+    ).first()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def _set_watermark(cur, stage, processed_through, last_raw_id=None):
+    """Upsert del watermark; se llama dentro de la misma transacción que la carga."""
+    cur.execute(
+        f"""
+        INSERT INTO {SCHEMA_CLEAN}.{TABLE_WATERMARKS} (stage, processed_through, last_raw_id, updated_at)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (stage) DO UPDATE
+           SET processed_through = EXCLUDED.processed_through,
+               last_raw_id       = EXCLUDED.last_raw_id,
+               updated_at        = EXCLUDED.updated_at
+        """,
+        (stage, processed_through, last_raw_id),
+    )
+
+
+def _clean_chunk(df):
+    """Limpieza avanzada + partición train/test de un chunk de raw."""
+    df = clean_frame(df)
+    df = df[
+        (df["price"] >= 0) &
+        (df["house_size"] >= 0) &
+        (df["acre_lot"] >= 0) &
+        (pd.to_datetime(df["prev_sold_date"], errors="coerce") <= df["load_date"])
+    ].copy()
+    df["split"] = _assign_split(df)
+    return df
+
+
+def _assign_split(df):
+    """
+    Split determinístico por fila: hash de la llave (brokered_by, street, zip_code,
+    prev_sold_date) → bucket en [0, SPLIT_BUCKETS). La misma casa cae siempre en el
+    mismo split, sin importar en qué corrida o chunk llegue.
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    broker = pd.to_numeric(df["brokered_by"], errors="coerce").round().astype("Int64").astype(str)
+    sold = pd.to_datetime(df["prev_sold_date"], errors="coerce").dt.strftime("%Y-%m-%d").fillna("")
+    key = broker + "|" + df["street"].astype(str) + "|" + df["zip_code"].astype(str) + "|" + sold
+    buckets = pd.util.hash_pandas_object(key, index=False).to_numpy() % SPLIT_BUCKETS
+    return pd.Series(
+        np.where(buckets < SPLIT_TEST_RATIO * SPLIT_BUCKETS, "test", "train"), index=df.index
+    )
+
+
+def _upgrade_legacy_raw(conn):
+    """Columnas agregadas a la tabla raw original (no particionada) antes de migrarla."""
+    conn.execute(text(f"""
+        ALTER TABLE {SCHEMA_RAW}.{TABLE_NAME} ADD COLUMN IF NOT EXISTS raw_id BIGSERIAL;
+        ALTER TABLE {SCHEMA_RAW}.{TABLE_NAME} ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
+    """))
+    # Hash de las filas existentes y dedup, si no se hizo ya
+    exists = conn.execute(
+        text("SELECT to_regclass(:idx)"), {"idx": f"{SCHEMA_RAW}.{TABLE_NAME}_row_hash_key"}
+    ).scalar()
+    if exists is None:
+        conn.execute(text(f"""
+            UPDATE {SCHEMA_RAW}.{TABLE_NAME} SET row_hash = {ROW_HASH_SQL} WHERE row_hash IS NULL
+        """))
+        removed = conn.execute(text(f"""
+            DELETE FROM {SCHEMA_RAW}.{TABLE_NAME} a
+             USING {SCHEMA_RAW}.{TABLE_NAME} b
+             WHERE a.row_hash = b.row_hash AND a.raw_id > b.raw_id
+        """)).rowcount
+        conn.execute(text(f"""
+            CREATE UNIQUE INDEX {TABLE_NAME}_row_hash_key ON {SCHEMA_RAW}.{TABLE_NAME} (row_hash)
+        """))
+        print(f"✅ {removed} filas duplicadas eliminadas de raw")
+
+
+def _ensure_raw_keys(conn):
+    """
+    Un índice único sobre una tabla particionada debe incluir load_date, así que la
+    unicidad global de row_hash vive en una tabla de llaves aparte (sin particionar).
+    """
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_RAW}.{TABLE_KEYS} (
+            row_hash   CHAR(32) PRIMARY KEY,
+            load_date  TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS {TABLE_KEYS}_load_date_brin
+            ON {SCHEMA_RAW}.{TABLE_KEYS} USING brin (load_date);
+    """))
+
+
+def _rehash_raw(conn):
+    """
+    Si los row_hash guardados son de otra versión de ROW_HASH_SQL (p. ej. sin trim_scale),
+    elimina las filas que ahora resultan duplicadas (se queda la de menor raw_id),
+    recalcula los hashes y reconstruye raw_data_keys. Una sola vez por versión.
+    """
+    marker = f"row_hash v{ROW_HASH_VERSION}"
+    current = conn.execute(
+        text("SELECT obj_description(CAST(:rel AS regclass), 'pg_class')"),
+        {"rel": f"{SCHEMA_RAW}.{TABLE_KEYS}"},
+    ).scalar()
+    if current == marker:
+        return
+    removed = conn.execute(text(f"""
+        DELETE FROM {SCHEMA_RAW}.{TABLE_NAME} t
+         USING (
+            SELECT raw_id, load_date
+              FROM (SELECT raw_id, load_date,
+                           row_number() OVER (PARTITION BY {ROW_HASH_SQL} ORDER BY raw_id) AS rn
+                      FROM {SCHEMA_RAW}.{TABLE_NAME}) s
+             WHERE rn > 1
+         ) d
+         WHERE t.raw_id = d.raw_id AND t.load_date = d.load_date
+    """)).rowcount
+    updated = conn.execute(text(f"""
+        UPDATE {SCHEMA_RAW}.{TABLE_NAME} SET row_hash = {ROW_HASH_SQL}
+         WHERE row_hash IS DISTINCT FROM {ROW_HASH_SQL}
+    """)).rowcount
+    conn.execute(text(f"""
+        TRUNCATE {SCHEMA_RAW}.{TABLE_KEYS};
+        INSERT INTO {SCHEMA_RAW}.{TABLE_KEYS} (row_hash, load_date)
+        SELECT row_hash, load_date FROM {SCHEMA_RAW}.{TABLE_NAME}
+         WHERE row_hash IS NOT NULL
+        ON CONFLICT (row_hash) DO NOTHING;
+        COMMENT ON TABLE {SCHEMA_RAW}.{TABLE_KEYS} IS '{marker}';
+    """))
+    print(f"✅ row_hash {marker}: {updated} hashes recalculados, {removed} duplicados eliminados de raw")
+
+
+def _create_raw_stage(cur):
+    """Tabla temporal (se borra al commit) con las columnas de raw, destino del COPY."""
+    cur.execute(f"""
+        CREATE TEMP TABLE {RAW_STAGE} ON COMMIT DROP AS
+        SELECT {','.join(RAW_COLUMNS)} FROM {SCHEMA_RAW}.{TABLE_NAME} WITH NO DATA
+    """)
+
+
+def _merge_raw_stage(cur):
+    """
+    Pasa staging → raw solo con las filas cuyo row_hash se pudo registrar en la tabla
+    de llaves (es decir, no existía). Devuelve filas insertadas.
+    """
+    cols = ",".join(RAW_COLUMNS)
+    cur.execute(f"""
+        WITH staged AS (
+            SELECT DISTINCT ON (row_hash) *
+              FROM (SELECT {cols}, {ROW_HASH_SQL} AS row_hash FROM {RAW_STAGE}) s
+        ), new_keys AS (
+            INSERT INTO {SCHEMA_RAW}.{TABLE_KEYS} (row_hash, load_date)
+            SELECT row_hash, load_date FROM staged
+            ON CONFLICT (row_hash) DO NOTHING
+            RETURNING row_hash
+        )
+        INSERT INTO {SCHEMA_RAW}.{TABLE_NAME} ({cols}, row_hash)
+        SELECT {cols}, row_hash FROM staged JOIN new_keys USING (row_hash)
+    """)
+    return cur.rowcount
+
+
+def _ingest_stats(rows, n_bytes, started, inserted=0):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    stats = {
+        "rows": rows,
+        "inserted": inserted,
+        "duplicates": rows - inserted,
+        "bytes": n_bytes,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1),
+        "bytes_per_sec": round(n_bytes / elapsed, 1),
+    }
+    print(f"✅ Ingesta raw: {rows} filas ({inserted} nuevas, {stats['duplicates']} duplicadas), "
+          f"{n_bytes} bytes en {stats['seconds']}s "
+          f"({stats['rows_per_sec']} filas/s, {stats['bytes_per_sec']} bytes/s)")
+    return stats
+
 
 default_args = {
     "owner": "airflow",
@@ -45,39 +307,61 @@ with DAG(
             conn.execute(text(ddl))
 
     def create_table_raw():
-        """Crea tabla si no existen."""
-        engine = create_engine(RAW_DB_URI)
-        ddl = f"""
-        CREATE SCHEMA IF NOT EXISTS {SCHEMA_RAW};
-        CREATE TABLE IF NOT EXISTS {SCHEMA_RAW}.{TABLE_NAME} (
-            brokered_by     NUMERIC,
-            status          VARCHAR(50),
-            price           NUMERIC,
-            bed             NUMERIC,
-            bath            NUMERIC,
-            acre_lot        NUMERIC,
-            street          VARCHAR(200),
-            city            VARCHAR(100),
-            state           VARCHAR(100),
-            zip_code        VARCHAR(20),
-            house_size      NUMERIC,
-            prev_sold_date  DATE,
-            load_date       TIMESTAMP NOT NULL
-        );
         """
+        Crea (o migra) raw_data_init particionada por mes de load_date, el registro de
+        llaves para el dedup y aplica la retención (RAW_RETENTION_MONTHS).
+        """
+        engine = create_engine(RAW_DB_URI)
         with engine.begin() as conn:
-            conn.execute(text(ddl))
-    
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_RAW};"))
+            if relkind(conn, SCHEMA_RAW, TABLE_NAME) == "r":
+                _upgrade_legacy_raw(conn)
+
+            status = ensure_partitioned_table(
+                conn, SCHEMA_RAW, TABLE_NAME, RAW_TABLE_DDL, "load_date",
+                indexes=[
+                    # BRIN: load_date crece con cada inserción, el índice es mínimo y acota los rangos
+                    f"""CREATE INDEX IF NOT EXISTS {TABLE_NAME}_load_date_brin
+                            ON {SCHEMA_RAW}.{TABLE_NAME} USING brin (load_date)""",
+                ],
+                serial_columns=["raw_id"],
+            )
+            _ensure_raw_keys(conn)
+            if status == "migrated":
+                conn.execute(text(f"""
+                    INSERT INTO {SCHEMA_RAW}.{TABLE_KEYS} (row_hash, load_date)
+                    SELECT row_hash, load_date FROM {SCHEMA_RAW}.{TABLE_NAME}
+                     WHERE row_hash IS NOT NULL
+                    ON CONFLICT (row_hash) DO NOTHING
+                """))
+            _rehash_raw(conn)
+
+            cutoff = apply_retention(conn, SCHEMA_RAW, TABLE_NAME, RAW_RETENTION_MONTHS)
+            if cutoff is not None:
+                conn.execute(
+                    text(f"DELETE FROM {SCHEMA_RAW}.{TABLE_KEYS} WHERE load_date < :cutoff"),
+                    {"cutoff": cutoff},
+                )
+
     def load_raw_batch():
         """
         1) Llama a la API y obtiene el JSON.
-        2) Construye un DataFrame solo con payload["data"].
-        3) Abre una conexión psycopg2 vía engine.raw_connection()
-           y vuela el DataFrame en batch con execute_values.
+        2) En modo stream (por defecto) parsea payload["data"] incrementalmente con ijson
+           y escribe chunks de INGEST_CHUNK_ROWS filas, con memoria acotada.
+           En modo batch construye un DataFrame con todo payload["data"].
+        3) Carga con COPY (bulk_load) a una tabla staging temporal y la pasa a raw solo
+           con los row_hash nuevos (registro raw_data_keys con ON CONFLICT DO NOTHING), en
+           una sola transacción: los reintentos y páginas solapadas de la API no duplican filas.
+        Devuelve (XCom) filas recibidas, nuevas, duplicadas, bytes y throughput de la corrida.
         """
+        streaming = RAW_INGEST_MODE == "stream" and ijson is not None
+        if RAW_INGEST_MODE == "stream" and ijson is None:
+            print("⚠️  ijson no está instalado; se usa la ingesta en memoria (batch)")
+
+        started = time.perf_counter()
         # Traer datos de la API (timeout 5 min)
         try:
-             resp = requests.get(API_URL, timeout=300)
+             resp = requests.get(API_URL, timeout=300, stream=streaming)
              resp.raise_for_status()
         except requests.exceptions.HTTPError as e:
              if e.response is not None and e.response.status_code == 400:
@@ -85,32 +369,54 @@ with DAG(
                  raise AirflowSkipException("API devolvió 400 – ya no hay datos nuevos")
              else:
                  raise
-        payload = resp.json()
 
-        records = payload.get("data", [])
-        if not records:
-            return
+        load_date = datetime.utcnow()
+        engine = create_engine(RAW_DB_URI)
 
-        df = pd.DataFrame(records)
-        df["load_date"] = datetime.utcnow()
+        if not streaming:
+            payload = resp.json()
+            records = payload.get("data", [])
+            if not records:
+                return _ingest_stats(0, len(resp.content), started)
 
-        engine = create_engine(RAW_DB_URI)
+            df = pd.DataFrame(records)
+            df["load_date"] = load_date
+
+            raw_conn = engine.raw_connection()
+            try:
+                cur = raw_conn.cursor()
+                _create_raw_stage(cur)
+                copy_dataframe(cur, RAW_STAGE, df)
+                inserted = _merge_raw_stage(cur)
+                raw_conn.commit()
+            finally:
+                cur.close()
+                raw_conn.close()
+            return _ingest_stats(len(df), len(resp.content), started, inserted)
+
+        # Modo stream: nunca se tiene el payload completo en memoria
+        resp.raw.decode_content = True
+        reader = _CountingReader(resp.raw)
+        records = ijson.items(reader, "data.item", use_float=True)
+
+        rows = 0
         raw_conn = engine.raw_connection()
+        cur = raw_conn.cursor()
         try:
-            cur = raw_conn.cursor()
-            cols = list(df.columns)
-            insert_sql = f"""
-                INSERT INTO {SCHEMA_RAW}.{TABLE_NAME} ({','.join(cols)})
-                VALUES %s
-            """
-            values = [
-                tuple(row) for row in df[cols].itertuples(index=False, name=None)
-            ]
-            execute_values(cur, insert_sql, values, page_size=BATCH_SIZE)
+            _create_raw_stage(cur)
+            cols = None
+            for chunk in _chunks(records, INGEST_CHUNK_ROWS):
+                if cols is None:
+                    cols = [c for c in chunk[0].keys() if c != "load_date"]
+                values = (tuple(r.get(c) for c in cols) + (load_date,) for r in chunk)
+                rows += copy_records(cur, RAW_STAGE, cols + ["load_date"], values)
+            inserted = _merge_raw_stage(cur)
             raw_conn.commit()
         finally:
             cur.close()
             raw_conn.close()
+            resp.close()
+        return _ingest_stats(rows, reader.bytes_read, started, inserted)
 
     def create_schema_clean():
         engine = create_engine(CLEAN_DB_URI)
@@ -119,93 +425,113 @@ with DAG(
             conn.execute(text(ddl))
     
     def create_table_clean():
-        """Crea la tabla clean_data.clean_data_init si no existe."""
-        engine = create_engine(CLEAN_DB_URI)
-        ddl = f"""
-        CREATE SCHEMA IF NOT EXISTS {SCHEMA_CLEAN};
-        CREATE TABLE IF NOT EXISTS {SCHEMA_CLEAN}.{TABLE_NAME_CLEAN} (
-            brokered_by     NUMERIC,
-            status          VARCHAR(50),
-            price           NUMERIC,
-            bed             NUMERIC,
-            bath            NUMERIC,
-            acre_lot        NUMERIC,
-            street          VARCHAR(200),
-            city            VARCHAR(100),
-            state           VARCHAR(100),
-            zip_code        VARCHAR(20),
-            house_size      NUMERIC,
-            prev_sold_date  DATE,
-            load_date       TIMESTAMP NOT NULL,
-            split           VARCHAR(10) NOT NULL
-        );
         """
+        Crea (o migra) clean_data_init particionada por mes de load_date, la tabla de
+        watermarks y aplica la retención (CLEAN_RETENTION_MONTHS).
+        """
+        engine = create_engine(CLEAN_DB_URI)
         with engine.begin() as conn:
-            conn.execute(text(ddl))
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_CLEAN};"))
+            ensure_partitioned_table(
+                conn, SCHEMA_CLEAN, TABLE_NAME_CLEAN, CLEAN_TABLE_DDL, "load_date",
+                indexes=[
+                    f"""CREATE INDEX IF NOT EXISTS {TABLE_NAME_CLEAN}_load_date_brin
+                            ON {SCHEMA_CLEAN}.{TABLE_NAME_CLEAN} USING brin (load_date)""",
+                ],
+            )
+            apply_retention(conn, SCHEMA_CLEAN, TABLE_NAME_CLEAN, CLEAN_RETENTION_MONTHS)
+            conn.execute(text(f"""
+                -- Hasta qué load_date de raw procesó cada etapa (incluye filas descartadas por los filtros)
+                CREATE TABLE IF NOT EXISTS {SCHEMA_CLEAN}.{TABLE_WATERMARKS} (
+                    stage             VARCHAR(100) PRIMARY KEY,
+                    processed_through TIMESTAMP NOT NULL,
+                    last_raw_id       BIGINT,
+                    updated_at        TIMESTAMP NOT NULL DEFAULT now()
+                );
+                ALTER TABLE {SCHEMA_CLEAN}.{TABLE_WATERMARKS} ADD COLUMN IF NOT EXISTS last_raw_id BIGINT;
+            """))
 
     def transform_and_load_clean():
-        """Lee raw, filtra por load_date nuevo, limpia, particiona y carga en clean_data."""
+        """
+        Procesa el rango (watermark, max(load_date) de raw] por chunks de CLEAN_CHUNK_ROWS
+        filas leídos con un cursor server-side, en orden (load_date, raw_id). Cada chunk
+        se limpia, particiona y carga con COPY, y el watermark avanza en la misma
+        transacción (aunque todas sus filas queden filtradas). Si la tarea falla, el
+        reintento retoma desde el último chunk confirmado; la memoria queda acotada
+        al tamaño del chunk sin importar cuánto atraso haya.
+        """
         engine_c = create_engine(CLEAN_DB_URI)
-        # 1) última fecha procesada en clean_data
+        # 1) hasta dónde se procesó; la primera vez se toma de la tabla clean (migración)
         with engine_c.connect() as conn_c:
-            result = conn_c.execute(text(f"""
-                SELECT MAX(load_date) AS maxd
-                  FROM {SCHEMA_CLEAN}.{TABLE_NAME_CLEAN}
-            """))
-            max_date = result.scalar()
+            watermark, last_raw_id = _get_watermark(conn_c, STAGE_CLEAN)
+            if watermark is None:
+                watermark = conn_c.execute(text(f"""
+                    SELECT MAX(load_date) AS maxd
+                      FROM {SCHEMA_CLEAN}.{TABLE_NAME_CLEAN}
+                """)).scalar()
+
+        # Filas posteriores al watermark: load_date mayor, o el mismo load_date con raw_id mayor
+        pending = "(load_date > %(lower)s OR (load_date = %(lower)s AND raw_id > %(last_id)s))"
+        params = {
+            "lower": watermark or datetime.min,
+            "last_id": last_raw_id if last_raw_id is not None else 2 ** 63 - 1,
+        }
 
         engine_r = create_engine(RAW_DB_URI)
-        # 2) leo sólo raws nuevos, usando raw_connection para pandas
         raw_conn = engine_r.raw_connection()
+        conn_c = engine_c.raw_connection()
+        n_read = n_loaded = n_chunks = 0
         try:
-            if max_date:
-                df = pd.read_sql_query(
-                    f"SELECT * FROM {SCHEMA_RAW}.{TABLE_NAME} WHERE load_date > %s",
-                    con=raw_conn,
-                    params=[max_date],
-                )
-            else:
-                df = pd.read_sql_query(
-                    f"SELECT * FROM {SCHEMA_RAW}.{TABLE_NAME}",
-                    con=raw_conn,
-                )
-        finally:
-            raw_conn.close()
+            # 2) cota superior fija para esta corrida (usa el BRIN)
+            cur_r = raw_conn.cursor()
+            cur_r.execute(f"SELECT MAX(load_date) FROM {SCHEMA_RAW}.{TABLE_NAME} WHERE {pending}", params)
+            upper = cur_r.fetchone()[0]
+            cur_r.close()
+            if upper is None:
+                print(f"✅ Sin filas nuevas en raw después de {watermark}")
+                return
+            params["upper"] = upper
 
-        if df.empty:
-            return
+            # 3) cursor server-side: Postgres entrega de a CLEAN_CHUNK_ROWS filas
+            cur_r = raw_conn.cursor(name="transform_and_load_clean")
+            cur_r.execute(
+                f"""
+                SELECT {','.join(RAW_COLUMNS)}, raw_id
+                  FROM {SCHEMA_RAW}.{TABLE_NAME}
+                 WHERE {pending} AND load_date <= %(upper)s
+                 ORDER BY load_date, raw_id
+                """,
+                params,
+            )
+            cur_c = conn_c.cursor()
+            while True:
+                rows = cur_r.fetchmany(CLEAN_CHUNK_ROWS)
+                if not rows:
+                    break
+                chunk = pd.DataFrame.from_records(rows, columns=RAW_COLUMNS + ["raw_id"], coerce_float=True)
+                last_load_date, last_id = rows[-1][-2], rows[-1][-1]
 
-        # 3) limpieza avanzada
-        for c in ["street", "city", "state", "status"]:
-            df[c] = df[c].astype(str).str.strip().str.lower()
-        df["zip_code"] = df["zip_code"].astype(str).str.replace(r"\D+", "", regex=True)
-        df = df[
-            (df["price"] >= 0) &
-            (df["house_size"] >= 0) &
-            (df["acre_lot"] >= 0) &
-            (pd.to_datetime(df["prev_sold_date"], errors="coerce") <= df["load_date"])
-        ]
-
-        # 4) partición train/test
-        df["split"] = "train"
-        _, test_idx = train_test_split(df.index, test_size=0.3, random_state=42)
-        df.loc[test_idx, "split"] = "test"
-
-        # 5) vuelco en batches al clean_data
-        conn_c = engine_c.raw_connection()
-        try:
-            cur = conn_c.cursor()
-            cols = list(df.columns)
-            insert_sql = f"""
-                INSERT INTO {SCHEMA_CLEAN}.{TABLE_NAME_CLEAN}
-                ({','.join(cols)}) VALUES %s
-            """
-            values = [tuple(r) for r in df[cols].itertuples(index=False, name=None)]
-            execute_values(cur, insert_sql, values, page_size=BATCH_SIZE)
+                df = _clean_chunk(chunk.drop(columns="raw_id"))
+                if not df.empty:
+                    copy_dataframe(cur_c, f"{SCHEMA_CLEAN}.{TABLE_NAME_CLEAN}", df)
+                _set_watermark(cur_c, STAGE_CLEAN, last_load_date, last_id)
+                conn_c.commit()
+
+                n_read += len(rows)
+                n_loaded += len(df)
+                n_chunks += 1
+                print(f"   chunk {n_chunks}: {len(rows)} filas leídas, {len(df)} cargadas (hasta {last_load_date})")
+            cur_r.close()
+
+            # 4) corrida completa: el rango quedó cerrado hasta upper
+            _set_watermark(cur_c, STAGE_CLEAN, upper)
+            _set_watermark(cur_c, STAGE_CLEAN_COMPLETE, upper)
             conn_c.commit()
+            cur_c.close()
         finally:
-            cur.close()
+            raw_conn.close()
             conn_c.close()
+        print(f"✅ Clean: {n_read} filas leídas, {n_loaded} cargadas en {n_chunks} chunks, watermark → {upper}")
 
     t1 = PythonOperator(
         task_id="create_schema_raw",
@@ -0,0 +1,156 @@
+"""
+Búsqueda paralela de modelos candidatos para el DAG de modelado.
+
+Se importa desde los DAGs (la carpeta dags está en el sys.path de Airflow):
+
+    from model_search import candidates, pick_winner, prepare_search, run_search
+
+- Solo pueden ganar los GLMs (explainable): la API los sirve con el scorer compilado y
+  SHAP lineal, y compute_shap calcula su SHAP exacto. Los ensambles de árboles se
+  entrenan solo si se piden por nombre en SEARCH_CANDIDATES, como referencia.
+- prepare_search separa la matriz ya transformada en "fit" / "val" y la guarda como .npy
+  (densa o CSR: data/indices/indptr). Los workers la abren con np.load(mmap_mode="r"),
+  así todos comparten las páginas del mismo archivo en lugar de recibir una copia por pickle.
+- run_search entrena cada candidato en un ProcessPoolExecutor (SEARCH_WORKERS procesos)
+  sobre "fit" y lo evalúa en "val". Un candidato que falla queda con su error y no
+  detiene la búsqueda.
+"""
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import clone
+from sklearn.linear_model import GammaRegressor, PoissonRegressor, TweedieRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+
+SEARCH_WORKERS           = int(os.getenv("SEARCH_WORKERS", "0")) or os.cpu_count()   # 0 = todos los cores
+SEARCH_CANDIDATES        = os.getenv("SEARCH_CANDIDATES", "")    # nombres separados por coma; vacío = los GLMs
+SEARCH_VALIDATION_RATIO  = float(os.getenv("SEARCH_VALIDATION_RATIO", "0.2"))
+
+BASELINE = "gamma_alpha1"   # el modelo que entrenaba el DAG antes de la búsqueda
+
+
+def candidates(names=SEARCH_CANDIDATES):
+    """
+    Grilla de candidatos: nombre → estimador sin entrenar (siempre incluye BASELINE).
+    Sin nombres se usan solo los explicables; los árboles hay que pedirlos explícitamente.
+    """
+    grid = {
+        BASELINE:               GammaRegressor(alpha=1.0, max_iter=200),
+        "gamma_alpha0.01":      GammaRegressor(alpha=0.01, max_iter=200),
+        "gamma_alpha0":         GammaRegressor(alpha=0.0, max_iter=200),
+        "tweedie_p1.5_log":     TweedieRegressor(power=1.5, link="log", alpha=0.01, max_iter=200),
+        "inverse_gaussian_log": TweedieRegressor(power=3, link="log", alpha=0.01, max_iter=200),
+        "poisson_log":          PoissonRegressor(alpha=0.01, max_iter=200),
+        "normal_identity":      TweedieRegressor(power=0, link="identity", alpha=0.01, max_iter=200),
+        "hgb_gamma":            HistGradientBoostingRegressor(loss="gamma", max_iter=200, random_state=42),
+        "random_forest":        RandomForestRegressor(n_estimators=100, min_samples_leaf=20, max_samples=0.5,
+                                                      n_jobs=1, random_state=42),
+    }
+    wanted = [n.strip() for n in names.split(",") if n.strip()] if names else [n for n in grid if explainable(grid[n])]
+    unknown = [n for n in wanted if n not in grid]
+    if unknown:
+        raise ValueError(f"SEARCH_CANDIDATES desconocidos: {unknown} (opciones: {list(grid)})")
+    return {n: grid[n] for n in grid if n in wanted or n == BASELINE}
+
+
+def explainable(estimator):
+    """GLMs: coef_ + link, que es lo que soportan el scorer compilado y el SHAP lineal."""
+    return isinstance(estimator, (GammaRegressor, PoissonRegressor, TweedieRegressor))
+
+
+def needs_dense(estimator):
+    """Los HistGradientBoosting no aceptan matrices sparse."""
+    return isinstance(estimator, HistGradientBoostingRegressor)
+
+
+def _save(array_dir, part, X, y):
+    if sp.issparse(X):
+        X = sp.csr_matrix(X)
+        for name in ("data", "indices", "indptr"):
+            np.save(os.path.join(array_dir, f"{part}_X_{name}.npy"), getattr(X, name))
+    else:
+        np.save(os.path.join(array_dir, f"{part}_X.npy"), np.ascontiguousarray(X, dtype=np.float64))
+    np.save(os.path.join(array_dir, f"{part}_y.npy"), np.asarray(y, dtype=np.float64))
+    return {"shape": list(X.shape), "sparse": sp.issparse(X)}
+
+
+def load_part(array_dir, part):
+    """(X, y) memory-mapped de solo lectura."""
+    with open(os.path.join(array_dir, "meta.json")) as f:
+        meta = json.load(f)[part]
+
+    def load(name):
+        return np.load(os.path.join(array_dir, f"{part}_{name}.npy"), mmap_mode="r")
+
+    if meta["sparse"]:
+        X = sp.csr_matrix((load("X_data"), load("X_indices"), load("X_indptr")), shape=meta["shape"], copy=False)
+    else:
+        X = load("X")
+    return X, load("y")
+
+
+def prepare_search(X, y, array_dir, validation_ratio=SEARCH_VALIDATION_RATIO, seed=42):
+    """Separa fit/val (permutación fija) y guarda ambas partes en array_dir."""
+    os.makedirs(array_dir, exist_ok=True)
+    y = np.asarray(y, dtype=np.float64)
+    idx = np.random.default_rng(seed).permutation(X.shape[0])
+    n_val = max(1, int(len(idx) * validation_ratio))
+    val_idx, fit_idx = np.sort(idx[:n_val]), np.sort(idx[n_val:])
+    meta = {
+        "fit": _save(array_dir, "fit", X[fit_idx], y[fit_idx]),
+        "val": _save(array_dir, "val", X[val_idx], y[val_idx]),
+    }
+    with open(os.path.join(array_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def _fit_candidate(name, estimator, array_dir):
+    """Corre en el worker: entrena sobre "fit" y mide en "val"."""
+    result = {"name": name, "params": estimator.get_params()}
+    try:
+        X_fit, y_fit = load_part(array_dir, "fit")
+        X_val, y_val = load_part(array_dir, "val")
+        if needs_dense(estimator) and sp.issparse(X_fit):
+            X_fit, X_val = X_fit.toarray(), X_val.toarray()
+        start = time.perf_counter()
+        estimator.fit(X_fit, y_fit)
+        result["fit_seconds"] = time.perf_counter() - start
+        preds = estimator.predict(X_val)
+        mse = mean_squared_error(y_val, preds)
+        result["metrics"] = {
+            "val_mse": mse,
+            "val_rmse": mse ** 0.5,
+            "val_mae": mean_absolute_error(y_val, preds),
+            "val_r2": r2_score(y_val, preds),
+        }
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def run_search(cands, array_dir, workers=SEARCH_WORKERS):
+    """Evalúa los candidatos en paralelo; devuelve resultados ordenados por val_mae (fallidos al final)."""
+    with ProcessPoolExecutor(max_workers=min(workers, len(cands))) as pool:
+        futures = [pool.submit(_fit_candidate, name, clone(est), array_dir) for name, est in cands.items()]
+        results = [f.result() for f in futures]
+    return sorted(results, key=lambda r: r["metrics"]["val_mae"] if "metrics" in r else float("inf"))
+
+
+def pick_winner(results, cands):
+    """
+    Nombre del mejor candidato explicable según val_mae (results ordenados como run_search).
+    Si un árbol quedó mejor se avisa, pero no se registra.
+    """
+    ranked = [r["name"] for r in results if "metrics" in r]
+    winners = [n for n in ranked if explainable(cands[n])]
+    if not winners:
+        raise RuntimeError("Ningún candidato explicable pudo entrenarse")
+    if ranked[0] != winners[0]:
+        print(f"⚠️  {ranked[0]} tuvo mejor val_mae pero no es explicable; se registra {winners[0]}")
+    return winners[0]
@@ -0,0 +1,56 @@
+"""
+Regenera los ConfigMaps con el código de los DAGs a partir de k8s/dags/:
+
+    python k8s/airflow/render_dags_configmaps.py
+
+- k8s/airflow/airflow-dags-configmap-{1,2,3}.yaml (manifiestos de kubectl)
+- charts/airflow/templates/configmap-dags.yaml (chart de Helm)
+
+Los pods montan cada archivo con subPath, así que al agregar un módulo nuevo hay que
+sumarlo aquí y en los volumeMounts de airflow-unified.yaml y del chart.
+"""
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DAGS_DIR = os.path.join(ROOT, "k8s", "dags")
+
+K8S_CONFIGMAPS = {
+    "airflow-dags-1": ["data_pipeline.py", "bulk_load.py", "cleaning.py", "partitioning.py"],
+    "airflow-dags-2": ["modeling_pipeline.py", "model_search.py"],
+    "airflow-dags-3": ["production_pipeline.py"],
+}
+CHART_CONFIGMAP = "airflow-dags-mlops"
+
+
+def render(name, files):
+    lines = ["apiVersion: v1", "kind: ConfigMap", "metadata:", f"  name: {name}", "data:"]
+    for filename in files:
+        with open(os.path.join(DAGS_DIR, filename)) as f:
+            source = f.read()
+        if "{{" in source or "}}" in source:
+            # Helm interpretaría las llaves dobles como plantilla
+            raise ValueError(f"{filename} contiene '{{{{' o '}}}}'; no se puede incluir en el chart")
+        lines.append(f"  {filename}: |")
+        lines.extend(f"    {line}" if line.strip() else "" for line in source.rstrip("\n").split("\n"))
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    for i, (name, files) in enumerate(K8S_CONFIGMAPS.items(), start=1):
+        path = os.path.join(ROOT, "k8s", "airflow", f"airflow-dags-configmap-{i}.yaml")
+        with open(path, "w") as f:
+            f.write(render(name, files))
+        print(f"✅ {path}: {', '.join(files)}")
+    all_files = [f for files in K8S_CONFIGMAPS.values() for f in files]
+    path = os.path.join(ROOT, "charts", "airflow", "templates", "configmap-dags.yaml")
+    with open(path, "w") as f:
+        f.write(render(CHART_CONFIGMAP, all_files))
+    print(f"✅ {path}: {', '.join(all_files)}")
+
+    missing = sorted(set(f for f in os.listdir(DAGS_DIR) if f.endswith(".py")) - set(all_files))
+    if missing:
+        print(f"⚠️  Módulos en k8s/dags sin ConfigMap: {missing}")
+
+
+if __name__ == "__main__":
+    main()
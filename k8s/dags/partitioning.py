@@ -0,0 +1,220 @@
+"""
+Particionamiento declarativo por rango mensual para las tablas que crecen sin límite
+(raw_data_init y clean_data_init por load_date, inference_logs por requested_at).
+
+Se importa desde los DAGs (la carpeta dags está en el sys.path de Airflow):
+
+    from partitioning import ensure_partitioned_table, apply_retention
+
+- ensure_partitioned_table crea la tabla padre PARTITION BY RANGE. Si ya existe como
+  tabla normal (heap) la migra: se renombra a <tabla>_legacy y se adjunta como la
+  partición (MINVALUE, mes siguiente a su último registro). Después crea las
+  particiones mensuales hasta PARTITION_MONTHS_AHEAD meses adelante, más una partición
+  DEFAULT (<tabla>_default) para que un insert nunca falle por un mes sin crear (p. ej.
+  el DAG estuvo pausado más de PARTITION_MONTHS_AHEAD meses; FastAPI escribe directo en
+  inference_logs). Cuando después se crea ese mes, sus filas salen del DEFAULT.
+- apply_retention quita las particiones cuyo rango terminó hace más de N meses:
+  DETACH (quedan como tablas independientes, archivadas) o DROP, según
+  PARTITION_RETENTION_ACTION. No hay DELETE fila por fila.
+
+Las consultas con filtro sobre la llave de partición (p. ej. load_date > watermark)
+solo tocan las particiones recientes (partition pruning).
+"""
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+PARTITION_MONTHS_AHEAD     = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+PARTITION_RETENTION_ACTION = os.getenv("PARTITION_RETENTION_ACTION", "detach")   # detach | drop
+
+RETENTION_ACTIONS = ("detach", "drop")
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(dt, n):
+    month = dt.month - 1 + n
+    return datetime(dt.year + month // 12, month % 12 + 1, 1)
+
+
+def _parse_bound(value):
+    value = value.strip()
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def relkind(conn, schema, table):
+    """'p' particionada, 'r' tabla normal, None si no existe."""
+    return conn.execute(
+        text("""
+            SELECT c.relkind FROM pg_class c
+              JOIN pg_namespace n ON n.oid = c.relnamespace
+             WHERE n.nspname = :schema AND c.relname = :table
+        """),
+        {"schema": schema, "table": table},
+    ).scalar()
+
+
+def list_partitions(conn, schema, table):
+    """[(nombre, desde, hasta)] de las particiones; None representa MINVALUE/MAXVALUE."""
+    rows = conn.execute(
+        text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+              FROM pg_inherits i
+              JOIN pg_class c ON c.oid = i.inhrelid
+              JOIN pg_class p ON p.oid = i.inhparent
+              JOIN pg_namespace n ON n.oid = p.relnamespace
+             WHERE n.nspname = :schema AND p.relname = :table
+        """),
+        {"schema": schema, "table": table},
+    ).fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound or "")
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda p: p[2] or datetime.max)
+
+
+def _create_month(conn, schema, table, key, month):
+    """
+    Crea la partición del mes. Si la DEFAULT tiene filas de ese mes (Postgres no deja
+    crear la partición en ese caso) se crea aparte, se le mueven esas filas y se adjunta.
+    """
+    name, default = f"{table}_p{month:%Y%m}", f"{table}_default"
+    bounds = {"lower": month, "upper": add_months(month, 1)}
+    pending = relkind(conn, schema, default) and conn.execute(
+        text(f"SELECT 1 FROM {schema}.{default} WHERE {key} >= :lower AND {key} < :upper LIMIT 1"), bounds
+    ).scalar()
+    if not pending:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.{name}
+                PARTITION OF {schema}.{table}
+                FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{bounds["upper"]:%Y-%m-%d}')
+        """))
+        return name
+    conn.execute(text(f"CREATE TABLE {schema}.{name} (LIKE {schema}.{table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {schema}.{default} WHERE {key} >= :lower AND {key} < :upper RETURNING *
+        )
+        INSERT INTO {schema}.{name} SELECT * FROM moved
+    """), bounds).rowcount
+    conn.execute(text(f"""
+        ALTER TABLE {schema}.{table} ATTACH PARTITION {schema}.{name}
+            FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{bounds["upper"]:%Y-%m-%d}')
+    """))
+    print(f"✅ {schema}.{name}: {moved} filas movidas desde {default}")
+    return name
+
+
+def ensure_partitions(conn, schema, table, key, months_ahead=PARTITION_MONTHS_AHEAD, now=None):
+    """
+    Crea las particiones mensuales faltantes desde el mes actual hasta months_ahead, las
+    de los meses que quedaron en la DEFAULT y, si no existe, la DEFAULT.
+    """
+    current = month_start(now or datetime.utcnow())
+    default = f"{table}_default"
+    uppers = [upper for _, _, upper in list_partitions(conn, schema, table) if upper is not None]
+    start = max([current] + uppers)
+    months = []
+    month = start
+    while month <= add_months(current, months_ahead):
+        months.append(month)
+        month = add_months(month, 1)
+    if relkind(conn, schema, default):
+        stranded = conn.execute(
+            text(f"SELECT DISTINCT date_trunc('month', {key}) FROM {schema}.{default} WHERE {key} IS NOT NULL")
+        ).scalars()
+        months = sorted(set(months) | {month_start(m) for m in stranded})
+    created = [_create_month(conn, schema, table, key, month) for month in months]
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {schema}.{default} PARTITION OF {schema}.{table} DEFAULT"))
+    return created
+
+
+def _migrate_heap(conn, schema, table, columns_ddl, key, serial_columns):
+    """Convierte una tabla normal existente en la partición <tabla>_legacy de una tabla nueva."""
+    legacy = f"{table}_legacy"
+    conn.execute(text(f"ALTER TABLE {schema}.{table} RENAME TO {legacy}"))
+    # La PK de la tabla padre (que incluye la llave de partición) reemplaza a la de la tabla vieja
+    pkey = conn.execute(
+        text("SELECT conname FROM pg_constraint WHERE conrelid = CAST(:rel AS regclass) AND contype = 'p'"),
+        {"rel": f"{schema}.{legacy}"},
+    ).scalar()
+    if pkey:
+        conn.execute(text(f"ALTER TABLE {schema}.{legacy} DROP CONSTRAINT {pkey}"))
+    # Los índices conservan su nombre; se renombran para no chocar con los de la tabla padre
+    for (index,) in conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE schemaname = :schema AND tablename = :table"),
+        {"schema": schema, "table": legacy},
+    ).fetchall():
+        conn.execute(text(f"ALTER INDEX {schema}.{index} RENAME TO {index[:56]}_legacy"))
+
+    conn.execute(text(f"CREATE TABLE {schema}.{table} ({columns_ddl}) PARTITION BY RANGE ({key})"))
+    max_key = conn.execute(text(f"SELECT MAX({key}) FROM {schema}.{legacy}")).scalar()
+    if max_key is None:
+        conn.execute(text(f"DROP TABLE {schema}.{legacy}"))
+        return
+    upper = add_months(month_start(max_key), 1)
+    conn.execute(text(f"""
+        ALTER TABLE {schema}.{table} ATTACH PARTITION {schema}.{legacy}
+            FOR VALUES FROM (MINVALUE) TO ('{upper:%Y-%m-%d}')
+    """))
+    # Las columnas SERIAL de la tabla nueva siguen numerando después de las existentes
+    for col in serial_columns:
+        conn.execute(text(f"""
+            SELECT setval(pg_get_serial_sequence('{schema}.{table}', '{col}'), MAX({col}))
+              FROM {schema}.{legacy}
+            HAVING MAX({col}) IS NOT NULL
+        """))
+    print(f"✅ {schema}.{table} migrada a tabla particionada; datos previos en {legacy} (hasta {upper:%Y-%m-%d})")
+
+
+def ensure_partitioned_table(conn, schema, table, columns_ddl, key, indexes=(), serial_columns=()):
+    """
+    Crea (o migra) {schema}.{table} particionada por rango mensual de `key`, con sus
+    índices (sentencias CREATE INDEX IF NOT EXISTS sobre la tabla padre, que Postgres
+    replica en cada partición) y las particiones futuras.
+    Devuelve "created", "migrated" o "exists".
+    """
+    kind = relkind(conn, schema, table)
+    if kind is None:
+        conn.execute(text(f"CREATE TABLE {schema}.{table} ({columns_ddl}) PARTITION BY RANGE ({key})"))
+        status = "created"
+    elif kind == "r":
+        _migrate_heap(conn, schema, table, columns_ddl, key, serial_columns)
+        status = "migrated"
+    else:
+        status = "exists"
+    for ddl in indexes:
+        conn.execute(text(ddl))
+    ensure_partitions(conn, schema, table, key)
+    return status
+
+
+def apply_retention(conn, schema, table, retention_months, action=PARTITION_RETENTION_ACTION, now=None):
+    """
+    DETACH/DROP de las particiones que terminan antes de (mes actual - retention_months).
+    retention_months <= 0 desactiva la retención. Devuelve el corte aplicado (o None).
+    """
+    if retention_months <= 0:
+        return None
+    if action not in RETENTION_ACTIONS:
+        raise ValueError(f"PARTITION_RETENTION_ACTION inválida: {action} (opciones: {RETENTION_ACTIONS})")
+    cutoff = add_months(month_start(now or datetime.utcnow()), -retention_months)
+    for name, _, upper in list_partitions(conn, schema, table):
+        if upper is None or upper > cutoff:
+            continue
+        if action == "drop":
+            conn.execute(text(f"DROP TABLE {schema}.{name}"))
+        else:
+            conn.execute(text(f"ALTER TABLE {schema}.{table} DETACH PARTITION {schema}.{name}"))
+        print(f"🗑️  Retención {schema}.{table}: partición {name} ({action}, hasta {upper:%Y-%m-%d})")
+    return cutoff
@@ -209,21 +209,24 @@ with tab3:
         )
         selected_run = shap_df_for_select.loc[idx_selected, "run_id"]
         try:
-            shap_resp = requests.get(f"{API_URL}/shap/{selected_run}", timeout=60)
-            if shap_resp.status_code == 200:
+            # El API resume y muestrea del lado del servidor; no se descarga el artifact completo
+            summary_resp = requests.get(f"{API_URL}/shap/{selected_run}", params={"mode": "summary"}, timeout=60)
+            shap_resp = requests.get(f"{API_URL}/shap/{selected_run}", params={"mode": "sample", "n": 1000, "seed": 42}, timeout=60)
+            if summary_resp.status_code == 200 and shap_resp.status_code == 200:
+                summary = summary_resp.json()
                 shap_data = shap_resp.json()['shap_values']
                 shap_df = pd.DataFrame.from_dict(shap_data)
 
                 st.markdown("#### Importancia media absoluta de cada variable")
-                mean_abs = shap_df.abs().mean().sort_values(ascending=False)
+                mean_abs = pd.Series(
+                    {f["feature"]: f["mean_abs"] for f in summary["features"]}
+                ).sort_values(ascending=False)
                 st.bar_chart(mean_abs)
                 st.dataframe(mean_abs.to_frame("Importancia SHAP").head(10))
 
                 st.markdown("#### Summary Plot de SHAP (beeswarm)")
                 with st.spinner("Generando summary plot..."):
                     sample = shap_df
-                    if len(shap_df) > 1000:
-                        sample = shap_df.sample(1000, random_state=42)
                     plt.figure(figsize=(10,6))
                     shap.summary_plot(sample.values, features=sample.columns, show=False)
                     buf = io.BytesIO()
@@ -232,8 +235,8 @@ with tab3:
                     st.image(buf.getvalue(), caption="SHAP summary plot (beeswarm)", use_container_width=True)
 
                 st.markdown("#### Boxplot interactivo de SHAP para muestra aleatoria")
-                if len(shap_df) > 1000:
-                    sample = shap_df.sample(500, random_state=42)
+                if summary["n_rows"] > 1000:
+                    sample = shap_df.sample(min(500, len(shap_df)), random_state=42)
                 else:
                     sample = shap_df
                 st.write(px.box(sample, points="outliers", title="Distribución SHAP (muestra aleatoria)"))
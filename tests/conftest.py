@@ -0,0 +1,34 @@
+"""
+Pruebas del repo. Se corren desde la raíz con `python -m pytest tests`.
+
+- Los módulos de dags/ se importan por nombre (como en Airflow) y los de la API como
+  `app.*` (como en la imagen de FastAPI).
+- Las pruebas contra Postgres usan TEST_PG_URI (una base desechable en UTF8: se borran y crean
+  los esquemas raw_data/clean_data); sin esa variable se omiten.
+- Las que importan un DAG completo se omiten si Airflow no está instalado, y las de la
+  API si faltan sus dependencias (se corren con el entorno de cada imagen).
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, "dags"), os.path.join(ROOT, "FastAPI")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+TEST_PG_URI = os.getenv("TEST_PG_URI")
+
+
+@pytest.fixture
+def pg_engine():
+    if not TEST_PG_URI:
+        pytest.skip("TEST_PG_URI no está definida")
+    from sqlalchemy import create_engine, text
+    engine = create_engine(TEST_PG_URI)
+    with engine.begin() as conn:
+        for schema in ("raw_data", "clean_data"):
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}"))
+    yield engine
+    engine.dispose()
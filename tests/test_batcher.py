@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+pytest.importorskip("mlflow")
+pytest.importorskip("prometheus_client")
+os.environ.setdefault("MLFLOW_TRACKING_URI", os.path.join(tempfile.gettempdir(), "mlruns-tests"))
+from fastapi import HTTPException  # noqa: E402
+from app import main  # noqa: E402
+from app.batcher import MicroBatcher  # noqa: E402
+
+HANDLE = main.ModelHandle(model=None, run_id="abc123", version=1, features=None)
+
+
+@pytest.fixture
+def batcher(monkeypatch):
+    created = []
+
+    def make(score_fn, **kwargs):
+        b = MicroBatcher(score_fn, max_wait_us=100, **kwargs)
+        b.start()
+        created.append(b)
+        monkeypatch.setattr(main, "micro_batcher", b)
+        return b
+    yield make
+    for b in created:
+        b.stop()
+
+
+def test_scores_through_batcher(batcher):
+    batcher(lambda handle, records: [(float(r["bed"]), None) for r in records])
+    assert main.predict_one(HANDLE, {"bed": 3}) == 3.0
+
+
+def test_score_fn_error_is_500(batcher):
+    def broken(handle, records):
+        raise MemoryError("sin memoria")
+    batcher(broken)
+    with pytest.raises(HTTPException) as exc:
+        main.predict_one(HANDLE, {"bed": 3})
+    assert exc.value.status_code == 500
+    assert "sin memoria" in exc.value.detail
+
+
+def test_timeout_is_503_and_abandoned_record_is_skipped(batcher):
+    release, scored = threading.Event(), []
+
+    def slow(handle, records):
+        scored.extend(records)
+        release.wait(5)
+        return [(1.0, None)] * len(records)
+    b = batcher(slow, timeout=0.2, max_batch_size=1)
+
+    def submit_first():
+        with pytest.raises(TimeoutError):   # también espera más que timeout
+            b.submit(HANDLE, {"id": 1})
+    first = threading.Thread(target=submit_first)
+    first.start()
+    with pytest.raises(HTTPException) as exc:
+        main.predict_one(HANDLE, {"id": 2})   # queda en cola detrás del primero
+    assert exc.value.status_code == 503
+    release.set()
+    first.join(5)
+    b.stop()
+    assert scored == [{"id": 1}]
+
+
+def test_compiled_scorer_bypasses_batcher(batcher):
+    batcher(lambda handle, records: pytest.fail("no debía usarse el micro-batcher"))
+
+    class Scorer:
+        def predict_one(self, record):
+            return 42.0
+    assert main.predict_one(HANDLE._replace(scorer=Scorer()), {"bed": 3}) == 42.0
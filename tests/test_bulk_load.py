@@ -0,0 +1,73 @@
+import math
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+from psycopg2.extras import execute_values
+from sqlalchemy import text
+
+from bulk_load import copy_dataframe, copy_records
+
+COLUMNS = ["id", "street", "zip_code", "price", "bed", "prev_sold_date", "load_date"]
+
+ROWS = [
+    (1, "123 main st", "110111", 250000.5, 3, date(2020, 1, 1), datetime(2024, 5, 1, 10, 30)),
+    (2, None, None, None, None, None, datetime(2024, 5, 1, 10, 30)),
+    (3, "", "", 0.0, 0, date(1999, 12, 31), datetime(2024, 5, 1)),
+    (4, 'calle "5", apto 3', "11-01", 1e-3, 2, date(2021, 6, 15), datetime(2024, 5, 2)),
+    (5, "línea 1\nlínea 2\r\n", " 9 ", float("nan"), 1, date(2022, 2, 28), datetime(2024, 5, 2)),
+    (6, "  ,,,  ", "\\", 123456789.125, 4, date(2023, 1, 1), datetime(2024, 5, 3)),
+]
+
+
+def _create(conn, name):
+    conn.execute(text(f"""
+        CREATE TABLE raw_data.{name} (
+            id INT, street TEXT, zip_code TEXT, price NUMERIC, bed INT,
+            prev_sold_date DATE, load_date TIMESTAMP
+        )
+    """))
+
+
+def _load(engine, name, fn):
+    raw_conn = engine.raw_connection()
+    try:
+        cur = raw_conn.cursor()
+        fn(cur, f"raw_data.{name}")
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+
+def _fetch(engine, name):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT {', '.join(COLUMNS)} FROM raw_data.{name} ORDER BY id")).fetchall()
+
+
+def _insert_values(cur, table):
+    # Camino anterior a COPY: NaN → NULL a mano, como hacía el DAG antes de insertar
+    rows = [tuple(None if isinstance(v, float) and math.isnan(v) else v for v in r) for r in ROWS]
+    execute_values(cur, f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES %s", rows, page_size=1500)
+
+
+@pytest.mark.parametrize("chunk_rows", [2, 50000])
+def test_copy_matches_execute_values(pg_engine, chunk_rows):
+    with pg_engine.begin() as conn:
+        for name in ("by_values", "by_frame", "by_records"):
+            _create(conn, name)
+
+    # Con faltantes pandas guarda los enteros como float ("3.0", que COPY no acepta en INT)
+    frame = pd.DataFrame(ROWS, columns=COLUMNS).astype({"bed": "Int64"})
+    _load(pg_engine, "by_values", _insert_values)
+    _load(pg_engine, "by_frame", lambda cur, t: copy_dataframe(cur, t, frame, chunk_rows=chunk_rows))
+    _load(pg_engine, "by_records", lambda cur, t: copy_records(cur, t, COLUMNS, ROWS, chunk_rows=chunk_rows))
+
+    expected = _fetch(pg_engine, "by_values")
+    assert len(expected) == len(ROWS)
+    assert _fetch(pg_engine, "by_frame") == expected
+    assert _fetch(pg_engine, "by_records") == expected
+
+    by_id = {r[0]: r for r in expected}
+    assert by_id[2][1:6] == (None, None, None, None, None)   # None/NaN → NULL
+    assert by_id[3][1:3] == ("", "")                          # '' sigue siendo ''
+    assert by_id[5][3] is None
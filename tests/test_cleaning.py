@@ -0,0 +1,133 @@
+import os
+import random
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import cleaning
+from cleaning import clean_frame, clean_record
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EDGE_VALUES = [
+    None, float("nan"), "", " ", "  123 Main St  ", "MAIN\tST\n", "\x1cCalle\x1f", " Bogotá ",
+    "ÁLVARO", "Straße", "İSTANBUL", "ǅemal", "ﬁeld", "Ω", "for_sale", "SOLD ", "n/a", "ZIP 11-01",
+    "١٢٣ (árabe)", "00501", 110111, 110111.0, 3.5, True,
+]
+
+
+def _frame(n, seed=0):
+    rng = random.Random(seed)
+    columns = ["street", "city", "state", "status", "zip_code"]
+    return pd.DataFrame({c: [rng.choice(EDGE_VALUES) for _ in range(n)] for c in columns + ["price"]})
+
+
+def _text_only(df):
+    # Columnas que llegan como texto desde Postgres: strings o faltantes
+    return df.map(lambda v: v if v is None or isinstance(v, str) else None)
+
+
+@pytest.mark.parametrize("arrow", [True, False])
+@pytest.mark.parametrize("text_only", [True, False])
+def test_frame_matches_record(monkeypatch, arrow, text_only):
+    if not arrow:
+        monkeypatch.setattr(cleaning, "pa", None)
+    df = _frame(5000)
+    if text_only:
+        df = _text_only(df)
+    got = clean_frame(df).to_dict("records")
+    expected = [clean_record(r) for r in df.to_dict("records")]
+    assert got == expected
+
+
+def test_shared_module_is_identical():
+    with open(os.path.join(ROOT, "dags", "cleaning.py")) as a, open(os.path.join(ROOT, "FastAPI", "app", "cleaning.py")) as b:
+        assert a.read() == b.read()
+
+
+def _old_inline_clean(df):
+    """Limpieza que hacía transform_and_load_clean antes de cleaning.py."""
+    for c in ["street", "city", "state", "status"]:
+        df[c] = df[c].astype(str).str.strip().str.lower()
+    df["zip_code"] = df["zip_code"].astype(str).str.replace(r"\D+", "", regex=True)
+    return df[
+        (df["price"] >= 0) &
+        (df["house_size"] >= 0) &
+        (df["acre_lot"] >= 0) &
+        (pd.to_datetime(df["prev_sold_date"], errors="coerce") <= df["load_date"])
+    ].copy()
+
+
+def _raw_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    texts = ["  123 Main St  ", "MAIN\tST", "Calle 5 # 10-20, Apto 3", " Bogotá ", "ÁLVARO", "Straße",
+             "İSTANBUL", 'dicen "casa"', "línea 1\nlínea 2", "", None]
+    zips = ["110111", " 00501 ", "ZIP 11-01", "n/a", "", None]
+    rows = []
+    for i in range(n):
+        rows.append((
+            float(rng.integers(1, 1000)), rng.choice(["for_sale", " SOLD", "ready_to_build", None]),
+            float(rng.choice([-1, 0, 250000, 1234567.5])), None if i % 7 == 0 else float(rng.integers(1, 6)),
+            None if i % 11 == 0 else float(rng.integers(1, 4)), float(rng.choice([-0.5, 0, 0.25, 3])),
+            rng.choice(texts), rng.choice(texts), rng.choice(texts), rng.choice(zips),
+            float(rng.choice([-10, 0, 1800])), rng.choice([date(2020, 1, 1), date(2030, 1, 1), None]),
+            datetime(2024, 5, 1, 12, 0),
+        ))
+    return rows
+
+
+def test_copy_path_matches_old_insert_path(pg_engine):
+    """
+    raw → clean con el camino nuevo (cursor + clean_frame + COPY) y con el anterior
+    (read_sql_query + limpieza inline + execute_values) dan las mismas filas.
+    """
+    pytest.importorskip("airflow.operators.python")
+    import data_pipeline as dp
+    from bulk_load import copy_dataframe, copy_records
+    from psycopg2.extras import execute_values
+
+    cols = dp.RAW_COLUMNS
+    with pg_engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE raw_data.src ({dp._DATA_COLUMNS_DDL})"))
+        for name in ("by_copy", "by_values"):
+            conn.execute(text(f"CREATE TABLE clean_data.{name} ({dp.CLEAN_TABLE_DDL})"))
+
+    raw_conn = pg_engine.raw_connection()
+    try:
+        cur = raw_conn.cursor()
+        copy_records(cur, "raw_data.src", cols, _raw_rows(3000))
+        raw_conn.commit()
+
+        # Camino nuevo: como transform_and_load_clean hoy
+        cur.execute(f"SELECT {', '.join(cols)} FROM raw_data.src")
+        chunk = pd.DataFrame.from_records(cur.fetchall(), columns=cols, coerce_float=True)
+        new = dp._clean_chunk(chunk)
+        copy_dataframe(cur, "clean_data.by_copy", new)
+
+        # Camino anterior (el split aleatorio se reemplaza por el determinístico para comparar)
+        old = _old_inline_clean(pd.read_sql_query(f"SELECT {', '.join(cols)} FROM raw_data.src", con=raw_conn))
+        old["split"] = dp._assign_split(old)
+        execute_values(cur, f"INSERT INTO clean_data.by_values ({','.join(old.columns)}) VALUES %s",
+                       [tuple(r) for r in old.itertuples(index=False, name=None)], page_size=1500)
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+    order = ", ".join(cols + ["split"])
+    with pg_engine.connect() as conn:
+        by_copy = conn.execute(text(f"SELECT {order} FROM clean_data.by_copy ORDER BY {order}")).fetchall()
+        # execute_values mandaba los NaN de pandas como 'NaN'::float (NUMERIC NaN); COPY los carga como NULL
+        by_values = conn.execute(text(f"""
+            SELECT * FROM (
+                SELECT {', '.join(f"NULLIF({c}, 'NaN') AS {c}" if c in dp.NUMERIC_COLUMNS else c for c in cols)}, split
+                  FROM clean_data.by_values
+            ) v ORDER BY {order}
+        """)).fetchall()
+        nan_rows = conn.execute(text("SELECT count(*) FROM clean_data.by_values WHERE bed = 'NaN'")).scalar()
+
+    assert 0 < len(by_copy) < 3000
+    assert by_copy == by_values
+    assert nan_rows > 0
@@ -0,0 +1,68 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("prometheus_client")   # dependencias de la imagen de FastAPI
+from app.log_sink import InferenceLogSink, LOG_COLUMNS  # noqa: E402
+
+
+def _record(i):
+    return {
+        "requested_at": datetime(2025, 5, 1).isoformat(), "model_name": "my_model", "model_version": 1,
+        "run_id": "abc", "input_data": json.dumps({"i": i}), "prediction": json.dumps({"prediction": 1.0}),
+    }
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_replay_skips_truncated_lines(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    good = [_record(i) for i in range(3)]
+    lines = [json.dumps(r) for r in good]
+    # Línea truncada a mitad (apagado durante el spill) y una sin las columnas esperadas
+    spill.write_text("\n".join(lines[:2] + [lines[2][:20], json.dumps({"x": 1}), lines[2]]) + "\n")
+
+    written = []
+    sink = InferenceLogSink(writer=written.extend, overflow_policy="spill", spill_path=str(spill),
+                            flush_interval=0.05, batch_size=10)
+    sink.start()
+    try:
+        assert _wait_for(lambda: len(written) == 3)
+        assert sink._thread.is_alive()
+        assert not (tmp_path / "spill.jsonl.replay").exists()
+        assert len((tmp_path / "spill.jsonl.bad").read_text().splitlines()) == 2
+
+        # El hilo sigue vivo y vuelca lo que llega después
+        sink.put(_record(99))
+        assert _wait_for(lambda: len(written) == 4)
+    finally:
+        sink.stop()
+    assert [json.loads(r["input_data"])["i"] for r in written] == [0, 1, 2, 99]
+    assert all(set(LOG_COLUMNS) <= set(r) for r in written)
+
+
+def test_worker_survives_unexpected_errors(tmp_path):
+    sink = InferenceLogSink(writer=lambda batch: None, overflow_policy="spill",
+                            spill_path=str(tmp_path / "spill.jsonl"), flush_interval=0.05)
+    calls = []
+
+    def broken_replay():
+        calls.append(1)
+        raise OSError("disco lleno")
+
+    sink._replay_spill = broken_replay
+    sink.start()
+    try:
+        assert _wait_for(lambda: len(calls) >= 2)
+        assert sink._thread.is_alive()
+    finally:
+        sink.stop()
@@ -0,0 +1,58 @@
+import os
+import math
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("mlflow")
+pytest.importorskip("prometheus_client")
+# Sin servidor de MLflow el cliente usaría ./mlruns; el registro se reemplaza en cada prueba
+os.environ.setdefault("MLFLOW_TRACKING_URI", os.path.join(tempfile.gettempdir(), "mlruns-tests"))
+from app import main  # noqa: E402
+
+
+class _Registry:
+    def __init__(self, versions):
+        self.versions = versions
+
+    def get_latest_versions(self, name, stages):
+        if isinstance(self.versions, Exception):
+            raise self.versions
+        return self.versions
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(main, "_last_registry_check", None)
+    monkeypatch.setattr(main, "active_model", None)
+
+    def use(versions):
+        monkeypatch.setattr(main, "client", _Registry(versions))
+    return use
+
+
+def staleness():
+    return main.MODEL_STALENESS.collect()[0].samples[0].value
+
+
+def test_staleness_is_infinite_until_first_successful_check(registry):
+    assert math.isinf(staleness())
+
+    registry(ConnectionError("MLflow caído"))
+    with pytest.raises(ConnectionError):
+        main.refresh_production_model()
+    registry([])
+    with pytest.raises(RuntimeError):
+        main.refresh_production_model()
+    assert math.isinf(staleness())
+
+
+def test_staleness_resets_after_successful_check(registry, monkeypatch):
+    # El modelo ya está en memoria: la verificación no descarga nada
+    handle = main.ModelHandle(model=None, run_id="abc123", version=3, features=None)
+    monkeypatch.setattr(main, "active_model", handle)
+    registry([SimpleNamespace(run_id="abc123", version="3")])
+
+    assert main.refresh_production_model() is handle
+    assert 0 <= staleness() < 5
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from model_search import BASELINE, candidates, explainable, pick_winner, prepare_search, run_search
+
+
+def test_default_grid_is_explainable():
+    cands = candidates("")
+    assert BASELINE in cands
+    assert all(explainable(est) for est in cands.values())
+    assert set(candidates("hgb_gamma")) == {BASELINE, "hgb_gamma"}
+    with pytest.raises(ValueError):
+        candidates("no_existe")
+
+
+def test_tree_never_wins(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 3))
+    # Relación no lineal: el árbol le gana al GLM en val_mae
+    y = np.exp(1 + np.sin(3 * X[:, 0]) + (X[:, 1] > 0)) * rng.gamma(20, 1 / 20, 2000)
+    cands = candidates(f"{BASELINE},hgb_gamma")
+    prepare_search(X, y, str(tmp_path))
+    results = run_search(cands, str(tmp_path), workers=2)
+
+    assert results[0]["name"] == "hgb_gamma"
+    assert pick_winner(results, cands) == BASELINE
+
+
+def test_no_explainable_candidate():
+    cands = candidates("hgb_gamma")
+    results = [{"name": "hgb_gamma", "metrics": {"val_mae": 1.0}}, {"name": BASELINE, "error": "ValueError: x"}]
+    with pytest.raises(RuntimeError):
+        pick_winner(results, cands)
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+from partitioning import add_months, apply_retention, ensure_partitioned_table, ensure_partitions, list_partitions, month_start
+
+DDL = """
+    id             SERIAL,
+    requested_at   TIMESTAMP NOT NULL,
+    payload        TEXT,
+    PRIMARY KEY (id, requested_at)
+"""
+
+
+def _counts(conn):
+    return dict(conn.execute(text(
+        "SELECT tableoid::regclass::text, count(*) FROM raw_data.logs GROUP BY 1"
+    )).fetchall())
+
+
+def test_default_partition_catches_uncreated_months(pg_engine):
+    current = month_start(datetime.utcnow())
+    far = add_months(current, 6)          # más allá de PARTITION_MONTHS_AHEAD
+    past_gap = add_months(current, -3)    # mes anterior a la primera partición
+    with pg_engine.begin() as conn:
+        assert ensure_partitioned_table(conn, "raw_data", "logs", DDL, "requested_at") == "created"
+        # Sin la DEFAULT estos inserts fallarían con "no partition of relation found"
+        conn.execute(text("INSERT INTO raw_data.logs (requested_at, payload) VALUES (:a, 'a'), (:b, 'b'), (:c, 'c')"),
+                     {"a": far, "b": far, "c": past_gap})
+        assert _counts(conn) == {"raw_data.logs_default": 3}
+
+    with pg_engine.begin() as conn:
+        # El DAG vuelve a correr en el mes `far`: crea ese mes y el que quedó atrás, y vacía la DEFAULT
+        created = ensure_partitions(conn, "raw_data", "logs", "requested_at", now=far)
+        assert f"logs_p{far:%Y%m}" in created and f"logs_p{past_gap:%Y%m}" in created
+        assert _counts(conn) == {f"raw_data.logs_p{far:%Y%m}": 2, f"raw_data.logs_p{past_gap:%Y%m}": 1}
+        # La PK de la tabla padre también aplica a las particiones adjuntadas
+        indexes = conn.execute(text(
+            "SELECT count(*) FROM pg_indexes WHERE schemaname = 'raw_data' AND tablename = :t"
+        ), {"t": f"logs_p{far:%Y%m}"}).scalar()
+        assert indexes == 1
+
+        # La retención no toca la DEFAULT (no tiene rango)
+        apply_retention(conn, "raw_data", "logs", 1, action="drop", now=add_months(far, 1))
+        names = {name for name, _, _ in list_partitions(conn, "raw_data", "logs")}
+        assert f"logs_p{past_gap:%Y%m}" not in names
+        assert conn.execute(text("SELECT to_regclass('raw_data.logs_default')")).scalar() is not None
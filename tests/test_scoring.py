@@ -0,0 +1,108 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.linear_model import GammaRegressor, HuberRegressor, PoissonRegressor, Ridge, TweedieRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+pytest.importorskip("prometheus_client")   # dependencias de la imagen de FastAPI
+from app.cleaning import clean_record  # noqa: E402
+from app.scoring import CompiledLinearScorer, compile_pipeline  # noqa: E402
+
+CAT = ["status", "state"]
+NUM = ["bed", "bath", "acre_lot", "house_size"]
+FEATURES = CAT + NUM
+
+
+def houses(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "status": rng.choice(["for_sale", "sold", "ready_to_build"], n),
+        "state": rng.choice(["cundinamarca", "antioquia", "valle", "atlantico", "santander"], n),
+        "bed": rng.integers(1, 7, n).astype(float),
+        "bath": rng.integers(1, 5, n).astype(float),
+        "acre_lot": rng.gamma(2.0, 0.3, n),
+        "house_size": rng.normal(1800, 400, n).clip(300),
+    })
+    eta = 11.5 + 0.08 * df["bed"] + 0.05 * df["bath"] + 0.0003 * df["house_size"] \
+        + df["state"].map({"cundinamarca": 0.3, "antioquia": 0.1, "valle": 0.0, "atlantico": -0.1, "santander": 0.05})
+    y = rng.gamma(5.0, np.exp(eta) / 5.0)
+    return df, y
+
+
+def pipeline(reg, drop=None, **encoder):
+    preproc = ColumnTransformer([
+        ("cat", OneHotEncoder(handle_unknown="ignore", sparse=True, drop=drop, **encoder), CAT),
+        ("num", StandardScaler(), NUM),
+    ])
+    return Pipeline([("preproc", preproc), ("reg", reg)])
+
+
+def pandas_path(pipe, record):
+    """El camino de /predict sin scoring compilado."""
+    df = pd.DataFrame([record]).reindex(columns=FEATURES, fill_value=None)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return float(pipe.predict(df)[0])
+
+
+REGRESSORS = {
+    "gamma_log": lambda: GammaRegressor(alpha=1.0, max_iter=200),
+    "poisson_log": lambda: PoissonRegressor(alpha=0.01, max_iter=200),
+    "normal_identity": lambda: TweedieRegressor(power=0, link="identity", alpha=0.01, max_iter=200),
+    "tweedie_auto_log": lambda: TweedieRegressor(power=1.5, alpha=0.01, max_iter=200),
+    "ridge_identity": lambda: Ridge(alpha=1.0),
+}
+
+
+@pytest.fixture(scope="module")
+def data():
+    return houses(2000)
+
+
+@pytest.mark.parametrize("name", list(REGRESSORS))
+def test_compiled_matches_pipeline(data, name):
+    X, y = data
+    pipe = pipeline(REGRESSORS[name]()).fit(X, y)
+    scorer = compile_pipeline(pipe, FEATURES)
+    assert isinstance(scorer, CompiledLinearScorer)
+
+    records = houses(300, seed=1)[0].to_dict("records")
+    # Categorías no vistas en el entrenamiento, faltantes y columnas extra que el modelo no usa
+    records[0]["state"] = "Amazonas "
+    records[1]["status"] = None    # clean_record la deja como "none", una categoría no vista
+    records[2]["city"] = "bogota"
+    records[3]["bed"] = 3          # int en lugar de float
+    records = [clean_record(r) for r in records]
+    expected = np.array([pandas_path(pipe, r) for r in records])
+    got = np.array([scorer.predict_one(r) for r in records])
+    np.testing.assert_allclose(got, expected, rtol=1e-9, atol=0)
+
+
+def test_invalid_records_raise_for_pandas_fallback(data):
+    """Lo que el Pipeline rechaza, el scorer también (y /predict cae al camino pandas)."""
+    X, y = data
+    pipe = pipeline(GammaRegressor()).fit(X, y)
+    scorer = compile_pipeline(pipe, FEATURES)
+    record = clean_record(houses(1, seed=2)[0].to_dict("records")[0])
+    absent = {k: v for k, v in record.items() if k != "state"}
+    with pytest.raises(ValueError):
+        scorer.predict_one(absent)
+    with pytest.raises(Exception):
+        pandas_path(pipe, absent)
+    for bad in (None, "n/a", float("nan")):
+        with pytest.raises((TypeError, ValueError)):
+            scorer.predict_one({**record, "bath": bad})
+
+
+def test_unsupported_pipelines_are_not_compiled(data):
+    X, y = data
+    assert compile_pipeline(pipeline(GammaRegressor(), drop="first").fit(X, y)) is None
+    assert compile_pipeline(pipeline(GammaRegressor(), min_frequency=0.25).fit(X, y)) is None
+    assert compile_pipeline(pipeline(HistGradientBoostingRegressor(max_iter=5)).fit(X, y)) is None
+    # Lineal pero sin link conocido: coef_ solo no alcanza
+    assert compile_pipeline(pipeline(HuberRegressor()).fit(X, y)) is None
@@ -0,0 +1,65 @@
+import os
+import time
+import tempfile
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("mlflow")
+pytest.importorskip("prometheus_client")
+os.environ.setdefault("MLFLOW_TRACKING_URI", os.path.join(tempfile.gettempdir(), "mlruns-tests"))
+from fastapi.testclient import TestClient  # noqa: E402
+from app import main  # noqa: E402
+from app.shap_cache import SHAP_SPARSE_PATH, SHAP_SUMMARY_PATH, ShapArtifactCache  # noqa: E402
+
+SIZES = {SHAP_SPARSE_PATH: 100, SHAP_SUMMARY_PATH: 30}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ShapArtifactCache(cache_dir=str(tmp_path), max_disk_bytes=250)
+
+    def download(run_id, artifact_path, path):
+        content = b'{"n_rows": 0}' if artifact_path == SHAP_SUMMARY_PATH else b""
+        with open(path, "wb") as f:
+            f.write(content.ljust(SIZES[artifact_path]))
+    monkeypatch.setattr(cache, "_download", download)
+    return cache
+
+
+def _use(cache, run_id):
+    cache.get_path(run_id)
+    cache._precomputed_summary(run_id)
+    time.sleep(0.01)   # mtimes distintos para el LRU
+
+
+def test_summary_files_count_and_are_evicted_with_their_run(cache, tmp_path):
+    _use(cache, "run_a")
+    _use(cache, "run_b")
+    # 2 × (100 + 30) = 260 > 250: solo con los .npz (200) no se expulsaría nada
+    assert sorted(os.listdir(tmp_path)) == ["run_b.npz", "run_b.summary.json"]
+
+
+def test_latest_run_is_kept_even_over_the_limit(cache, tmp_path):
+    cache.max_disk_bytes = 50
+    _use(cache, "run_a")
+    assert sorted(os.listdir(tmp_path)) == ["run_a.npz", "run_a.summary.json"]
+
+
+def test_parquet_passthrough_resolves_the_path_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "run_a.parquet")
+    pd.DataFrame({"bed": [0.5, -0.25]}).to_parquet(path)
+    calls = []
+
+    class Cache:
+        def etag(self, run_id):
+            return "abc"
+
+        def get_path(self, run_id):
+            calls.append(run_id)
+            return path
+    monkeypatch.setattr(main, "shap_cache", Cache())
+
+    resp = TestClient(main.app).get("/shap/run_a", params={"format": "parquet"})
+    assert resp.status_code == 200
+    assert calls == ["run_a"]
@@ -0,0 +1,53 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("airflow.operators.python")   # la carpeta airflow/ del repo no cuenta
+import modeling_pipeline as mp  # noqa: E402
+
+CURRENT = "scheduled__2025-05-02T10:00:00+00:00"
+
+
+@pytest.fixture
+def shared_tmp(tmp_path, monkeypatch):
+    monkeypatch.setattr(mp, "SHARED_TMP", str(tmp_path))
+    monkeypatch.setattr(mp, "STAGING_DIR", str(tmp_path / "staging"))
+    (tmp_path / "snapshot").mkdir()
+    return tmp_path
+
+
+def _age(path, hours):
+    old = time.time() - hours * 3600
+    os.utime(path, (old, old))
+
+
+def test_prune_staging(shared_tmp):
+    current = mp._staging_dir(CURRENT)
+    finished = mp._staging_dir("manual__2025-05-01T09:00:00+00:00")
+    running = mp._staging_dir("scheduled__2025-05-02T09:00:00+00:00")
+    stale = mp._staging_dir("scheduled__2025-04-01T09:00:00+00:00")
+    legacy = shared_tmp / "scheduled__2025-03-01T09_00_00_00_00"
+    legacy.mkdir()
+    for path in (current, stale, legacy):
+        _age(path, 48)
+
+    active = {"scheduled__2025-05-02T09:00:00+00:00": True, "manual__2025-05-01T09:00:00+00:00": False}
+    removed = mp.prune_staging(CURRENT, ttl_hours=24, is_active=lambda run_id: active.get(run_id))
+
+    assert sorted(removed) == sorted([finished, stale, str(legacy)])
+    assert os.path.isdir(current) and os.path.isdir(running)
+    assert (shared_tmp / "snapshot").is_dir()
+
+
+def test_unknown_metadata_keeps_young_staging(shared_tmp):
+    young = mp._staging_dir("scheduled__2025-05-02T08:00:00+00:00")
+    assert mp.prune_staging(CURRENT, ttl_hours=24, is_active=lambda run_id: None) == []
+    assert os.path.isdir(young)
+
+
+def test_cleanup_runs_whatever_happened_upstream():
+    task = mp.dag.get_task("cleanup_staging")
+    assert task.trigger_rule == "all_done"
+    assert not task.downstream_list
+    assert task.upstream_task_ids == {"record_model_history"}
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import GammaRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+pytest.importorskip("airflow.operators.python")   # la carpeta airflow/ del repo no cuenta
+import modeling_pipeline as mp  # noqa: E402
+
+LOW_CARD = ["status", "state"]
+NUM_COLS = ["bed", "bath", "acre_lot", "house_size"]
+
+
+def _houses(n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        "status": rng.choice(["for_sale", "sold", "ready_to_build"], n),
+        "state": rng.choice(["cundinamarca", "antioquia", "valle", "bolivar"], n),
+        "bed": rng.integers(1, 7, n).astype(float),
+        "bath": rng.integers(1, 5, n).astype(float),
+        "acre_lot": rng.gamma(2.0, 0.3, n),
+        "house_size": rng.normal(1800, 500, n).clip(300),
+    })
+    eta = 12 + 0.15 * X["bed"] + 0.1 * X["bath"] + 0.0003 * X["house_size"] + (X["state"] == "antioquia") * 0.3
+    y = rng.gamma(5.0, np.exp(eta) / 5.0)
+    return X, pd.Series(y, name=mp.TARGET)
+
+
+def _chunks(X, y, size):
+    for start in range(0, len(X), size):
+        yield X.iloc[start:start + size], y.iloc[start:start + size]
+
+
+@pytest.mark.parametrize("alpha", [mp.GLM_ALPHA, 0.01])
+def test_streaming_fit_matches_in_memory(tmp_path, alpha):
+    X, y = _houses(20000)
+
+    preproc = ColumnTransformer([
+        ("cat", OneHotEncoder(handle_unknown="ignore", sparse=True), LOW_CARD),
+        ("num", StandardScaler(), NUM_COLS),
+    ], remainder="drop")
+    expected = Pipeline([
+        ("preproc", preproc),
+        ("reg", GammaRegressor(alpha=alpha, max_iter=mp.GLM_MAX_ITER, tol=mp.GLM_TOL)),
+    ]).fit(X, y)
+
+    scaler = StandardScaler()
+    for X_chunk, _ in _chunks(X, y, 3000):
+        scaler.partial_fit(X_chunk[NUM_COLS])
+    categories = {c: set(X[c]) for c in LOW_CARD}
+    stream_preproc = mp.build_streaming_preproc(LOW_CARD, categories, NUM_COLS, scaler)
+    reg, sum_x, n = mp.fit_gamma_streaming(stream_preproc, _chunks(X, y, 3000), str(tmp_path / "cache"), alpha=alpha)
+    got = Pipeline([("preproc", stream_preproc), ("reg", reg)])
+
+    assert n == len(X)
+    assert list(stream_preproc.get_feature_names_out()) == list(preproc.get_feature_names_out())
+    np.testing.assert_allclose(sum_x / n, np.asarray(preproc.transform(X).mean(axis=0)).ravel(), atol=1e-9)
+    np.testing.assert_allclose(reg.coef_, expected["reg"].coef_, rtol=1e-3, atol=1e-4)
+    assert reg.intercept_ == pytest.approx(expected["reg"].intercept_, rel=1e-5)
+    np.testing.assert_allclose(got.predict(X.head(500)), expected.predict(X.head(500)), rtol=1e-4)
+    assert not (tmp_path / "cache").exists()